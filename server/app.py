@@ -1,29 +1,33 @@
 # This is the main file for the server
 
 # Flask and related imports
-from flask import Flask, request, make_response, abort, session, jsonify, send_from_directory
-from flask_migrate import Migrate
-from flask_restful import Api, Resource
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import MetaData
-from werkzeug.exceptions import NotFound, Unauthorized
-from datetime import datetime
+from flask import Flask, current_app, request, make_response, abort, session
+from flask_restful import Resource
+from sqlalchemy import select, or_
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+from datetime import datetime, date
 import os
-from flask_bcrypt import Bcrypt
 
 # Local imports for database setup and ORM models
-from config import app, db, api, bcrypt
-from models import User, Sighting, Species, Friendship
-
-# Set up the upload folder (prepares the folder for storing uploaded files)
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'uploads')
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+from config import settings, init_extensions, db, api, cache, uploads
+from models import User, Sighting, Species, Friendship, SightingDailyCount
+from streaming import stream_json_array, STREAM_BATCH_SIZE
+from instrumentation import query_budget
+from search import search_users, DEFAULT_RESULTS
+from friends import mutual_friends, suggest_friends, DEFAULT_MUTUAL, MAX_MUTUAL, DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS
+from uploads import UploadError, variant_urls
+import export
+from clusters import find_clusters, MAX_ZOOM
+import stats
+from feed import feed_page, FEED_RULES, DEFAULT_PAGE_SIZE as FEED_PAGE_SIZE, MAX_PAGE_SIZE as FEED_MAX_PAGE_SIZE
+from geo import parse_bbox, haversine_km
+from conditional import conditional_json, row_etag, last_modified
+from bulk_import import import_sightings, import_sightings_command, CappedStream, FORMATS, FORMAT_BY_MIMETYPE
 
 # Views
 
 # Home route
-@app.route('/')
 def index():
     return '<h1>Project Server</h1>'
 
@@ -32,7 +36,7 @@ class Users(Resource):
     def post(self):
         try:
             data = request.form
-            print("Received signup data:", data)  # Debug log
+            current_app.logger.debug("Signup attempt for username %r", data.get("username"))
             
             if not data or 'username' not in data or 'password' not in data:
                 return make_response({"error": "Username and password are required"}, 400)
@@ -49,18 +53,16 @@ class Users(Resource):
             if existing_user:
                 return make_response({"error": "Username already exists"}, 409)
             
-            # Handle file
+            # Handle file (copied to disk in chunks, variants made in the background)
             file = request.files.get('profile_picture')
             profile_pic_path = None
             if file:
                 if file.filename == '':
                     return make_response({"error": "No selected file"}, 400)
-                
-                # Create a unique filename
-                file_ext = os.path.splitext(file.filename)[1]
-                filename = f"{username}{file_ext}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                profile_pic_path = f"/static/uploads/{filename}"
+                try:
+                    profile_pic_path = uploads.save(file.stream)
+                except UploadError as e:
+                    return make_response({"error": str(e)}, 400)
             
             new_user = User(
                 username=username,
@@ -81,10 +83,11 @@ class Users(Resource):
             )
             return response
         
+        except HTTPException:
+            # e.g. 413 for a profile picture over MAX_CONTENT_LENGTH
+            raise
         except Exception as e:
-            import traceback
-            print("Error in signup:", str(e))  # Debug log
-            print("Full traceback:", traceback.format_exc())  # Debug log
+            current_app.logger.exception("Signup failed")
             db.session.rollback()
             return make_response({"error": str(e)}, 500)
         
@@ -95,17 +98,20 @@ class Login(Resource):
     def post(self):
         try:
             data = request.get_json()
-            print("Received login data:", data)  # Debug log
+            # Never log the payload itself, it holds the password
+            current_app.logger.debug("Login attempt for username %r", data.get("username") if data else None)
             
             if not data or 'username' not in data or 'password' not in data:
                 return make_response({"error": "Username and password are required"}, 400)
             
-            user = User.query.filter_by(username=data.get("username")).first()
+            user = User.query.options(*User.serialize_options()).filter_by(username=data.get("username")).first()
             if not user:
                 return make_response({"error": "User not found"}, 404)
                 
             if not user.authenticate(data.get("password")):
                 return make_response({"error": "Invalid password"}, 401)
+            # authenticate() may have upgraded the hash to the current bcrypt cost
+            db.session.commit()
                 
             session["user_id"] = user.id
             response = make_response(
@@ -114,10 +120,11 @@ class Login(Resource):
             )
             return response
             
+        except HTTPException:
+            # e.g. 503 when the password pool is busy or times out
+            raise
         except Exception as e:
-            import traceback
-            print("Error in login:", str(e))  # Debug log
-            print("Full traceback:", traceback.format_exc())  # Debug log
+            current_app.logger.exception("Login failed")
             return make_response({"error": str(e)}, 500)
 
 api.add_resource(Login, "/login")
@@ -134,23 +141,45 @@ class Logout(Resource):
 api.add_resource(Logout, "/logout")
 
 # CheckSession route - GET checks if a user is logged in, returns the user's data if they are logged in
+# The user's row version makes it a conditional GET (see conditional.py)
 class CheckSession(Resource):
+    @query_budget(5)
     def get(self):
         user_id = session.get("user_id")
         if not user_id:
             return make_response({"user": None}, 200)
-            
-        user = User.query.filter_by(id=user_id).first()
-        if not user:
+
+        row = db.session.execute(select(User.version, User.updated_at).where(User.id == user_id)).first()
+        if not row:
             return make_response({"user": None}, 200)
-            
-        return make_response({"user": user.to_dict(rules=("-_password_hash",))}, 200)
+
+        # Loaded again in full unless the client's copy is current; it may have
+        # been deleted in between
+        def build():
+            user = db.session.get(User, user_id, options=User.serialize_options())
+            return {"user": user.to_dict(rules=("-_password_hash",)) if user else None}
+        return conditional_json(row_etag("session", user_id, row.version), row.updated_at, build)
 
 api.add_resource(CheckSession, "/check_session")
 
 # Sightings route - GET returns all sightings, POST creates a new sighting
 class Sightings(Resource):
+    # Largest page a client can ask for with ?limit=
+    MAX_PAGE_SIZE = 1000
+
+    @query_budget(5, per_batch=3)
     def get(self):
+        center = None
+
+        # Optional field projection, e.g. ?fields=id,latitude,longitude
+        fields = request.args.get('fields')
+        if fields:
+            fields = tuple(f.strip() for f in fields.split(',') if f.strip())
+            unknown = set(fields) - Sighting.public_fields()
+            if unknown:
+                abort(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+        query = Sighting.query.options(*Sighting.serialize_options(fields))
+
         # Check if location parameters are provided
         lat = request.args.get('lat')
         lng = request.args.get('lng')
@@ -161,19 +190,72 @@ class Sightings(Resource):
                 lat = float(lat)
                 lng = float(lng)
                 radius = float(radius)
-                
-                # Query sightings within the specified radius
-                sightings = Sighting.query.filter(
-                    Sighting.latitude.between(lat - radius/111, lat + radius/111),
-                    Sighting.longitude.between(lng - radius/111, lng + radius/111)
-                ).all()
             except (ValueError, TypeError):
                 abort(400, "Invalid latitude, longitude, or radius parameters")
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180 and radius >= 0):
+                abort(400, "Invalid latitude, longitude, or radius parameters")
+
+            # Narrow down with the geohash index; the exact distance check happens while streaming
+            query = query.filter(Sighting.near(lat, lng, radius))
+            center = (lat, lng)
+
+        # Keyset pagination: ?after_id=<last id seen>&limit=<page size>
+        # Rows are always in a stable (observed_on, id) order
+        try:
+            limit = int(request.args['limit']) if 'limit' in request.args else None
+            after_id = int(request.args['after_id']) if 'after_id' in request.args else None
+        except ValueError:
+            abort(400, "Invalid limit or after_id parameters")
+        if limit is not None and not 1 <= limit <= self.MAX_PAGE_SIZE:
+            abort(400, f"limit must be between 1 and {self.MAX_PAGE_SIZE}")
+
+        if after_id is not None:
+            cursor = db.session.query(Sighting.observed_on).filter(Sighting.id == after_id).first()
+            if cursor is None:
+                abort(400, "Unknown after_id")
+            query = query.filter(Sighting.after(cursor.observed_on, after_id))
+
+        query = query.order_by(*Sighting.stable_order())
+
+        headers = {}
+        if limit is not None and center:
+            # The geohash cells cover more than the circle, so walk the candidates'
+            # coordinates until limit of them are within the radius (or they run
+            # out), then load just those; a short page is the last one
+            page = query.filter(Sighting.id.in_(self.ids_within(query, center, radius, limit))).all()
+            if len(page) == limit:
+                headers['X-Next-After-Id'] = str(page[-1].id)
+            rows = page
+            center = None
+        elif limit is not None:
+            page = query.limit(limit).all()
+            # A full page means there may be more rows; point the client at the next one
+            if len(page) == limit:
+                headers['X-Next-After-Id'] = str(page[-1].id)
+            rows = page
         else:
-            # If no location parameters, return all sightings
-            sightings = Sighting.query.all()
-            
-        return make_response([sighting.to_dict() for sighting in sightings], 200)
+            rows = query.yield_per(STREAM_BATCH_SIZE)
+
+        if center:
+            rows = (s for s in rows if s.distance_km(*center) <= radius)
+
+        return stream_json_array(rows, lambda sighting: sighting.to_dict(only=fields or ()), headers=headers)
+
+    # Ids of the first limit rows of query (in its order) within radius_km of center
+    @staticmethod
+    def ids_within(query, center, radius_km, limit):
+        ids = []
+        result = db.session.execute(query.with_entities(Sighting.id, Sighting.latitude, Sighting.longitude)
+                                    .statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+        try:
+            for id, latitude, longitude in result:
+                if haversine_km(latitude, longitude, *center) <= radius_km:
+                    ids.append(id)
+                    if len(ids) == limit:
+                        break
+        finally:
+            result.close()
+        return ids
 
     def post(self):
         user_id = session.get("user_id")
@@ -203,22 +285,109 @@ class Sightings(Resource):
         return response 
 api.add_resource(Sightings, "/sightings")
 
+# SightingsBulk route - POST imports many sightings for the current user from an
+# NDJSON (application/x-ndjson) or CSV (text/csv) body, reporting rows it skipped
+class SightingsBulk(Resource):
+    def post(self):
+        user_id = session.get("user_id")
+        if not user_id:
+            abort(401, "Unauthorized")
+        format = request.args.get("format") or FORMAT_BY_MIMETYPE.get(request.mimetype)
+        if format not in FORMATS:
+            return make_response({"error": "Send NDJSON (application/x-ndjson) or CSV (text/csv)"}, 415)
+        max_bytes = current_app.config['BULK_IMPORT_MAX_BYTES']
+        if (request.content_length or 0) > max_bytes:
+            abort(413)
+        result = import_sightings(CappedStream(request.stream, max_bytes), format, user_id)
+        return make_response(result.to_dict(), 201 if result.inserted else 400)
+api.add_resource(SightingsBulk, "/sightings/bulk")
+
+# SightingsExport route - GET streams sightings as NDJSON, CSV or GeoJSON, with
+# optional user_id, species_id, start/end date (YYYY-MM-DD) and bbox filters
+class SightingsExport(Resource):
+    @query_budget(1)
+    def get(self):
+        format = request.args.get("format", "ndjson")
+        if format not in export.FORMATS:
+            abort(400, f"format must be one of {', '.join(export.FORMATS)}")
+        try:
+            filters = {
+                "user_id": request.args.get("user_id", type=int),
+                "species_id": request.args.get("species_id", type=int),
+                "start": date.fromisoformat(request.args["start"]) if "start" in request.args else None,
+                "end": date.fromisoformat(request.args["end"]) if "end" in request.args else None,
+                "bbox": parse_bbox(request.args["bbox"]) if "bbox" in request.args else None,
+            }
+        except ValueError as e:
+            abort(400, str(e))
+        return export.export_response(format, export.export_query(**filters))
+api.add_resource(SightingsExport, "/sightings/export")
+
+# SightingClusters route - GET returns sighting counts and centroids per map cell
+# for a bbox (min_lng,min_lat,max_lng,max_lat) at a zoom level
+class SightingClusters(Resource):
+    @query_budget(1)
+    def get(self):
+        zoom = request.args.get("zoom", 0, type=int)
+        if not 0 <= zoom <= MAX_ZOOM:
+            abort(400, f"zoom must be between 0 and {MAX_ZOOM}")
+        try:
+            bbox = parse_bbox(request.args["bbox"]) if "bbox" in request.args else None
+        except ValueError as e:
+            abort(400, str(e))
+        precision, clusters = find_clusters(bbox, zoom)
+        return make_response({"zoom": zoom, "precision": precision, "clusters": clusters}, 200)
+api.add_resource(SightingClusters, "/sightings/clusters")
+
+# SightingStats route - GET returns sighting counts per day, week or month
+# (?interval=), optionally split by species and/or map cell (?by=species,cell) and
+# filtered by species_id, start/end date (YYYY-MM-DD), cell (geohash prefix) or bbox
+class SightingStats(Resource):
+    @query_budget(1)
+    def get(self):
+        interval = request.args.get("interval", "day")
+        if interval not in stats.INTERVALS:
+            abort(400, f"interval must be one of {', '.join(stats.INTERVALS)}")
+        by = [dimension for dimension in request.args.get("by", "").split(",") if dimension]
+        if any(dimension not in stats.DIMENSIONS for dimension in by):
+            abort(400, f"by may list {', '.join(stats.DIMENSIONS)}")
+        cell = request.args.get("cell")
+        if cell is not None and not (0 < len(cell) <= SightingDailyCount.PRECISION and cell.isalnum()):
+            abort(400, f"cell must be a geohash prefix of 1 to {SightingDailyCount.PRECISION} characters")
+        try:
+            result = stats.activity_stats(
+                interval=interval,
+                by=by,
+                species_id=request.args.get("species_id", type=int),
+                start=date.fromisoformat(request.args["start"]) if "start" in request.args else None,
+                end=date.fromisoformat(request.args["end"]) if "end" in request.args else None,
+                cell=cell.lower() if cell else None,
+                bbox=parse_bbox(request.args["bbox"]) if "bbox" in request.args else None,
+            )
+        except ValueError as e:
+            abort(400, str(e))
+        return make_response(result, 200)
+api.add_resource(SightingStats, "/sightings/stats")
+
 # Sightings count route - GET returns the count of sightings for the current user
 class SightingsCount(Resource):
+    @query_budget(1)
     def get(self):
         user_id = session.get("user_id")
         if not user_id:
             abort(401, "Unauthorized")
         
-        count = Sighting.query.filter_by(user_id=user_id).count()
-        return make_response({"count": count}, 200)
+        # Maintained on the user row, no need to count the sightings table
+        count = db.session.query(User.sighting_count).filter(User.id == user_id).scalar()
+        return make_response({"count": count or 0}, 200)
 
 api.add_resource(SightingsCount, "/sightings/count")
 
 # SightingsByUser route - GET returns all sightings for a user
 class SightingsByUserId(Resource):
+    @query_budget(3)
     def get(self, id):
-        sighting = Sighting.query.get(id)
+        sighting = db.session.get(Sighting, id, options=Sighting.serialize_options())
         if not sighting:
             abort(404, "Sighting not found")
         return make_response(sighting.to_dict(), 200)
@@ -226,16 +395,25 @@ api.add_resource(SightingsByUserId, "/sightings/count/<int:id>")
 
 
 # SightingsById route - GET returns a single sighting, PATCH updates a sighting, DELETE deletes a sighting  
+# GET is conditional on the sighting's and its user's row versions (see conditional.py)
 class SightingsById(Resource):
+    @query_budget(4)
     def get(self, id):
-        sighting = db.session.get(Sighting, id)
-        if not sighting:
+        row = db.session.execute(
+            select(Sighting.version, Sighting.updated_at,
+                   User.version.label("user_version"), User.updated_at.label("user_updated_at"))
+            .outerjoin(User, Sighting.user_id == User.id).where(Sighting.id == id)
+        ).first()
+        if not row:
             abort(404, "Sighting not found")
-        response = make_response(
-            sighting.to_dict(),
-            200
-        )
-        return response
+
+        def build():
+            sighting = db.session.get(Sighting, id, options=Sighting.serialize_options())
+            if not sighting:
+                abort(404, "Sighting not found")
+            return sighting.to_dict()
+        return conditional_json(row_etag("sighting", id, row.version, row.user_version),
+                                last_modified(row.updated_at, row.user_updated_at), build)
     
     def patch(self, id):
         user_id = session.get("user_id")
@@ -286,6 +464,7 @@ api.add_resource(SightingsById, "/sightings/<int:id>")
 
 # FriendSearch route - GET searches for friends, returns a list of users that match the search term
 class FriendSearch(Resource):
+    @query_budget(3)
     def get(self):
         # Check if user is logged in
         user_id = session.get("user_id")
@@ -297,20 +476,14 @@ class FriendSearch(Resource):
         if not search_term:
             abort(400, "Please enter a username to search")
 
-        # Query database, excluding current user
-        users = User.query.filter(
-            User.username.ilike(f"%{search_term}%"),
-            User.id != user_id  # Exclude current user
-        ).all()
-        
-        # Return only necessary fields
-        return make_response([
-            {
-                "id": user.id,
-                "username": user.username,
-                "profile_picture": user.profile_picture
-            } for user in users
-        ], 200)
+        try:
+            limit = int(request.args.get('limit', DEFAULT_RESULTS))
+        except ValueError:
+            abort(400, "Invalid limit parameter")
+
+        # Ranked, size-limited matches from the username indexes, excluding current user
+        # Returns only the necessary fields
+        return make_response(search_users(search_term, exclude_user_id=user_id, limit=limit), 200)
 api.add_resource(FriendSearch, "/friend-search")
 
 # AddFriend route - POST adds a friend to the user's friends list
@@ -327,46 +500,82 @@ class AddFriend(Resource):
         friend = db.session.get(User, friend_id)
         if not friend:
             abort(404, "Friend not found")
+        if friend.id == user_id:
+            abort(400, "You can't add yourself as a friend")
             
         # Check if already friends
-        existing_friendship = Friendship.query.filter(
-            ((Friendship.user_id == user_id) & (Friendship.friend_id == friend_id)) |
-            ((Friendship.user_id == friend_id) & (Friendship.friend_id == user_id))
-        ).first()
+        existing_friendship = Friendship.query.filter(Friendship.between(user_id, friend.id)).first()
         
         if existing_friendship:
             abort(400, "Already friends")
             
-        # Create both sides of the friendship
-        friendship1 = Friendship(user_id=user_id, friend_id=friend_id)
-        friendship2 = Friendship(user_id=friend_id, friend_id=user_id)
-        
-        db.session.add(friendship1)
-        db.session.add(friendship2)
-        db.session.commit()
+        # One row covers both sides of the friendship
+        db.session.add(Friendship.pair(user_id, friend.id))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request created the same friendship first
+            db.session.rollback()
+            abort(400, "Already friends")
         
         return make_response({"message": "Friend added successfully"}, 201)
 api.add_resource(AddFriend, "/add-friend")
 
 # Friends route - GET returns all friendships, DELETE removes a friendship
+# Conditional on each friend's row version (see conditional.py); Last-Modified
+# also takes the user's own row, which changes when a friend is removed
 class Friends(Resource):
+    @query_budget(6)
     def get(self):
         user_id = session.get("user_id")
         if not user_id:
             abort(401, "Unauthorized")
-            
-        # Get all friendships where user is either the initiator or the friend
-        friendships = Friendship.query.filter(
-            (Friendship.user_id == user_id) | (Friendship.friend_id == user_id)
+
+        rows = db.session.execute(
+            select(User.id, User.version, User.updated_at)
+            .where(or_(User.id == user_id, User.id.in_(Friendship.friend_ids(user_id)))).order_by(User.id)
         ).all()
-        
-        # Get the friend users
-        friend_ids = [f.friend_id if f.user_id == user_id else f.user_id for f in friendships]
-        friends = User.query.filter(User.id.in_(friend_ids)).all()
-        
-        return make_response([friend.to_dict() for friend in friends], 200)
+
+        # Friends on either side of the user's friendships, in one query
+        def build():
+            friends = (User.query.options(*User.serialize_options())
+                       .filter(User.id.in_(Friendship.friend_ids(user_id))).all())
+            return [friend.to_dict() for friend in friends]
+        return conditional_json(row_etag("friends", user_id, [(row.id, row.version) for row in rows if row.id != user_id]),
+                                last_modified(*(row.updated_at for row in rows)), build)
 api.add_resource(Friends, "/friends")
 
+# MutualFriends route - GET returns how many friends the user shares with another
+# user and (up to ?limit=) who they are
+class MutualFriends(Resource):
+    @query_budget(2)
+    def get(self, other_id):
+        user_id = session.get("user_id")
+        if not user_id:
+            abort(401, "Unauthorized")
+        limit = request.args.get("limit", DEFAULT_MUTUAL, type=int)
+        if not 0 <= limit <= MAX_MUTUAL:
+            abort(400, f"limit must be between 0 and {MAX_MUTUAL}")
+
+        count, friends = mutual_friends(user_id, other_id, limit)
+        return make_response({"count": count, "friends": friends}, 200)
+api.add_resource(MutualFriends, "/friends/mutual/<int:other_id>")
+
+# FriendSuggestions route - GET returns people the user may know: friends of
+# friends, ranked by mutual friends and how close their sightings are
+class FriendSuggestions(Resource):
+    @query_budget(2)
+    def get(self):
+        user_id = session.get("user_id")
+        if not user_id:
+            abort(401, "Unauthorized")
+        limit = request.args.get("limit", DEFAULT_SUGGESTIONS, type=int)
+        if not 1 <= limit <= MAX_SUGGESTIONS:
+            abort(400, f"limit must be between 1 and {MAX_SUGGESTIONS}")
+
+        return make_response(suggest_friends(user_id, limit), 200)
+api.add_resource(FriendSuggestions, "/friends/suggestions")
+
 # RemoveFriend route - DELETE removes a friendship
 class RemoveFriend(Resource):
     #     return make_response({"message": "Friend removed successfully"}, 204)
@@ -375,42 +584,111 @@ class RemoveFriend(Resource):
         if not user_id:
             abort(401, "Unauthorized")
 
-        # Delete both directions of the friendship
-        friendships = Friendship.query.filter(
-            ((Friendship.user_id == user_id) & (Friendship.friend_id == friend_id)) |
-            ((Friendship.user_id == friend_id) & (Friendship.friend_id == user_id))
-        ).all()
+        friendship = Friendship.query.filter(Friendship.between(user_id, friend_id)).first()
 
-        if not friendships:
+        if not friendship:
             abort(404, "Friendship not found")
 
-        for friendship in friendships:
-            db.session.delete(friendship)
+        db.session.delete(friendship)
 
         db.session.commit()
         return make_response({"message": "Friend removed successfully"}, 204)
 api.add_resource(RemoveFriend, "/friends/<int:friend_id>")
 
+# Feed route - GET returns friends' sightings, newest first, a page at a time
+# (?limit=, ?before_id= from the X-Next-Before-Id header of the previous page)
+class Feed(Resource):
+    @query_budget(2)
+    def get(self):
+        user_id = session.get("user_id")
+        if not user_id:
+            abort(401, "Unauthorized")
+        limit = request.args.get("limit", FEED_PAGE_SIZE, type=int)
+        if not 1 <= limit <= FEED_MAX_PAGE_SIZE:
+            abort(400, f"limit must be between 1 and {FEED_MAX_PAGE_SIZE}")
+        before_id = request.args.get("before_id", type=int)
+
+        sightings, next_before_id = feed_page(user_id, before_id, limit)
+        headers = {"X-Next-Before-Id": str(next_before_id)} if next_before_id is not None else None
+        return make_response([sighting.to_dict(rules=FEED_RULES) for sighting in sightings], 200, headers)
+api.add_resource(Feed, "/feed")
+
 # SpeciesList route - GET returns all species
 class SpeciesList(Resource):
+    @query_budget(1)
     def get(self):
-        species_list = Species.query.all()
-        return make_response([species.to_dict() for species in species_list], 200)
+        # Served from the cache with an ETag until a species changes (or the
+        # entry times out, for changes made without the ORM)
+        return cache.json_response(
+            Species.CATALOG_CACHE_KEY,
+            lambda: [species.to_dict(only=Species.catalog_fields) for species in Species.query.order_by(Species.id)],
+            timeout=Species.CATALOG_CACHE_TIMEOUT,
+        )
 api.add_resource(SpeciesList, "/species")
 
 # Profile route - GET returns the profile of a user
+# Conditional on the user's row version (see conditional.py)
 class Profile(Resource):
+    @query_budget(5)
     def get(self, user_id):
-        user = User.query.get(user_id)
-        if not user:
+        row = db.session.execute(select(User.version, User.updated_at).where(User.id == user_id)).first()
+        if not row:
             abort(404, "User not found")
-        return make_response(user.to_dict(), 200)
+
+        def build():
+            user = db.session.get(User, user_id, options=User.serialize_options())
+            if not user:
+                abort(404, "User not found")
+            return user.to_dict()
+        return conditional_json(row_etag("profile", user_id, row.version), row.updated_at, build)
 api.add_resource(Profile, "/profile/<int:user_id>")
 
-@app.route('/static/uploads/<path:filename>')
+# ImageUpload route - POST stores an image (e.g. a sighting photo) and returns the
+# URLs of its variants; accepts a multipart "file" field or the raw image as the body
+class ImageUpload(Resource):
+    def post(self):
+        if not session.get("user_id"):
+            abort(401, "Unauthorized")
+        file = request.files.get('file')
+        if file is not None:
+            stream = file.stream
+        elif request.mimetype.startswith('image/'):
+            stream = request.stream
+        else:
+            return make_response({"error": "No image uploaded"}, 400)
+        try:
+            url = uploads.save(stream)
+        except UploadError as e:
+            return make_response({"error": str(e)}, 400)
+        return make_response({"url": url, "variants": variant_urls(url)}, 201)
+api.add_resource(ImageUpload, "/uploads")
 
 def serve_static(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-
+    # Cache headers, conditional GETs, ranges and sendfile modes in uploads.py
+    return uploads.send(filename)
+
+# Build an app: settings from the environment (see config.py) with the config
+# mapping on top, e.g. create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": ...})
+# The extensions in config.py hold one app's settings at a time, so create one
+# app per process
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(settings())
+    if config:
+        app.config.update(config)
+    init_extensions(app)
+
+    app.add_url_rule('/', view_func=index)
+    app.add_url_rule('/static/uploads/<path:filename>', view_func=serve_static)
+
+    # flask import-sightings FILE --user USERNAME
+    app.cli.add_command(import_sightings_command)
+    return app
+
+# The app wsgi.py, flask commands and scripts use
+app = create_app()
+
+# Development server; production runs wsgi.py under gunicorn (see gunicorn.conf.py)
+# FLASK_DEBUG=0 turns off the debugger and reloader
 if __name__ == '__main__':
-    app.run(port=5555, debug=True)
+    app.run(port=int(os.environ.get('PORT', 5555)), debug=os.environ.get('FLASK_DEBUG', '1') != '0')
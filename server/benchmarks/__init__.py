@@ -0,0 +1,2 @@
+# Benchmarks for the server; run them from the server directory, e.g.
+#   python -m benchmarks.serializers
@@ -0,0 +1,104 @@
+# Concurrent write benchmark: SQLite's default rollback journal vs WAL
+# Writer threads insert sightings one transaction at a time (like POST /sightings)
+# while reader threads page through the table (like GET /sightings), each on its
+# own connection to a scratch database file. Reports writes/s, reads/s and how
+# many operations failed with "database is locked".
+#
+#   python -m benchmarks.concurrent_writes [--writers 4] [--readers 4] [--seconds 5]
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from database import apply_sqlite_pragmas, sqlite_pragmas
+
+MODES = [
+    ("rollback journal", {"journal_mode": "DELETE", "synchronous": "FULL"}),
+    ("WAL", sqlite_pragmas({})),
+]
+
+SCHEMA = """
+CREATE TABLE sightings (
+    id INTEGER PRIMARY KEY,
+    place_guess VARCHAR, observed_on DATETIME, description VARCHAR,
+    latitude FLOAT, longitude FLOAT, user_id INTEGER, species_id INTEGER
+)
+"""
+
+
+def connect(path, pragmas):
+    # Same 5s lock wait the app gets from busy_timeout / the driver timeout
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+    apply_sqlite_pragmas(connection, pragmas)
+    return connection
+
+
+def writer(path, pragmas, stop, counts, n):
+    connection = connect(path, pragmas)
+    while not stop.is_set():
+        try:
+            connection.execute("BEGIN")
+            connection.execute(
+                "INSERT INTO sightings (place_guess, observed_on, description, latitude, longitude, user_id, species_id) "
+                "VALUES (?, datetime('now'), ?, ?, ?, ?, ?)",
+                ("Tampa", "benchmark", 28.0 + n / 1000, -82.4, n, 1),
+            )
+            connection.execute("COMMIT")
+            counts["writes"] += 1
+        except sqlite3.OperationalError:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            counts["locked"] += 1
+    connection.close()
+
+
+def reader(path, pragmas, stop, counts):
+    connection = connect(path, pragmas)
+    while not stop.is_set():
+        try:
+            connection.execute("SELECT * FROM sightings ORDER BY id DESC LIMIT 50").fetchall()
+            counts["reads"] += 1
+        except sqlite3.OperationalError:
+            counts["locked"] += 1
+    connection.close()
+
+
+def run(pragmas, writers, readers, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        setup = connect(path, pragmas)
+        setup.execute(SCHEMA)
+        setup.close()
+
+        stop = threading.Event()
+        counts = {"writes": 0, "reads": 0, "locked": 0}
+        threads = [threading.Thread(target=writer, args=(path, pragmas, stop, counts, n)) for n in range(writers)]
+        threads += [threading.Thread(target=reader, args=(path, pragmas, stop, counts)) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return {key: value / seconds for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds:g}s per mode")
+    print(f"{'mode':<18}{'writes/s':>10}{'reads/s':>10}{'locked/s':>10}")
+    for label, pragmas in MODES:
+        rates = run(pragmas, args.writers, args.readers, args.seconds)
+        print(f"{label:<18}{rates['writes']:>10.1f}{rates['reads']:>10.1f}{rates['locked']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# Conditional GET benchmark: what a 304 saves on the endpoints that revalidate
+# Seeds a scratch SQLite database (seed.py's seed_synthetic) and, as a logged-in
+# user with a typical number of friends, requests GET /check_session,
+# /sightings/<id>, /profile/<id> and /friends --requests times each: once
+# unconditionally (a 200 with the full body) and once with the ETag the client
+# already holds (a 304, see conditional.py). Reports, per request, the bytes sent
+# (status line, headers and body), wall and CPU time, SQL statements and
+# serialization time, and what the 304 saves.
+#
+#   python -m benchmarks.conditional [--sightings 10000] [--users N] [--friends 20] [--requests 200]
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+_scratch = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_scratch, "conditional.db")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+os.environ.setdefault("BCRYPT_LOG_ROUNDS", "4")
+os.environ.setdefault("METRICS_LOG_SAMPLE_RATE", "0")
+
+from sqlalchemy import select  # noqa: E402
+
+from app import app  # noqa: E402
+from instrumentation import serialization_seconds, statement_count  # noqa: E402
+from models import db, User, Sighting  # noqa: E402
+from seed import seed_synthetic, PASSWORD  # noqa: E402
+
+# SQL statements and serialization seconds of the last request
+_last = {}
+
+
+@app.after_request
+def _record(response):
+    _last["sql"] = statement_count()
+    _last["serialization"] = serialization_seconds()
+    return response
+
+
+def response_bytes(response):
+    head = f"HTTP/1.1 {response.status}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in response.headers.items())
+    return len(head) + 2 + len(response.get_data())
+
+
+# Request each path once, sending the ETag from etags when given; per-request
+# averages, plus the median wall time
+def measure(client, paths, etags=None):
+    walls, statuses = [], set()
+    sent = sql = serialization = 0
+    cpu_started = time.process_time()
+    for path in paths:
+        headers = {"If-None-Match": etags[path]} if etags else {}
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        walls.append((time.perf_counter() - started) * 1000)
+        statuses.add(response.status_code)
+        sent += response_bytes(response)
+        sql += _last["sql"]
+        serialization += _last["serialization"]
+    count = len(paths)
+    return {
+        "status": "/".join(str(status) for status in sorted(statuses)),
+        "bytes": sent / count,
+        "p50_ms": statistics.median(walls),
+        "cpu_ms": (time.process_time() - cpu_started) * 1000 / count,
+        "sql": sql / count,
+        "serialization_ms": serialization * 1000 / count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sightings", type=int, default=10_000)
+    parser.add_argument("--users", type=int, help="default: one per 10 sightings")
+    parser.add_argument("--friends", type=int, default=20, help="average friends per user")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and mode")
+    args = parser.parse_args()
+    users = args.users or max(args.sightings // 10, 10)
+    rng = random.Random(1)
+
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(users, args.sightings, friends=args.friends, seed=1, hash_rounds=4, report=lambda line: None)
+        user_id, username = db.session.execute(select(User.id, User.username).order_by(User.friend_count.desc(), User.id)
+                                               .offset(users // 10).limit(1)).one()
+        sighting_ids = db.session.execute(select(Sighting.id)).scalars().all()
+        db.session.rollback()
+
+    # Outside an app context, so each request gets its own g (SQL counts)
+    client = app.test_client()
+    client.post("/login", json={"username": username, "password": PASSWORD})
+    endpoints = [
+        ("GET /check_session", ["/check_session"]),
+        ("GET /sightings/<id>", [f"/sightings/{rng.choice(sighting_ids)}" for _ in range(50)]),
+        ("GET /profile/<id>", [f"/profile/{rng.randint(1, users)}" for _ in range(50)]),
+        ("GET /friends", ["/friends"]),
+    ]
+
+    print(f"{users} users, {args.sightings} sightings; user {user_id}; {args.requests} requests per row")
+    print(f"{'endpoint':<24}{'status':>7}{'bytes':>9}{'p50 ms':>9}{'cpu ms':>9}{'sql':>6}{'ser ms':>9}"
+          f"{'bytes saved':>13}{'cpu saved':>11}")
+    totals = {"full": [0, 0], "conditional": [0, 0]}
+    for label, urls in endpoints:
+        paths = [urls[i % len(urls)] for i in range(args.requests)]
+        etags = {url: client.get(url).headers["ETag"] for url in urls}
+        full = measure(client, paths)
+        conditional = measure(client, paths, etags)
+        for mode, result in (("full", full), ("conditional", conditional)):
+            totals[mode][0] += result["bytes"]
+            totals[mode][1] += result["cpu_ms"]
+            saved = "" if mode == "full" else (
+                f"{1 - conditional['bytes'] / full['bytes']:>13.0%}{1 - conditional['cpu_ms'] / full['cpu_ms']:>11.0%}")
+            print(f"{label if mode == 'full' else '':<24}{result['status']:>7}{result['bytes']:>9.0f}"
+                  f"{result['p50_ms']:>9.2f}{result['cpu_ms']:>9.2f}{result['sql']:>6.1f}"
+                  f"{result['serialization_ms']:>9.2f}{saved}")
+    (full_bytes, full_cpu), (conditional_bytes, conditional_cpu) = totals["full"], totals["conditional"]
+    print(f"\nOne of each request: {full_bytes:.0f} bytes and {full_cpu:.1f}ms CPU as 200s, "
+          f"{conditional_bytes:.0f} bytes and {conditional_cpu:.1f}ms as 304s "
+          f"({1 - conditional_bytes / full_bytes:.0%} and {1 - conditional_cpu / full_cpu:.0%} less)")
+
+
+if __name__ == "__main__":
+    main()
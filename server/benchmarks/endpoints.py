@@ -0,0 +1,457 @@
+# Endpoint benchmark: every REST resource in app.py against synthetic data
+# Seeds a scratch SQLite database with synthetic users, friendships and sightings
+# (seed.py's seed_synthetic), then drives each endpoint and reports p50/p95/p99 latency, requests per second and
+# peak RSS.
+#
+# By default requests go through the Flask test client, one at a time, so the
+# numbers are the app's own cost. With --workers N the app is served over HTTP by
+# N forked processes (threaded werkzeug servers sharing one listening socket)
+# and --concurrency client threads send the requests; RSS is then the largest
+# worker's peak.
+#
+# --save-baseline writes the results to --baseline (benchmarks/baseline.json);
+# later runs at the same scale print the change in median latency against it
+# and exit with status 1 when an endpoint got slower than --tolerance allows (the
+# median, because a few hundred requests make for a noisy p95/p99).
+#
+#   python -m benchmarks.endpoints [--sightings 10000] [--users N] [--friends 10] [--requests 200]
+#       [--workers N --concurrency N] [--only PATTERN ...] [--save-baseline] [--tolerance 0.25]
+
+import argparse
+import fnmatch
+import http.client
+import io
+import json
+import logging
+import os
+import random
+import resource
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from queue import Empty, Queue
+from urllib.parse import urlencode
+
+_scratch = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_scratch, "endpoints.db")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+# Every seeded user shares one cheap hash, so /login measures the app, not bcrypt
+os.environ.setdefault("BCRYPT_LOG_ROUNDS", "4")
+os.environ.setdefault("METRICS_LOG_SAMPLE_RATE", "0")
+
+from sqlalchemy import select  # noqa: E402
+
+from app import app  # noqa: E402
+from config import social_graph, uploads  # noqa: E402
+from models import db, User, Sighting, Friendship  # noqa: E402
+from seed import seed_synthetic, PASSWORD  # noqa: E402
+
+SPECIES = 40
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Median changes smaller than this are noise, whatever the percentage
+NOISE_MS = 0.5
+
+
+# A tiny, distinct PNG for each i (uploads are stored once per content hash)
+def png(i):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    row = b"\x00" + bytes((i % 256, i // 256 % 256, i // 65536 % 256)) * 8
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 8, 8, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * 8)) + chunk(b"IEND", b""))
+
+
+def _json(method, path, value):
+    return (method, path, json.dumps(value).encode(), {"Content-Type": "application/json"})
+
+
+# The endpoints, in the order they run: (name, session, build)
+# session is "user" (logged in as the benchmark user) or "anonymous"; build(ctx, n)
+# returns n requests as (method, path, body, headers), and runs just before the
+# endpoint does, so it can see what earlier endpoints wrote
+def scenarios():
+    def get(path):
+        return lambda ctx, n: [("GET", path, None, {})] * n
+
+    def each(fn):
+        return lambda ctx, n: [fn(ctx, i) for i in range(n)]
+
+    def own_sightings(ctx, n):
+        ids = db.session.execute(select(Sighting.id).where(Sighting.user_id == ctx["user_id"])
+                                 .order_by(Sighting.id.desc()).limit(n)).scalars().all()
+        db.session.rollback()
+        return ids
+
+    def new_friends(ctx, n):
+        friends = set(db.session.execute(Friendship.friend_ids(ctx["user_id"])).scalars())
+        db.session.rollback()
+        candidates = [i for i in range(1, ctx["users"] + 1) if i != ctx["user_id"] and i not in friends]
+        ctx["added_friends"] = ctx["rng"].sample(candidates, min(n, len(candidates)))
+        return ctx["added_friends"]
+
+    def uploaded_files(ctx):
+        return sorted(name for name in os.listdir(uploads.folder) if not name.endswith(".part"))
+
+    def bulk_body(ctx, i):
+        rows = [dict(zip(("latitude", "longitude"), near(ctx, 0.2)), species_id=ctx["rng"].randint(1, ctx["species"]),
+                     observed_on="2023-07-01T21:30") for _ in range(100)]
+        return ("POST", "/sightings/bulk", "\n".join(json.dumps(row) for row in rows).encode(),
+                {"Content-Type": "application/x-ndjson"})
+
+    # A random user, from the first limit (the most popular) when given
+    def rng_id(ctx, limit=None):
+        return ctx["rng"].randint(1, min(limit or ctx["users"], ctx["users"]))
+
+    def rng_sighting(ctx):
+        return ctx["rng"].randint(1, ctx["sightings"])
+
+    # Coordinates up to spread degrees from a seeded sighting
+    def near(ctx, spread):
+        lat, lng = ctx["rng"].choice(ctx["places"])
+        return (round(lat + ctx["rng"].uniform(-spread, spread), 5),
+                round(lng + ctx["rng"].uniform(-spread, spread), 5))
+
+    # min_lng,min_lat,max_lng,max_lat around a seeded sighting
+    def bbox(ctx, half):
+        lat, lng = ctx["rng"].choice(ctx["places"])
+        return f"{lng - half:.4f},{lat - half:.4f},{lng + half:.4f},{lat + half:.4f}"
+
+    return [
+        ("GET /", "anonymous", get("/")),
+        ("POST /signup", "anonymous", each(lambda ctx, i: (
+            "POST", "/signup", urlencode({"username": f"signup{i}", "password": PASSWORD}).encode(),
+            {"Content-Type": "application/x-www-form-urlencoded"}))),
+        ("POST /login", "anonymous", each(lambda ctx, i: _json(
+            "POST", "/login", {"username": ctx["usernames"][i % len(ctx["usernames"])], "password": PASSWORD}))),
+        ("DELETE /logout", "anonymous", lambda ctx, n: [("DELETE", "/logout", None, {})] * n),
+        ("GET /check_session", "user", get("/check_session")),
+        ("GET /sightings?limit=100", "user", get("/sightings?limit=100")),
+        ("GET /sightings?after_id=&limit=100", "user", each(lambda ctx, i: (
+            "GET", f"/sightings?after_id={rng_sighting(ctx)}&limit=100", None, {}))),
+        ("GET /sightings?lat=&lng=&radius=10", "user", each(lambda ctx, i: (
+            "GET", "/sightings?" + urlencode(dict(zip(("lat", "lng"), near(ctx, 0)), radius=10)), None, {}))),
+        ("GET /sightings/<id>", "user", each(lambda ctx, i: ("GET", f"/sightings/{rng_sighting(ctx)}", None, {}))),
+        ("GET /sightings/count", "user", get("/sightings/count")),
+        ("GET /sightings/count/<id>", "user", each(lambda ctx, i: (
+            "GET", f"/sightings/count/{rng_sighting(ctx)}", None, {}))),
+        ("GET /sightings/export?user_id=", "user", each(lambda ctx, i: (
+            "GET", f"/sightings/export?user_id={rng_id(ctx, 1000)}", None, {}))),
+        ("GET /sightings/export?format=geojson&bbox=", "user", each(lambda ctx, i: (
+            "GET", f"/sightings/export?format=geojson&bbox={bbox(ctx, 0.1)}", None, {}))),
+        ("GET /sightings/clusters?zoom=4", "user", get("/sightings/clusters?zoom=4")),
+        ("GET /sightings/clusters?zoom=10&bbox=", "user", each(lambda ctx, i: (
+            "GET", f"/sightings/clusters?zoom=10&bbox={bbox(ctx, 0.5)}", None, {}))),
+        ("GET /sightings/stats", "user", get("/sightings/stats")),
+        ("GET /sightings/stats?interval=week&by=species", "user", get(
+            "/sightings/stats?interval=week&by=species")),
+        ("GET /species", "user", get("/species")),
+        ("GET /profile/<id>", "user", each(lambda ctx, i: ("GET", f"/profile/{rng_id(ctx)}", None, {}))),
+        ("GET /friend-search", "user", each(lambda ctx, i: (
+            "GET", f"/friend-search?username={ctx['usernames'][i % len(ctx['usernames'])][:3]}", None, {}))),
+        ("GET /friends", "user", get("/friends")),
+        ("GET /friends/mutual/<id>", "user", each(lambda ctx, i: (
+            "GET", f"/friends/mutual/{rng_id(ctx, 1000)}", None, {}))),
+        ("GET /friends/suggestions", "user", get("/friends/suggestions")),
+        ("GET /feed", "user", get("/feed")),
+        ("POST /add-friend", "user", lambda ctx, n: [
+            _json("POST", "/add-friend", {"friend_id": friend_id}) for friend_id in new_friends(ctx, n)]),
+        ("DELETE /friends/<id>", "user", lambda ctx, n: [
+            ("DELETE", f"/friends/{friend_id}", None, {}) for friend_id in ctx.get("added_friends", [])[:n]]),
+        ("POST /sightings", "user", each(lambda ctx, i: _json("POST", "/sightings", dict(
+            zip(("latitude", "longitude"), near(ctx, 0.2)), species_id=ctx["rng"].randint(1, ctx["species"]), observed_on="2023-07-01T21:30",
+            place_guess="Benchmark Park")))),
+        ("PATCH /sightings/<id>", "user", lambda ctx, n: [
+            _json("PATCH", f"/sightings/{sighting_id}", {"description": f"Seen {i} times"})
+            for i, sighting_id in enumerate(own_sightings(ctx, n))]),
+        ("DELETE /sightings/<id>", "user", lambda ctx, n: [
+            ("DELETE", f"/sightings/{sighting_id}", None, {}) for sighting_id in own_sightings(ctx, n)]),
+        ("POST /sightings/bulk (100 rows)", "user", each(bulk_body)),
+        ("POST /uploads", "user", each(lambda ctx, i: (
+            "POST", "/uploads", png(i + 1), {"Content-Type": "image/png"}))),
+        ("GET /static/uploads/<file>", "user", lambda ctx, n: [
+            ("GET", f"/static/uploads/{name}", None, {}) for name in (uploaded_files(ctx) * n)[:n]]),
+    ]
+
+
+class TestClientTarget:
+    def __init__(self, user):
+        self.clients = {"user": app.test_client(), "anonymous": app.test_client()}
+        self.clients["user"].post("/login", json={"username": user, "password": PASSWORD})
+        self.pids = [os.getpid()]
+
+    # Requests one at a time: [(seconds, status, bytes)], wall seconds
+    def run(self, session, requests):
+        client = self.clients[session]
+        samples = []
+        started_at = time.perf_counter()
+        for method, path, body, headers in requests:
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=body, headers=headers)
+            size = len(response.get_data())
+            response.close()
+            samples.append((time.perf_counter() - start, response.status_code, size))
+        return samples, time.perf_counter() - started_at
+
+    def close(self):
+        pass
+
+
+class HTTPTarget:
+    def __init__(self, user, workers, concurrency):
+        self.concurrency = concurrency
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(256)
+        self.port = listener.getsockname()[1]
+        # Each worker opens its own database connections
+        db.engine.dispose()
+        self.pids = []
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                _serve(listener)
+            self.pids.append(pid)
+        listener.close()
+
+        status, headers, _ = self._send(self._connect(), "POST", "/login",
+                                        json.dumps({"username": user, "password": PASSWORD}).encode(),
+                                        {"Content-Type": "application/json"})
+        cookie = headers.get("Set-Cookie", "").split(";")[0]
+        self.cookies = {"user": cookie, "anonymous": None}
+
+    def _connect(self):
+        for _ in range(100):
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+                connection.connect()
+                return connection
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+        raise RuntimeError("benchmark server did not start")
+
+    def _send(self, connection, method, path, body, headers):
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        return response.status, response.headers, data
+
+    # Requests from concurrency threads at once: [(seconds, status, bytes)], wall seconds
+    def run(self, session, requests):
+        queue = Queue()
+        for request in requests:
+            queue.put(request)
+        samples = []
+        lock = threading.Lock()
+        cookie = self.cookies[session]
+
+        def client():
+            connection = self._connect()
+            while True:
+                try:
+                    method, path, body, headers = queue.get_nowait()
+                except Empty:
+                    break
+                if cookie:
+                    headers = dict(headers, Cookie=cookie)
+                start = time.perf_counter()
+                try:
+                    status, _, data = self._send(connection, method, path, body, headers)
+                except (http.client.HTTPException, OSError):
+                    connection.close()
+                    connection = self._connect()
+                    status, data = 0, b""
+                sample = (time.perf_counter() - start, status, len(data))
+                with lock:
+                    samples.append(sample)
+            connection.close()
+
+        threads = [threading.Thread(target=client) for _ in range(min(self.concurrency, len(requests)) or 1)]
+        started_at = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started_at
+
+    def close(self):
+        for pid in self.pids:
+            os.kill(pid, signal.SIGTERM)
+        for pid in self.pids:
+            os.waitpid(pid, 0)
+
+
+# Forked worker: load the friend graph, then serve until SIGTERM
+def _serve(listener):
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    try:
+        signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+        with app.app_context():
+            social_graph.load()
+        server = make_server("127.0.0.1", 0, app, threaded=True, fd=listener.fileno())
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+# Peak RSS from the kernel's high-water mark, which can be reset (Linux); else
+# the process's lifetime peak, and None for other processes
+def reset_peak_rss(pids):
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+
+def peak_rss_mb(pids):
+    peaks = []
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                peaks += [int(line.split()[1]) / 1024 for line in f if line.startswith("VmHWM:")]
+        except OSError:
+            if pid == os.getpid():
+                maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                peaks.append(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024))
+    return max(peaks) if peaks else None
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def summarize(samples, elapsed, rss):
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    return {
+        "requests": len(samples),
+        "failed": sum(1 for _, status, _ in samples if not 200 <= status < 400),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "requests_per_second": round(len(samples) / elapsed, 1) if elapsed else None,
+        "bytes_per_request": round(sum(size for _, _, size in samples) / len(samples)),
+        "peak_rss_mb": round(rss, 1) if rss is not None else None,
+    }
+
+
+# The benchmark user: well connected, but not one of the most popular users
+def benchmark_user(users):
+    row = db.session.execute(select(User.id, User.username).order_by(User.friend_count.desc(), User.id)
+                             .offset(users // 10).limit(1)).one()
+    db.session.rollback()
+    return row
+
+
+def load_baseline(path, scale):
+    try:
+        with open(path) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        return None
+    if baseline.get("scale") != scale:
+        print(f"baseline {path} is for {baseline.get('scale')}, not comparing")
+        return None
+    return baseline["endpoints"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sightings", type=int, default=10_000)
+    parser.add_argument("--users", type=int, help="default: one per 10 sightings")
+    parser.add_argument("--friends", type=int, default=10, help="average friends per user")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--workers", type=int, default=0, help="serve over HTTP with N worker processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads in HTTP mode")
+    parser.add_argument("--only", nargs="+", metavar="PATTERN", help="endpoints to run, e.g. 'GET /friends*'")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown, 0.25 = 25%%")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    users = args.users or max(args.sightings // 10, 100)
+
+    rng = random.Random(args.seed)
+    uploads.folder = os.path.join(_scratch, "uploads")
+    os.makedirs(uploads.folder, exist_ok=True)
+
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(users, args.sightings, friends=args.friends, species=SPECIES, seed=args.seed,
+                       hash_rounds=app.config["BCRYPT_LOG_ROUNDS"])
+        user_id, username = benchmark_user(users)
+        usernames = db.session.execute(select(User.username).where(User.id.in_(
+            rng.sample(range(1, users + 1), min(users, 1000))))).scalars().all()
+        places = db.session.execute(select(Sighting.latitude, Sighting.longitude).where(Sighting.id.in_(
+            rng.sample(range(1, args.sightings + 1), min(args.sightings, 100))))).all()
+        db.session.rollback()
+        uploads.save(io.BytesIO(png(0)))
+
+        if args.workers:
+            target = HTTPTarget(username, args.workers, args.concurrency)
+            mode = f"HTTP, {args.workers} workers, {args.concurrency} client threads"
+        else:
+            with db.engine.connect() as connection:
+                social_graph.load(connection)
+            mode = "test client"
+    if not args.workers:
+        target = TestClientTarget(username)
+    print(f"{mode}; requests as user {user_id}")
+
+    scale = {"sightings": args.sightings, "users": users, "friends": args.friends,
+             "workers": args.workers, "concurrency": args.concurrency if args.workers else 1}
+    baseline = load_baseline(args.baseline, scale)
+    ctx = {"rng": rng, "users": users, "sightings": args.sightings, "species": SPECIES, "user_id": user_id,
+           "usernames": usernames, "places": [tuple(place) for place in places]}
+    print(f"{'endpoint':<46}{'n':>5}{'fail':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'req/s':>9}{'KB':>8}{'RSS MB':>8}" + ("  p50 vs baseline" if baseline else ""))
+    results = {}
+    regressions = []
+    # Requests run outside any app context, so each gets its own (and its own
+    # query budget) as it would in a server
+    try:
+        for name, session, build in scenarios():
+            if args.only and not any(fnmatch.fnmatchcase(name, pattern) for pattern in args.only):
+                continue
+            with app.app_context():
+                requests = build(ctx, args.requests)
+            if not requests:
+                print(f"{name:<46}  (nothing to request)")
+                continue
+            reset_peak_rss(target.pids)
+            samples, elapsed = target.run(session, requests)
+            result = results[name] = summarize(samples, elapsed, peak_rss_mb(target.pids))
+            line = (f"{name:<46}{result['requests']:>5}{result['failed']:>5}{result['p50_ms']:>9.2f}"
+                    f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['requests_per_second']:>9.0f}"
+                    f"{result['bytes_per_request'] / 1024:>8.1f}"
+                    f"{result['peak_rss_mb'] if result['peak_rss_mb'] is not None else '-':>8}")
+            previous = (baseline or {}).get(name)
+            if previous:
+                change = result["p50_ms"] / previous["p50_ms"] - 1 if previous["p50_ms"] else 0
+                line += f"  {change:+.0%}"
+                if change > args.tolerance and result["p50_ms"] - previous["p50_ms"] > NOISE_MS:
+                    line += "  SLOWER"
+                    regressions.append(name)
+            print(line)
+    finally:
+        target.close()
+        uploads.shutdown()
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"scale": scale, "endpoints": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+    if regressions:
+        sys.exit(f"{len(regressions)} endpoint(s) slower than the baseline: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
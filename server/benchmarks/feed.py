@@ -0,0 +1,106 @@
+# Feed benchmark: a user with 10k friends
+# Seeds a scratch SQLite database with one user friends with N others (each with
+# a few sightings), then times:
+#   - reading a feed page from the materialized feed vs. the fan-in query it
+#     replaces (friends' sightings ORDER BY id DESC)
+#   - posting a sighting as the 10k-friend user with fan-out (one feed row per
+#     friend) vs. above FeedItem.FANOUT_LIMIT (no feed rows, read by fan-in)
+#   - reading a friend's feed page that fans in that user's sightings
+#
+#   python -m benchmarks.feed [--friends 10000] [--sightings 5] [--reads 200]
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_scratch = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_scratch, "feed.db")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+from app import app  # noqa: E402
+from models import db, User, Sighting, Friendship, FeedItem, refresh_user_counters, rebuild_feed_items  # noqa: E402
+from feed import feed_page  # noqa: E402
+
+
+def seed(friends, sightings_per_friend):
+    db.drop_all()
+    db.create_all()
+    with db.engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {"id": i, "username": f"user{i}", "search_name": f"user{i}", "_password_hash": "-"}
+            for i in range(1, friends + 2)
+        ])
+        connection.execute(Friendship.__table__.insert(), [
+            {"user_id": 1, "friend_id": i} for i in range(2, friends + 2)
+        ])
+        start = datetime(2023, 6, 1)
+        connection.execute(Sighting.__table__.insert(), [
+            {"user_id": i, "species_id": None, "observed_on": start + timedelta(minutes=i * 10 + n),
+             "latitude": 28.0, "longitude": -82.4, "geohash": "dhvq"}
+            for n in range(sightings_per_friend) for i in range(2, friends + 2)
+        ])
+        refresh_user_counters(connection)
+        rebuild_feed_items(connection)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+        db.session.rollback()
+    return statistics.median(samples), sorted(samples)[int(len(samples) * 0.95) - 1]
+
+
+def fan_in_page(user_id, limit=20):
+    return (Sighting.query.options(*Sighting.serialize_options())
+            .filter(Sighting.user_id.in_(Friendship.friend_ids(user_id))).order_by(Sighting.id.desc()).limit(limit).all())
+
+
+def post_sighting(user_id):
+    sighting = Sighting(user_id=user_id, observed_on=datetime(2023, 7, 1), latitude=28.0, longitude=-82.4)
+    db.session.add(sighting)
+    db.session.commit()
+    return sighting.id
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--friends", type=int, default=10000)
+    parser.add_argument("--sightings", type=int, default=5, help="sightings per friend")
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.perf_counter()
+        seed(args.friends, args.sightings)
+        feed_rows = db.session.query(FeedItem).count()
+        print(f"seeded {args.friends} friends, {args.friends * args.sightings} sightings, "
+              f"{feed_rows} feed rows in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'':<44}{'p50 ms':>10}{'p95 ms':>10}")
+        rows = [
+            (f"feed page, materialized ({args.friends} friends)", lambda: feed_page(1), args.reads),
+            (f"feed page, fan-in query ({args.friends} friends)", lambda: fan_in_page(1), args.reads),
+        ]
+        for label, fn, repeat in rows:
+            p50, p95 = timed(fn, repeat)
+            print(f"{label:<44}{p50:>10.2f}{p95:>10.2f}")
+
+        limit = FeedItem.FANOUT_LIMIT
+        FeedItem.FANOUT_LIMIT = args.friends
+        p50, p95 = timed(lambda: post_sighting(1), 5)
+        print(f"{'post, fan-out to every friend':<44}{p50:>10.2f}{p95:>10.2f}")
+        FeedItem.FANOUT_LIMIT = limit
+        p50, p95 = timed(lambda: post_sighting(1), 5)
+        print(f"{f'post, above FANOUT_LIMIT ({limit})':<44}{p50:>10.2f}{p95:>10.2f}")
+        p50, p95 = timed(lambda: feed_page(2), args.reads)
+        print(f"{'friend feed page with fan-in of that user':<44}{p50:>10.2f}{p95:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
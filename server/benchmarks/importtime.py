@@ -0,0 +1,79 @@
+# Import-time check: how long a new server worker takes to import the app
+# Runs python -X importtime -c "import wsgi" in --runs fresh interpreters (after
+# one run that compiles the .pyc files) and times "import wsgi", which includes
+# create_app(). Reports the median and the packages that took longest, and exits
+# with status 1 when the median is over --budget-ms or when a module that should
+# only load on demand was imported: Flask-Migrate and alembic (flask db commands),
+# Pillow (upload variants) and the PostgreSQL dialect (PostgreSQL deployments).
+#
+#   python -m benchmarks.importtime [--budget-ms 800] [--runs 5] [--top 12]
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED = ("flask_migrate", "alembic", "mako", "PIL", "sqlalchemy.dialects.postgresql")
+
+
+# {module: (self µs, cumulative µs)} from one interpreter's -X importtime output
+def import_times(environ):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import wsgi"], cwd=SERVER_DIR,
+                            env=environ, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import wsgi failed:\n{result.stderr[-2000:]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+# The DEFERRED packages that were imported
+def deferred_imports(modules):
+    return [prefix for prefix in DEFERRED
+            if any(name == prefix or name.startswith(prefix + ".") for name in modules)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPORT_TIME_BUDGET_MS", 800)))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="slowest top-level packages to list")
+    args = parser.parse_args()
+
+    environ = dict(os.environ, DATABASE_URL="sqlite:///" + os.path.join(tempfile.mkdtemp(), "importtime.db"))
+    import_times(environ)
+    runs = sorted((import_times(environ) for _ in range(args.runs)), key=lambda times: times["wsgi"][1])
+    median = runs[len(runs) // 2]
+    total_ms = median["wsgi"][1] / 1000
+
+    packages = {}
+    for name, (self_us, _) in median.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    print(f"import wsgi: median {total_ms:.0f}ms over {args.runs} runs "
+          f"(min {runs[0]['wsgi'][1] / 1000:.0f}ms, max {runs[-1]['wsgi'][1] / 1000:.0f}ms), "
+          f"{len(median)} modules; budget {args.budget_ms:.0f}ms")
+    print(f"{'package':<28}{'ms':>8}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<28}{self_us / 1000:>8.1f}")
+
+    failed = False
+    deferred = deferred_imports(median)
+    if deferred:
+        print(f"\nImported at startup, but should load on demand: {', '.join(deferred)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"\nOver budget: {total_ms:.0f}ms > {args.budget_ms:.0f}ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
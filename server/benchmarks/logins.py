@@ -0,0 +1,60 @@
+# Login-rate benchmark: password checks per second under concurrent logins
+# Simulates a threaded worker serving many /login requests at once and compares
+# hashing inline on the request threads against the bounded process pool.
+#
+#   python -m benchmarks.logins [--threads 16] [--logins 64] [--rounds 10] [--workers 4]
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passwords import PasswordHasher
+
+
+class _Config:
+    def __init__(self, **config):
+        self.config = config
+        self.extensions = {}
+
+
+def run(hasher, hashed, threads, logins):
+    # Warm up (starts the pool's processes)
+    hasher.verify("password123", hashed)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda _: hasher.verify("password123", hashed), range(logins)))
+    elapsed = time.perf_counter() - start
+    assert all(results)
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16, help="concurrent login requests")
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=10, help="bcrypt cost")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="process pool size")
+    args = parser.parse_args()
+
+    modes = [("inline", 0), (f"pool x{args.workers}", args.workers)]
+    print(f"bcrypt cost {args.rounds}, {args.threads} concurrent logins, {args.logins} total")
+    for label, workers in modes:
+        hasher = PasswordHasher(_Config(
+            BCRYPT_LOG_ROUNDS=args.rounds,
+            PASSWORD_HASH_WORKERS=workers,
+            PASSWORD_HASH_MAX_PENDING=max(args.threads, 1),
+        ))
+        hashed = hasher.hash("password123")
+        rate = run(hasher, hashed, args.threads, args.logins)
+        hasher.shutdown()
+        print(f"{label:<12}{rate:>10.1f} logins/s")
+
+    # A hash made with an older cost is flagged for an upgrade on the next login
+    hasher = PasswordHasher(_Config(BCRYPT_LOG_ROUNDS=args.rounds, PASSWORD_HASH_WORKERS=0))
+    old = PasswordHasher(_Config(BCRYPT_LOG_ROUNDS=args.rounds - 1, PASSWORD_HASH_WORKERS=0)).hash("password123")
+    print(f"rehash needed for cost {args.rounds - 1} hash: {hasher.needs_rehash(old)}")
+
+
+if __name__ == "__main__":
+    main()
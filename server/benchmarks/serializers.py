@@ -0,0 +1,76 @@
+# Microbenchmark: compiled serializers vs sqlalchemy_serializer's to_dict()
+# Builds transient model objects in memory (no database needed), checks both paths
+# produce identical JSON and times them.
+#
+#   python -m benchmarks.serializers [--sightings 2000] [--repeat 5]
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy_serializer import SerializerMixin
+
+from app import app
+from models import User, Sighting, Species, Friendship
+
+
+def build_objects(n_sightings):
+    species = [Species(id=i, name=f"Species {i}", type="Insect", scientific_name=f"Genus species{i}") for i in range(6)]
+    users = [User(id=i, username=f"user{i}", _password_hash="x", profile_picture=f"/static/uploads/u{i}.jpg") for i in range(50)]
+    for i, user in enumerate(users):
+        friend = users[(i + 1) % len(users)]
+        Friendship(id=i, user=user, friend=friend, user_id=user.id, friend_id=friend.id)
+    sightings = []
+    for i in range(n_sightings):
+        user = users[i % len(users)]
+        kind = species[i % len(species)]
+        sightings.append(Sighting(
+            id=i, place_guess=f"Park {i}", observed_on=datetime(2023, 6, 1) + timedelta(minutes=i),
+            description="Fireflies by the pond", photos="/static/uploads/firefly.jpeg",
+            latitude=28.0 + i * 1e-4, longitude=-82.4 - i * 1e-4,
+            user=user, user_id=user.id, species=kind, species_id=kind.id
+        ))
+    return users, sightings, species
+
+
+def timed(fn, objects, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for obj in objects:
+            fn(obj)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sightings", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    users, sightings, species = build_objects(args.sightings)
+    friendships = [f for u in users for f in u.friendships]
+    cases = [
+        ("Sighting", sightings, ()),
+        ("User (profile)", users, ()),
+        ("User (login)", users, ("-_password_hash",)),
+        ("Species", species, ()),
+        ("Friendship", friendships, ()),
+    ]
+
+    with app.app_context():
+        print(f"{'model':<16}{'rows':>7}{'to_dict ms':>13}{'compiled ms':>13}{'speedup':>9}")
+        for label, objects, rules in cases:
+            for obj in objects:
+                expected = SerializerMixin.to_dict(obj, rules=rules)
+                actual = obj.to_dict(rules=rules)
+                assert json.dumps(expected, sort_keys=True) == json.dumps(actual, sort_keys=True), label
+            old = timed(lambda o: SerializerMixin.to_dict(o, rules=rules), objects, args.repeat)
+            new = timed(lambda o: o.to_dict(rules=rules), objects, args.repeat)
+            print(f"{label:<16}{len(objects):>7}{old * 1000:>13.1f}{new * 1000:>13.1f}{old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# Friend graph benchmark: a million friendships
+# Seeds a scratch SQLite database with random friendships, then reports how long
+# the in-memory graph (social_graph.py) takes to load and how much memory it
+# holds, and times mutual friends and friends of friends against the indexed SQL
+# queries used while the graph isn't loaded.
+#
+#   python -m benchmarks.social_graph [--users 100000] [--edges 1000000] [--queries 200]
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+_scratch = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_scratch, "graph.db")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+from app import app  # noqa: E402
+from models import db, User, Friendship  # noqa: E402
+from social_graph import SocialGraph  # noqa: E402
+
+BATCH_SIZE = 50_000
+
+
+def seed(users, edges, rng):
+    db.drop_all()
+    db.create_all()
+    with db.engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {"id": i, "username": f"user{i}", "search_name": f"user{i}", "_password_hash": "-"}
+            for i in range(1, users + 1)
+        ])
+        # Squaring the random draw makes low ids popular, for a few users with
+        # many friends and a long tail with few
+        pairs = set()
+        while len(pairs) < edges:
+            a = 1 + int(users * rng.random() ** 2)
+            b = rng.randint(1, users)
+            if a != b:
+                pairs.add((min(a, b), max(a, b)))
+        pairs = sorted(pairs)
+        for start in range(0, len(pairs), BATCH_SIZE):
+            connection.execute(Friendship.__table__.insert(), [
+                {"user_id": a, "friend_id": b} for a, b in pairs[start:start + BATCH_SIZE]
+            ])
+    return pairs
+
+
+def timed(fn, args):
+    samples = []
+    for arg in args:
+        start = time.perf_counter()
+        fn(*arg)
+        samples.append((time.perf_counter() - start) * 1000)
+    db.session.rollback()
+    return statistics.median(samples), sorted(samples)[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--edges", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        start = time.perf_counter()
+        pairs = seed(args.users, args.edges, rng)
+        print(f"seeded {args.users} users, {len(pairs)} friendships in {time.perf_counter() - start:.1f}s")
+
+        graph = SocialGraph()
+        graph.max_edges = args.edges
+        start = time.perf_counter()
+        with db.engine.connect() as connection:
+            graph.load(connection)
+        elapsed = time.perf_counter() - start
+        stats = graph.stats()
+        print(f"loaded {stats['users']} users, {stats['edges']} friendships in {elapsed:.1f}s, "
+              f"{stats['bytes'] / 1e6:.1f} MB ({stats['bytes'] / stats['edges']:.1f} bytes per friendship)")
+
+        sample = [rng.choice(pairs) for _ in range(args.queries)]
+        users = [(rng.randint(1, args.users),) for _ in range(args.queries)]
+        popular = [(rng.randint(1, 100),) for _ in range(args.queries)]
+        print(f"{'':<44}{'p50 ms':>10}{'p95 ms':>10}")
+        rows = [
+            ("mutual friends, graph", lambda a, b: graph.mutual_friends(a, b), sample),
+            ("mutual friends, SQL", lambda a, b: db.session.execute(
+                Friendship.mutual_friend_ids(a, b)).all(), sample),
+            ("friends of friends, graph", lambda a: graph.friends_of_friends(a, 100), users),
+            ("friends of friends, SQL", lambda a: db.session.execute(
+                Friendship.friends_of_friends(a).limit(100)).all(), users),
+            ("friends of friends, graph (top 100 users)", lambda a: graph.friends_of_friends(a, 100), popular),
+            ("friends of friends, SQL (top 100 users)", lambda a: db.session.execute(
+                Friendship.friends_of_friends(a).limit(100)).all(), popular),
+        ]
+        for label, fn, calls in rows:
+            p50, p95 = timed(fn, calls)
+            print(f"{label:<44}{p50:>10.2f}{p95:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
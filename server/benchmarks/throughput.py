@@ -0,0 +1,189 @@
+# Throughput benchmark: the development server against gunicorn workers
+# Seeds a scratch SQLite database (seed.py's seed_synthetic), then starts each
+# server in turn and has --clients client processes send requests over keep-alive
+# connections for --duration seconds, after a second of warm-up: a mix of
+# GET /sightings/<id>, /profile/<id>, /species and /feed as a logged-in user.
+# Reports requests per second and latency for python app.py (with and without
+# the debugger) and for gunicorn (gunicorn.conf.py) with 1, 2, 4, ... workers up
+# to the number of CPUs. The clients run on the same machine, so leave them
+# some cores.
+#
+#   python -m benchmarks.throughput [--sightings 100000] [--clients N] [--duration 10]
+#       [--workers 1,2,4] [--threads 4]
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+_scratch = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_scratch, "throughput.db")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+os.environ.setdefault("BCRYPT_LOG_ROUNDS", "4")
+os.environ.setdefault("METRICS_LOG_SAMPLE_RATE", "0")
+
+from sqlalchemy import select  # noqa: E402
+
+from app import app  # noqa: E402
+from models import db, User  # noqa: E402
+from seed import seed_synthetic, PASSWORD  # noqa: E402
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WARM_UP = 1.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(command, environ, port):
+    env = dict(os.environ, PORT=str(port), **environ)
+    process = subprocess.Popen(command, cwd=SERVER_DIR, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(command)} exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/")
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"{' '.join(command)} did not start")
+
+
+# SIGTERM to the whole process group: gunicorn's master and workers, or the
+# development server and its reloader
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=60)
+    except ProcessLookupError:
+        pass
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def login(port, username):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    connection.request("POST", "/login", body=json.dumps({"username": username, "password": PASSWORD}),
+                       headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.headers.get("Set-Cookie", "").split(";")[0]
+
+
+# One client process: requests until the deadline; (completed, failed, latencies)
+# for the requests that finished after the warm-up
+def client(port, cookie, paths, start, deadline, seed):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    completed = failed = 0
+    latencies = []
+    while True:
+        now = time.time()
+        if now >= deadline:
+            break
+        try:
+            connection.request("GET", rng.choice(paths), headers={"Cookie": cookie})
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            ok = False
+        finished = time.time()
+        if finished >= start:
+            completed += ok
+            failed += not ok
+            latencies.append(finished - now)
+    connection.close()
+    return completed, failed, latencies
+
+
+def run(port, cookie, paths, clients, duration):
+    start = time.time() + WARM_UP
+    deadline = start + duration
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.starmap(client, [(port, cookie, paths, start, deadline, seed) for seed in range(clients)])
+    completed = sum(result[0] for result in results)
+    failed = sum(result[1] for result in results)
+    latencies = sorted(latency * 1000 for result in results for latency in result[2])
+    return {
+        "requests_per_second": completed / duration,
+        "failed": failed,
+        "p50_ms": latencies[len(latencies) // 2] if latencies else None,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else None,
+    }
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sightings", type=int, default=100_000)
+    parser.add_argument("--clients", type=int, default=max(4, 2 * cpus), help="client processes")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per server")
+    parser.add_argument("--workers", default=",".join(str(2 ** i) for i in range(cpus.bit_length())
+                                                      if 2 ** i <= cpus),
+                        help="gunicorn worker counts to try, e.g. 1,2,4")
+    parser.add_argument("--threads", type=int, default=4, help="threads per gunicorn worker")
+    args = parser.parse_args()
+    users = max(args.sightings // 10, 100)
+
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(users, args.sightings, friends=10, seed=1, hash_rounds=4, report=lambda line: None)
+        username = db.session.execute(select(User.username).order_by(User.friend_count.desc(), User.id)
+                                      .offset(users // 10).limit(1)).scalar()
+        db.session.rollback()
+    rng = random.Random(1)
+    paths = ["/species", "/feed"] + [f"/sightings/{rng.randint(1, args.sightings)}" for _ in range(200)] \
+        + [f"/profile/{rng.randint(1, users)}" for _ in range(200)]
+
+    servers = [
+        ("python app.py (debugger on)", [sys.executable, "app.py"], {"FLASK_DEBUG": "1"}),
+        ("python app.py (FLASK_DEBUG=0)", [sys.executable, "app.py"], {"FLASK_DEBUG": "0"}),
+    ]
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print("gunicorn isn't installed, only timing the development server")
+    else:
+        for workers in (int(count) for count in args.workers.split(",")):
+            servers.append((f"gunicorn {workers} worker(s) x {args.threads} threads",
+                            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+                            {"WEB_CONCURRENCY": str(workers), "GUNICORN_THREADS": str(args.threads)}))
+
+    print(f"{users} users, {args.sightings} sightings; {args.clients} client processes, "
+          f"{args.duration:.0f}s per server, {cpus} CPUs")
+    print(f"{'server':<40}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'failed':>8}")
+    for label, command, environ in servers:
+        port = free_port()
+        process = start_server(command, environ, port)
+        try:
+            result = run(port, login(port, username), paths, args.clients, args.duration)
+        finally:
+            stop_server(process)
+        print(f"{label:<40}{result['requests_per_second']:>9.0f}{result['p50_ms'] or 0:>9.1f}"
+              f"{result['p99_ms'] or 0:>9.1f}{result['failed']:>8}")
+
+
+if __name__ == "__main__":
+    main()
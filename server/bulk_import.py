@@ -0,0 +1,225 @@
+# Bulk import of sightings from NDJSON or CSV (POST /sightings/bulk and
+# `flask import-sightings`)
+# Rows are parsed and validated one at a time as the input streams in, then
+# inserted with one executemany per batch, each batch in its own transaction: a
+# bad row is reported and skipped, and a failure part way through keeps the
+# batches already committed. Core inserts skip the ORM events, so the geohash is
+# computed here and derived data is refreshed by sightings_inserted().
+#
+# Columns: observed_on, latitude, longitude, scientific_name (or species_id),
+# and optionally place_guess, description, photos
+
+import csv
+import io
+import json
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from config import db
+from models import User, Sighting, Species, sightings_inserted
+from geo import encode_geohash
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+FORMATS = ("ndjson", "csv")
+FORMAT_BY_MIMETYPE = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+TEXT_FIELDS = ("place_guess", "description", "photos")
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self):
+        return {"inserted": self.inserted, "error_count": self.error_count, "errors": self.errors}
+
+
+# Binary stream that raises RequestEntityTooLarge (413) once more than max_bytes
+# have been read from it: a chunked request body has no Content-Length to check
+# before the import starts. Batches committed before then are kept
+class CappedStream(io.RawIOBase):
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge()
+        buffer[:len(data)] = data
+        return len(data)
+
+
+# Yield (line number, row dict or RowError) from a binary stream
+def parse_rows(stream, format):
+    text = io.TextIOWrapper(stream, encoding="utf-8", errors="replace", newline="")
+    if format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError:
+            yield line, RowError("Invalid JSON")
+            continue
+        yield line, row if isinstance(row, dict) else RowError("Expected a JSON object")
+
+
+# Same format the sighting form sends, or any ISO 8601 date/datetime
+def parse_observed_on(value):
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value, "%Y-%m-%dT%H:%M")
+        except ValueError:
+            pass
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+        except ValueError:
+            pass
+    raise RowError("observed_on must be a date like YYYY-MM-DDTHH:MM")
+
+
+def parse_coordinate(row, key, limit):
+    try:
+        value = float(row.get(key))
+    except (TypeError, ValueError):
+        raise RowError(f"{key} must be a number")
+    if not -limit <= value <= limit:
+        raise RowError(f"{key} must be between -{limit} and {limit}")
+    return value
+
+
+# Optional text column; NDJSON rows may hold numbers, lists or objects there
+def parse_text(row, key):
+    value = row.get(key)
+    if value is not None and not isinstance(value, str):
+        raise RowError(f"{key} must be a string")
+    return value or None
+
+
+# Turn an input row into sightings table values
+# species maps lowercased scientific names and str(species ids) to species ids
+def validate_row(row, species, user_id):
+    if isinstance(row, RowError):
+        raise row
+    observed_on = parse_observed_on(row.get("observed_on"))
+    latitude = parse_coordinate(row, "latitude", 90)
+    longitude = parse_coordinate(row, "longitude", 180)
+
+    if row.get("scientific_name"):
+        species_id = species.get(str(row["scientific_name"]).strip().lower())
+        if species_id is None:
+            raise RowError(f"Unknown species {row['scientific_name']!r}")
+    elif row.get("species_id") not in (None, ""):
+        species_id = species.get(str(row["species_id"]).strip())
+        if species_id is None:
+            raise RowError(f"Unknown species_id {row['species_id']!r}")
+    else:
+        raise RowError("scientific_name or species_id is required")
+
+    values = {key: parse_text(row, key) for key in TEXT_FIELDS}
+    values.update(
+        observed_on=observed_on,
+        latitude=latitude,
+        longitude=longitude,
+        geohash=encode_geohash(latitude, longitude),
+        species_id=species_id,
+        user_id=user_id,
+    )
+    return values
+
+
+def species_lookup(connection):
+    lookup = {}
+    for species_id, scientific_name in connection.execute(select(Species.id, Species.scientific_name)):
+        lookup[scientific_name.lower()] = species_id
+        lookup[str(species_id)] = species_id
+    return lookup
+
+
+def _insert_batch(batch):
+    with db.engine.begin() as connection:
+        connection.execute(Sighting.__table__.insert(), batch)
+        sightings_inserted(connection, batch)
+
+
+# Import sightings for one user from a binary stream; progress(result) is called
+# after each committed batch
+def import_sightings(stream, format, user_id, batch_size=BATCH_SIZE, progress=None):
+    with db.engine.connect() as connection:
+        species = species_lookup(connection)
+
+    result = ImportResult()
+    batch = []
+    for line, row in parse_rows(stream, format):
+        try:
+            batch.append(validate_row(row, species, user_id))
+        except RowError as e:
+            result.add_error(line, str(e))
+            continue
+        if len(batch) >= batch_size:
+            _insert_batch(batch)
+            result.inserted += len(batch)
+            batch = []
+            if progress:
+                progress(result)
+    if batch:
+        _insert_batch(batch)
+        result.inserted += len(batch)
+        if progress:
+            progress(result)
+    return result
+
+
+@click.command("import-sightings")
+@click.argument("file", type=click.File("rb"))
+@click.option("--user", "username", required=True, help="Username the sightings belong to")
+@click.option("--format", type=click.Choice(FORMATS), help="Defaults to csv for .csv files, else ndjson")
+@click.option("--batch-size", type=int, default=BATCH_SIZE, show_default=True)
+@with_appcontext
+def import_sightings_command(file, username, format, batch_size):
+    """Import sightings from an NDJSON or CSV file ("-" for stdin)."""
+    user_id = db.session.execute(select(User.id).where(User.username == username)).scalar()
+    if user_id is None:
+        raise click.BadParameter(f"No user named {username!r}", param_hint="--user")
+    db.session.close()
+    if format is None:
+        format = "csv" if file.name.lower().endswith(".csv") else "ndjson"
+
+    result = import_sightings(
+        file, format, user_id, batch_size=batch_size,
+        progress=lambda result: click.echo(f"{result.inserted} inserted, {result.error_count} errors", err=True)
+    )
+    for error in result.errors:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    if result.error_count > len(result.errors):
+        click.echo(f"... {result.error_count - len(result.errors)} more errors", err=True)
+    click.echo(f"Imported {result.inserted} sightings, skipped {result.error_count} rows")
@@ -0,0 +1,99 @@
+# Response cache for rarely changing data (e.g. the species catalog)
+# Entries are invalidated by model events when the underlying rows change, and
+# by the scripts that write those rows without the ORM (seed.py, reconcile.py).
+# Writes neither sees, such as migrations, show up once an entry's timeout runs
+# out. Values are bytes, so nothing read back from a shared cache is unpickled.
+#
+# Config:
+#   CACHE_URL  unset: in-process cache (per worker)
+#              redis://host:port/db: shared cache so every worker sees the same
+#              entries and invalidations (requires the redis package)
+
+import hashlib
+import threading
+import time
+
+from flask import Response, current_app, request
+
+
+class LocalCache:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (value, expires)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisCache:
+    def __init__(self, url, prefix="firefly:"):
+        # Optional dependency, only needed when CACHE_URL points at redis
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key):
+        return self._client.get(self._prefix + key)
+
+    def set(self, key, value, timeout=None):
+        self._client.set(self._prefix + key, value, ex=timeout)
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+
+
+class Cache:
+    def __init__(self, app=None):
+        self.backend = LocalCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get("CACHE_URL")
+        self.backend = RedisCache(url) if url else LocalCache()
+        app.extensions["cache"] = self
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.backend.set(key, value, timeout)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    # JSON response served from the cache with a strong ETag; requests whose
+    # If-None-Match matches get a 304 without the body being rebuilt or resent.
+    # build() returns the data to serialize and only runs on a cache miss.
+    # The entry is stored as b"<etag> <body>"
+    def json_response(self, key, build, timeout=None):
+        entry = self.get(key)
+        if entry is None:
+            body = current_app.json.response(build()).get_data()
+            entry = hashlib.sha1(body).hexdigest().encode() + b" " + body
+            self.set(key, entry, timeout)
+        etag, body = entry.split(b" ", 1)
+        etag = etag.decode()
+
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        # Browsers may keep the response but must revalidate it each time
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
@@ -0,0 +1,39 @@
+# Map clusters for GET /sightings/clusters
+# Reads the per-cell aggregates kept in sighting_clusters (see models.py) at a
+# geohash precision picked from the map zoom, so a continental view returns a few
+# hundred clusters however many sightings there are
+
+from sqlalchemy import and_, or_, select
+
+from config import db
+from models import SightingCluster
+from geo import covering_ranges
+
+MAX_CLUSTERS = 2000
+MAX_ZOOM = 22
+
+
+# Geohash precision for a web map zoom level: 0-2 -> 1, 3-5 -> 2, ... 15+ -> 6,
+# which keeps a viewport at a few hundred cells
+def precision_for_zoom(zoom):
+    return min(max(zoom // 3 + 1, SightingCluster.PRECISIONS[0]), SightingCluster.PRECISIONS[-1])
+
+
+# (precision, clusters) for a (min_lat, min_lng, max_lat, max_lng) box (or the
+# whole world) at a zoom level, biggest clusters first
+def find_clusters(bbox=None, zoom=0, limit=MAX_CLUSTERS):
+    precision = precision_for_zoom(zoom)
+    query = select(
+        SightingCluster.cell, SightingCluster.count,
+        SightingCluster.latitude_sum, SightingCluster.longitude_sum,
+    ).where(SightingCluster.precision == precision, SightingCluster.count > 0)
+    if bbox is not None:
+        ranges = covering_ranges(*bbox, max_precision=precision)
+        query = query.where(or_(*[and_(SightingCluster.cell >= low, SightingCluster.cell < high) for low, high in ranges]))
+    query = query.order_by(SightingCluster.count.desc(), SightingCluster.cell).limit(limit)
+
+    clusters = [
+        {"cell": cell, "count": count, "latitude": lat_sum / count, "longitude": lng_sum / count}
+        for cell, count, lat_sum, lng_sum in db.session.execute(query)
+    ]
+    return precision, clusters
@@ -0,0 +1,50 @@
+# Conditional GETs for read endpoints built from database rows
+# The endpoint first reads the version and updated_at columns of the rows behind
+# the response (see models.py), one light query, and passes them here with a
+# function that builds the data. When the client's If-None-Match (or, without
+# one, If-Modified-Since) still matches, the answer is a 304 and the rows are
+# never loaded or serialized; otherwise build() runs and the JSON goes out with
+# the weak ETag and Last-Modified for the next request. Cache-Control: no-cache
+# keeps browsers from reusing a response without revalidating it first.
+# benchmarks/conditional.py measures the bytes and time saved per endpoint.
+
+import hashlib
+
+from flask import Response, current_app, request
+
+
+# Weak ETag value for the versions of the rows a response is built from, e.g.
+# row_etag("sighting", sighting_id, sighting_version, user_version)
+# Weak because the body is only equivalent: JSON key order or whitespace may
+# differ between builds of the same rows
+def row_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+# Latest of the rows' updated_at values (naive UTC), or None when none is known
+def last_modified(*timestamps):
+    known = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(known) if known else None
+
+
+def not_modified(etag, modified_at=None):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if modified_at is not None and request.if_modified_since is not None:
+        # HTTP dates have whole seconds
+        return modified_at.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+# 304 when the client's copy is current, otherwise the JSON of build()
+def conditional_json(etag, modified_at, build, status=200):
+    if not_modified(etag, modified_at):
+        response = Response(status=304)
+    else:
+        response = current_app.json.response(build())
+        response.status_code = status
+    response.set_etag(etag, weak=True)
+    if modified_at is not None:
+        response.last_modified = modified_at
+    response.headers["Cache-Control"] = "no-cache"
+    return response
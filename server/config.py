@@ -1,60 +1,133 @@
 #!/usr/bin/env python3
 
+# Settings and extensions
+# The extensions are created here without an app and bound to one by
+# init_extensions(), which app.py's create_app() calls; settings() reads the
+# environment when an app is created rather than when this module is imported.
+
 # Standard library imports
 import os
 
 # Remote library imports
-from flask import Flask
-from flask_migrate import Migrate
+import click
+from flask.cli import ScriptInfo
 from flask_restful import Api
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
-from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 
 # Local imports
-
-# Instantiate app, set attributes
-app = Flask(__name__)
-
-# Configure CORS
-CORS(app, 
-     resources={r"/*": {"origins": "http://localhost:3000"}},
-     supports_credentials=True)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.json.compact = False
-
-# Set the secret key for session management
-app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+import database
+import instrumentation
+from passwords import PasswordHasher
+from cache import Cache
+from uploads import Uploads
+from social_graph import SocialGraph
+from metrics import Metrics
 
 # Define metadata, instantiate db
 metadata = MetaData(naming_convention={
+    "ix": "ix_%(column_0_label)s",
     "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
 })
 db = SQLAlchemy(metadata=metadata)
 
-# Upload folder config
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'uploads')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-# Ensure the upload folder exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].upper() in ALLOWED_EXTENSIONS
-
-# Instantiate bcrypt
-bcrypt = Bcrypt(app)
-
-# Instantiate REST API
-api = Api(app)
-
-# Initialize Flask-Migrate
-migrate = Migrate(app, db)
-
-# Initialize db
-db.init_app(app)
-
+# REST API; app.py adds the resources
+api = Api()
+
+uploads = Uploads()
+password_hasher = PasswordHasher()
+cache = Cache()
+social_graph = SocialGraph()
+request_metrics = Metrics()
+
+
+# App config from the environment
+def settings(environ=os.environ):
+    config = {}
+
+    # Database and engine options come from the environment (see database.py)
+    config['SQLALCHEMY_DATABASE_URI'] = database.database_uri(environ)
+    config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Set the secret key for session management
+    config['SECRET_KEY'] = environ.get('SECRET_KEY', 'your-secret-key-here')
+
+    # Uploads (see uploads.py): request bodies larger than MAX_UPLOAD_MB are
+    # rejected with a 413 before they are read
+    config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'static', 'uploads')
+    config['MAX_CONTENT_LENGTH'] = int(environ.get('MAX_UPLOAD_MB', 10)) * 1024 * 1024
+    if 'UPLOAD_VARIANT_WORKERS' in environ:
+        config['UPLOAD_VARIANT_WORKERS'] = int(environ['UPLOAD_VARIANT_WORKERS'])
+    # Let the front proxy send upload files: x-sendfile or x-accel-redirect
+    config['UPLOAD_SENDFILE'] = environ.get('UPLOAD_SENDFILE')
+    if 'UPLOAD_ACCEL_PREFIX' in environ:
+        config['UPLOAD_ACCEL_PREFIX'] = environ['UPLOAD_ACCEL_PREFIX']
+
+    # POST /sightings/bulk streams its body instead of parsing it as a form, so it
+    # has its own, larger limit
+    config['BULK_IMPORT_MAX_BYTES'] = int(environ.get('BULK_IMPORT_MAX_MB', 512)) * 1024 * 1024
+
+    # Password hashing runs bcrypt in a bounded process pool (see passwords.py)
+    config['BCRYPT_LOG_ROUNDS'] = int(environ.get('BCRYPT_LOG_ROUNDS', 12))
+    if 'PASSWORD_HASH_WORKERS' in environ:
+        config['PASSWORD_HASH_WORKERS'] = int(environ['PASSWORD_HASH_WORKERS'])
+
+    # Response cache; set CACHE_URL (redis://...) to share it between workers
+    config['CACHE_URL'] = environ.get('CACHE_URL')
+
+    # Friend graph held in memory by each worker (see social_graph.py)
+    config['SOCIAL_GRAPH_MAX_EDGES'] = int(environ.get('SOCIAL_GRAPH_MAX_EDGES', 5_000_000))
+    config['SOCIAL_GRAPH_MAX_AGE'] = int(environ.get('SOCIAL_GRAPH_MAX_AGE', 300))
+
+    # Per-route request metrics at /metrics and sampled JSON request logs (see metrics.py)
+    config['METRICS_ENABLED'] = environ.get('METRICS_ENABLED', '1') != '0'
+    config['METRICS_LOG_SAMPLE_RATE'] = float(environ.get('METRICS_LOG_SAMPLE_RATE', 0.01))
+    config['METRICS_SLOW_MS'] = float(environ.get('METRICS_SLOW_MS', 1000))
+    config['METRICS_TOKEN'] = environ.get('METRICS_TOKEN')
+    return config
+
+
+# Bind the extensions to a configured app
+def init_extensions(app):
+    # Configure CORS
+    CORS(app,
+         resources={r"/*": {"origins": "http://localhost:3000"}},
+         expose_headers=["X-Next-After-Id", "X-Next-Before-Id"],
+         supports_credentials=True)
+
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          database.engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    app.json.compact = False
+
+    uploads.init_app(app)
+    password_hasher.init_app(app)
+    cache.init_app(app)
+    api.init_app(app)
+    db.init_app(app)
+    database.init_app(app, db)
+    social_graph.init_app(app, db)
+
+    # Count SQL statements per request and enforce endpoint query budgets
+    instrumentation.init_app(app)
+    request_metrics.init_app(app)
+
+    # flask db ... (Flask-Migrate)
+    app.cli.add_command(migrate_commands)
+
+
+# The "flask db" command group, with Flask-Migrate (and alembic, a good part of
+# the import time) only imported once a db command runs rather than by every
+# server worker
+class _MigrateCommands(click.Group):
+    # Hand the command line to Flask-Migrate's own group
+    def make_context(self, info_name, args, parent=None, **extra):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as commands
+        app = parent.ensure_object(ScriptInfo).load_app()
+        if 'migrate' not in app.extensions:
+            Migrate(app, db)
+        return commands.make_context(info_name, args, parent=parent, **extra)
+
+
+migrate_commands = _MigrateCommands('db', help='Perform database migrations.')
@@ -0,0 +1,143 @@
+# Database engine configuration from the environment, and SQL helpers shared by
+# the models' aggregate tables
+#
+#   DATABASE_URL / SQLALCHEMY_DATABASE_URI   database to use (default sqlite:///app.db)
+#
+# SQLite (pragmas applied to every new connection):
+#   SQLITE_JOURNAL_MODE   default WAL: readers don't block the writer and vice versa
+#   SQLITE_SYNCHRONOUS    default NORMAL: safe with WAL, fsyncs only at checkpoints
+#   SQLITE_BUSY_TIMEOUT   ms to wait for the write lock before "database is locked" (default 5000)
+#   SQLITE_MMAP_SIZE      bytes of the file to memory-map for reads (default 256MB)
+#   SQLITE_CACHE_SIZE     page cache size, negative means KiB (default -64000, ~64MB)
+#
+# Server databases (PostgreSQL, MySQL, ...):
+#   DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+
+import os
+import sqlite3
+
+from sqlalchemy import event, tuple_
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import IntegrityError
+
+DEFAULT_DATABASE_URI = "sqlite:///app.db"
+
+
+def database_uri(environ=os.environ):
+    uri = environ.get("SQLALCHEMY_DATABASE_URI") or environ.get("DATABASE_URL") or DEFAULT_DATABASE_URI
+    # Heroku-style URLs use the scheme SQLAlchemy dropped in 1.4
+    if uri.startswith("postgres://"):
+        uri = "postgresql://" + uri[len("postgres://"):]
+    return uri
+
+
+def sqlite_pragmas(environ=os.environ):
+    return {
+        "journal_mode": environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": int(environ.get("SQLITE_BUSY_TIMEOUT", 5000)),
+        "mmap_size": int(environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        "cache_size": int(environ.get("SQLITE_CACHE_SIZE", -64000)),
+    }
+
+
+def engine_options(uri, environ=os.environ):
+    if make_url(uri).get_backend_name() == "sqlite":
+        # The driver-level timeout covers the time before busy_timeout is set
+        return {"connect_args": {"timeout": sqlite_pragmas(environ)["busy_timeout"] / 1000}}
+    return {
+        "pool_size": int(environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 20)),
+        "pool_timeout": int(environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        # Drop connections the server closed while they sat in the pool
+        "pool_pre_ping": True,
+    }
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+# Apply the pragmas to every SQLite connection this app's engines open (alembic
+# migrations run on them too); called once db is bound to the app. The listeners
+# go on the app's own engines, so apps with other settings keep theirs
+def init_app(app, db):
+    pragmas = app.config.setdefault("SQLITE_PRAGMAS", sqlite_pragmas())
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "connect", set_sqlite_pragmas)
+
+
+# The dialect's insert() with ON CONFLICT support, or None for other databases
+# Imported on first use: the PostgreSQL dialect takes a while to import and
+# SQLite deployments never load it otherwise
+def _upsert_insert(dialect_name):
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert
+
+
+# Add to counter columns of rows keyed by key_columns, creating missing rows
+# rows: dicts with the key columns and the amounts to add to each increment column
+def upsert_increments(connection, table, rows, key_columns, increment_columns):
+    if not rows:
+        return
+    dialect_insert = _upsert_insert(connection.dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[key] for key in key_columns],
+            set_={column: table.c[column] + stmt.excluded[column] for column in increment_columns},
+        )
+        connection.execute(stmt, rows)
+        return
+    # Other databases: update, then insert the rows that didn't exist yet
+    for row in rows:
+        where = [table.c[key] == row[key] for key in key_columns]
+        result = connection.execute(table.update().where(*where).values(
+            {column: table.c[column] + row[column] for column in increment_columns}))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(row))
+
+
+# Insert rows, skipping those that would duplicate a unique key; returns how many
+# were inserted
+def insert_missing(connection, table, rows):
+    if not rows:
+        return 0
+    dialect_insert = _upsert_insert(connection.dialect.name)
+    if dialect_insert is not None:
+        return connection.execute(dialect_insert(table).on_conflict_do_nothing(), rows).rowcount
+    # Other databases: one row at a time, each in a savepoint
+    inserted = 0
+    for row in rows:
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(row))
+            inserted += 1
+        except IntegrityError:
+            pass
+    return inserted
+
+
+# Delete the given rows (by key) whose count_column dropped to zero
+def delete_empty(connection, table, keys, key_columns, count_column):
+    if not keys:
+        return
+    key = tuple_(*[table.c[column] for column in key_columns])
+    connection.execute(table.delete().where(key.in_(list(keys)), table.c[count_column] <= 0))
@@ -0,0 +1,106 @@
+# Sighting export (GET /sightings/export) as NDJSON, CSV or GeoJSON
+# Rows come from a plain Core select read STREAM_BATCH_SIZE at a time (yield_per)
+# and are written out as they arrive, so memory use doesn't grow with the number
+# of rows. The columns match what bulk_import.py reads, so an export can be
+# imported again.
+
+import csv
+import io
+import json
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from config import db
+from models import Sighting, Species
+from streaming import STREAM_BATCH_SIZE, stream_response
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "geojson": "application/geo+json",
+}
+
+COLUMNS = (
+    "id", "observed_on", "latitude", "longitude", "place_guess", "description",
+    "photos", "user_id", "species_id", "scientific_name",
+)
+
+
+# Select the export columns, oldest id first; start and end are inclusive dates
+def export_query(user_id=None, species_id=None, start=None, end=None, bbox=None):
+    stmt = (
+        select(
+            Sighting.id, Sighting.observed_on, Sighting.latitude, Sighting.longitude,
+            Sighting.place_guess, Sighting.description, Sighting.photos,
+            Sighting.user_id, Sighting.species_id, Species.scientific_name,
+        )
+        .outerjoin(Species, Sighting.species_id == Species.id)
+        .order_by(Sighting.id)
+    )
+    if user_id is not None:
+        stmt = stmt.where(Sighting.user_id == user_id)
+    if species_id is not None:
+        stmt = stmt.where(Sighting.species_id == species_id)
+    if start is not None:
+        stmt = stmt.where(Sighting.observed_on >= start)
+    if end is not None:
+        stmt = stmt.where(Sighting.observed_on < end + timedelta(days=1))
+    if bbox is not None:
+        stmt = stmt.where(Sighting.within(*bbox))
+    return stmt
+
+
+def _record(row):
+    record = dict(zip(COLUMNS, row))
+    if record["observed_on"] is not None:
+        record["observed_on"] = record["observed_on"].isoformat()
+    return record
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield _dumps(_record(row)) + "\n"
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for row in rows:
+        record = _record(row)
+        writer.writerow([record[column] for column in COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_geojson(rows):
+    yield '{"type":"FeatureCollection","features":['
+    for index, row in enumerate(rows):
+        record = _record(row)
+        latitude, longitude = record.pop("latitude"), record.pop("longitude")
+        geometry = None
+        if latitude is not None and longitude is not None:
+            geometry = {"type": "Point", "coordinates": [longitude, latitude]}
+        feature = {"type": "Feature", "id": record["id"], "geometry": geometry, "properties": record}
+        yield ("," if index else "") + _dumps(feature)
+    yield "]}"
+
+
+WRITERS = {"ndjson": iter_ndjson, "csv": iter_csv, "geojson": iter_geojson}
+
+
+# Streamed export response for a query built by export_query()
+def export_response(format, stmt):
+    rows = db.session.execute(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+    return stream_response(
+        WRITERS[format](rows),
+        FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=sightings.{format}"},
+    )
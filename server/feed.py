@@ -0,0 +1,46 @@
+# Friend activity feed for GET /feed, newest sightings first
+# Reads the feed rows materialized on write (feed_items, see models.py) and
+# merges in the sightings of friends with too many friends to fan out to, so a
+# page costs one indexed query however many friends the reader has.
+
+from sqlalchemy import select, union
+from sqlalchemy.orm import joinedload
+
+from config import db
+from models import User, Sighting, Friendship, FeedItem
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Feed entries leave out each author's friend lists, which would otherwise be
+# loaded and serialized again for every sighting on the page
+FEED_RULES = ("-user.friendships", "-user.friend_of")
+
+
+# Ids of the next page of a user's feed, newest first, older than before_id
+def feed_sighting_ids(user_id, before_id=None, limit=DEFAULT_PAGE_SIZE):
+    fanned_out = select(FeedItem.sighting_id.label("id")).where(FeedItem.owner_id == user_id)
+    # Friends above the fan-out limit: read their sightings directly
+    high_degree = select(User.id).where(
+        User.id.in_(Friendship.friend_ids(user_id)), User.friend_count > FeedItem.FANOUT_LIMIT)
+    fanned_in = select(Sighting.id).where(Sighting.user_id.in_(high_degree))
+    if before_id is not None:
+        fanned_out = fanned_out.where(FeedItem.sighting_id < before_id)
+        fanned_in = fanned_in.where(Sighting.id < before_id)
+    fanned_out = fanned_out.order_by(FeedItem.sighting_id.desc()).limit(limit).subquery()
+    fanned_in = fanned_in.order_by(Sighting.id.desc()).limit(limit).subquery()
+
+    # UNION drops sightings present in both (an author who crossed the limit)
+    ids = union(select(fanned_out.c.id), select(fanned_in.c.id)).subquery()
+    return db.session.execute(select(ids.c.id).order_by(ids.c.id.desc()).limit(limit)).scalars().all()
+
+
+# (sightings, id to pass as before_id for the next page or None)
+def feed_page(user_id, before_id=None, limit=DEFAULT_PAGE_SIZE):
+    ids = feed_sighting_ids(user_id, before_id, limit)
+    sightings = []
+    if ids:
+        sightings = (Sighting.query.options(joinedload(Sighting.user), joinedload(Sighting.species))
+                     .filter(Sighting.id.in_(ids)).order_by(Sighting.id.desc()).all())
+    next_before_id = ids[-1] if len(ids) == limit else None
+    return sightings, next_before_id
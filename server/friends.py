@@ -0,0 +1,87 @@
+# Mutual friends (GET /friends/mutual/<id>) and "people you may know"
+# (GET /friends/suggestions)
+# Both read the in-memory friend graph (social_graph.py) and fall back to the
+# indexed friendship queries in models.py while it isn't loaded. Suggestions are
+# friends of friends, ranked by mutual friends plus a bonus for seeing fireflies
+# nearby: PROXIMITY_WEIGHT (one mutual friend's worth) for sightings centred in
+# the same place, half that NEARBY_KM apart, and less the further away they are.
+
+from sqlalchemy import func, select
+
+from config import db, social_graph
+from models import User, Sighting, Friendship
+from geo import haversine_km
+
+DEFAULT_MUTUAL = 20
+MAX_MUTUAL = 100
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+
+# Friends of friends ranked by location; the rest have fewer mutual friends
+CANDIDATES = 100
+PROXIMITY_WEIGHT = 1.0
+NEARBY_KM = 50
+
+
+# (number of mutual friends, up to limit of them as {id, username, profile_picture})
+def mutual_friends(user_id, other_id, limit=DEFAULT_MUTUAL):
+    ids = social_graph.mutual_friends(user_id, other_id)
+    if ids is None:
+        ids = sorted(db.session.execute(Friendship.mutual_friend_ids(user_id, other_id)).scalars())
+    friends = []
+    if ids and limit:
+        users = User.__table__
+        rows = {row.id: row for row in db.session.execute(
+            select(users.c.id, users.c.username, users.c.profile_picture).where(users.c.id.in_(ids[:limit])))}
+        friends = [
+            {"id": row.id, "username": row.username, "profile_picture": row.profile_picture}
+            for row in (rows.get(friend_id) for friend_id in ids[:limit]) if row is not None
+        ]
+    return len(ids), friends
+
+
+# Suggested friends, best first, with their mutual friend count and the distance
+# between their sightings and the user's (None when either has none)
+def suggest_friends(user_id, limit=DEFAULT_SUGGESTIONS):
+    candidates = social_graph.friends_of_friends(user_id, CANDIDATES)
+    if candidates is None:
+        candidates = db.session.execute(Friendship.friends_of_friends(user_id).limit(CANDIDATES)).all()
+    if not candidates:
+        return []
+    mutual = dict(candidates)
+
+    # Rough centre of each user's sightings, with their details in the same query
+    sightings = Sighting.__table__
+    users = User.__table__
+    rows = db.session.execute(
+        select(users.c.id, users.c.username, users.c.profile_picture,
+               func.avg(sightings.c.latitude).label("latitude"),
+               func.avg(sightings.c.longitude).label("longitude"))
+        .outerjoin(sightings, sightings.c.user_id == users.c.id)
+        .where(users.c.id.in_([user_id, *mutual]))
+        .group_by(users.c.id, users.c.username, users.c.profile_picture)
+    ).all()
+    centres = {row.id: (row.latitude, row.longitude) for row in rows if row.latitude is not None}
+    home = centres.get(user_id)
+
+    suggestions = []
+    for row in rows:
+        if row.id == user_id:
+            continue
+        distance = None
+        score = mutual[row.id]
+        if home is not None and row.id in centres:
+            distance = haversine_km(*home, *centres[row.id])
+            score += PROXIMITY_WEIGHT / (1 + distance / NEARBY_KM)
+        suggestions.append((score, row, distance))
+    suggestions.sort(key=lambda suggestion: (-suggestion[0], suggestion[1].id))
+    return [
+        {
+            "id": row.id,
+            "username": row.username,
+            "profile_picture": row.profile_picture,
+            "mutual_friends": mutual[row.id],
+            "distance_km": round(distance, 1) if distance is not None else None,
+        }
+        for score, row, distance in suggestions[:limit]
+    ]
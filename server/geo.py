@@ -0,0 +1,164 @@
+# Geospatial helpers for sighting lookups
+# Sightings store a geohash of their coordinates in an indexed column, so a radius
+# search becomes a handful of index range scans followed by an exact distance check
+
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Geohash precision stored on every sighting (~4.8m x 4.8m cells)
+GEOHASH_PRECISION = 9
+
+# Never expand a search into more than this many index ranges
+MAX_COVERING_CELLS = 32
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+# Encode a latitude/longitude pair into a geohash string
+def encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Geohash bits alternate longitude, latitude, longitude, ...
+
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+# Width and height (in degrees) of a geohash cell at the given precision
+def cell_size(precision):
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = (5 * precision) // 2
+    return 360.0 / (1 << lng_bits), 180.0 / (1 << lat_bits)
+
+
+# Great-circle distance in kilometres between two points (haversine formula)
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# Bounding box (min_lat, min_lng, max_lat, max_lng) that contains a circle on the sphere
+# Longitude may fall outside [-180, 180] when the circle crosses the antimeridian;
+# covering_ranges() splits such boxes in two
+def bounding_box(lat, lng, radius_km):
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = lat - d_lat
+    max_lat = lat + d_lat
+
+    # Near the poles the circle spans every longitude
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0
+
+    d_lng = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    if d_lng >= 180:
+        return min_lat, -180.0, max_lat, 180.0
+    return min_lat, lng - d_lng, max_lat, lng + d_lng
+
+
+# Parse a "min_lng,min_lat,max_lng,max_lat" query parameter (GeoJSON order) into
+# (min_lat, min_lng, max_lat, max_lng). A box whose west edge is east of its east
+# edge crosses the antimeridian and gets max_lng > 180, as from bounding_box()
+def parse_bbox(value):
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(","))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat within [-180, 180] x [-90, 90]")
+    if min_lng > max_lng:
+        max_lng += 360
+    return min_lat, min_lng, max_lat, max_lng
+
+
+# Split a bounding box that wraps around the antimeridian into boxes within [-180, 180]
+def _split_antimeridian(min_lat, min_lng, max_lat, max_lng):
+    if min_lng < -180:
+        return [(min_lat, min_lng + 360, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+    if max_lng > 180:
+        return [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng - 360)]
+    return [(min_lat, min_lng, max_lat, max_lng)]
+
+
+# Geohash cells at a given precision that cover a box inside [-180, 180]
+def _cells_for_box(min_lat, min_lng, max_lat, max_lng, precision):
+    width, height = cell_size(precision)
+    # Snap to the cell grid so every cell is visited exactly once
+    lat = math.floor((min_lat + 90) / height) * height - 90
+    cells = set()
+    while lat <= max_lat:
+        lng = math.floor((min_lng + 180) / width) * width - 180
+        while lng <= max_lng:
+            cells.add(encode_geohash(min(lat + height / 2, 90.0), min(lng + width / 2, 180.0), precision))
+            lng += width
+        lat += height
+    return cells
+
+
+# Geohash prefixes covering a bounding box, using the finest precision (up to
+# max_precision) that keeps the number of cells under max_cells
+def covering_cells(min_lat, min_lng, max_lat, max_lng, max_cells=MAX_COVERING_CELLS,
+                   max_precision=GEOHASH_PRECISION):
+    boxes = _split_antimeridian(min_lat, min_lng, max_lat, max_lng)
+    best = None
+    for precision in range(1, max_precision + 1):
+        width, height = cell_size(precision)
+        # Cheap upper bound on the cell count before enumerating anything
+        estimate = sum(
+            (math.ceil((b[2] - b[0]) / height) + 1) * (math.ceil((b[3] - b[1]) / width) + 1)
+            for b in boxes
+        )
+        if estimate > max_cells:
+            break
+        cells = set()
+        for box in boxes:
+            cells |= _cells_for_box(*box, precision)
+        best = cells
+    return sorted(best) if best is not None else [""]
+
+
+# Turn geohash prefixes into (low, high) string ranges usable with a B-tree index:
+# every geohash starting with the prefix sorts in [prefix, prefix + "~")
+def covering_ranges(min_lat, min_lng, max_lat, max_lng, max_cells=MAX_COVERING_CELLS,
+                    max_precision=GEOHASH_PRECISION):
+    ranges = []
+    for prefix in covering_cells(min_lat, min_lng, max_lat, max_lng, max_cells, max_precision):
+        # Neighbouring cells often share a contiguous range; merge them
+        if ranges and _next_prefix(ranges[-1][2]) == prefix:
+            ranges[-1] = (ranges[-1][0], prefix + "~", prefix)
+        else:
+            ranges.append((prefix, prefix + "~", prefix))
+    return [(low, high) for low, high, _ in ranges]
+
+
+# The geohash prefix that immediately follows the given one at the same precision
+def _next_prefix(prefix):
+    if not prefix:
+        return None
+    index = _BASE32.index(prefix[-1])
+    if index == len(_BASE32) - 1:
+        parent = _next_prefix(prefix[:-1])
+        return parent + _BASE32[0] if parent is not None else None
+    return prefix[:-1] + _BASE32[index + 1]
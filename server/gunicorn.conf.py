@@ -0,0 +1,48 @@
+# Gunicorn settings for production: gunicorn -c gunicorn.conf.py wsgi:app
+# Each worker is a process with a pool of request threads (the gthread worker),
+# so a worker keeps serving while some of its requests wait on the database,
+# bcrypt or a slow client, and worker processes use every core.
+#
+# Environment:
+#   PORT                       port to listen on (default 5555)
+#   WEB_CONCURRENCY            worker processes (default: 2 per CPU, plus 1)
+#   GUNICORN_THREADS           request threads per worker (default 4)
+#   GUNICORN_TIMEOUT           seconds a worker may go silent before it's restarted (default 60)
+#   GUNICORN_GRACEFUL_TIMEOUT  seconds to finish in-flight requests on SIGTERM/SIGHUP (default 30)
+#   GUNICORN_MAX_REQUESTS      restart a worker after this many requests, 0 never (default 0)
+#   GUNICORN_PRELOAD           1 imports the app once before forking (default 1)
+#
+# With the app preloaded, imports and app setup happen once in the master and the
+# workers share those pages copy-on-write; set GUNICORN_PRELOAD=0 so a SIGHUP
+# reloads changed code. SIGTERM stops accepting connections and gives in-flight
+# requests GUNICORN_GRACEFUL_TIMEOUT seconds before workers are killed.
+# See benchmarks/throughput.py for req/s by worker count against the dev server.
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5555)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+def post_fork(server, worker):
+    from app import app
+    from config import db, social_graph
+    with app.app_context():
+        # Connections opened in the master belong to it; the worker opens its own
+        db.engine.dispose(close=False)
+    social_graph.warm()
+
+
+# Let background work started by requests finish before the worker exits
+def worker_exit(server, worker):
+    from config import password_hasher, uploads
+    uploads.shutdown()
+    password_hasher.shutdown()
@@ -0,0 +1,124 @@
+# SQL statement counting for requests
+# Every statement sent to the database is counted and timed on flask.g, and
+# endpoints can declare a query budget that must hold no matter how many rows
+# they return. Time spent serializing responses is added up there too.
+# When the budget is enforced (always under app.testing) exceeding it raises, so
+# any test that hits the endpoint fails; otherwise it is logged as a warning.
+
+import logging
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# Count statements on whichever engine runs them, as long as there's an app context
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.sql_statements = g.get("sql_statements", 0) + 1
+        if context is not None:
+            context._started_at = perf_counter()
+
+
+# Statements that fail are counted but not timed
+@event.listens_for(Engine, "after_cursor_execute")
+def _time_statement(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, "_started_at", None)
+    if started_at is not None and has_app_context():
+        g.sql_seconds = g.get("sql_seconds", 0.0) + perf_counter() - started_at
+
+
+# Number of SQL statements run so far in the current app context
+def statement_count():
+    return g.get("sql_statements", 0)
+
+
+# Seconds spent executing them
+def statement_seconds():
+    return g.get("sql_seconds", 0.0)
+
+
+# Add time spent serializing (models to dicts, dicts to JSON)
+def add_serialization_time(seconds):
+    if has_app_context():
+        g.serialization_seconds = g.get("serialization_seconds", 0.0) + seconds
+
+
+def serialization_seconds():
+    return g.get("serialization_seconds", 0.0)
+
+
+# Count the statements run inside a block:
+#   with count_queries() as counter:
+#       ...
+#   assert counter.count <= 3
+class _Counter:
+    def __init__(self):
+        self.start = statement_count()
+        self.end = None
+
+    @property
+    def count(self):
+        return (self.end if self.end is not None else statement_count()) - self.start
+
+
+@contextmanager
+def count_queries():
+    counter = _Counter()
+    try:
+        yield counter
+    finally:
+        counter.end = statement_count()
+
+
+# Fail (or warn) when the block runs more than max_statements statements
+@contextmanager
+def assert_max_queries(max_statements, label="block"):
+    with count_queries() as counter:
+        yield counter
+    _check(counter.count, max_statements, label)
+
+
+# Decorator for Resource methods: the whole request, including a streamed
+# response body, may run at most max_statements statements. Streamed responses
+# re-run their eager loads for every batch of rows fetched, so they may also spend
+# per_batch statements on each batch after the first
+def query_budget(max_statements, per_batch=0):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            g.query_budget = (max_statements, per_batch)
+            return method(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _check(count, max_statements, label):
+    if count <= max_statements:
+        return
+    message = f"{label} ran {count} SQL statements (budget {max_statements})"
+    if current_app.config.get("QUERY_BUDGET_ENFORCE", current_app.testing):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+# Check the budget once the request is over; for streamed responses this runs
+# after the last chunk has been generated
+def init_app(app):
+    @app.teardown_request
+    def check_query_budget(exc):
+        budget = g.get("query_budget")
+        if budget is not None and exc is None:
+            max_statements, per_batch = budget
+            extra_batches = max(g.get("stream_batches", 1) - 1, 0)
+            _check(statement_count(), max_statements + per_batch * extra_batches, f"{request.method} {request.path}")
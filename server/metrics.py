@@ -0,0 +1,233 @@
+# Request metrics: wall time, SQL statements and time, serialization time and
+# response size for every request, by route
+# Totals are kept in memory and served in the Prometheus text format at
+# GET /metrics. A sample of requests, plus every slow or failed one, is also
+# logged as one JSON object per line on the "metrics" logger. Recording a request
+# is a few counter updates; the logging is what the sampling keeps cheap.
+#
+# Config:
+#   METRICS_ENABLED          False turns off recording, logging and /metrics
+#   METRICS_LOG_SAMPLE_RATE  fraction of requests logged (default 0.01)
+#   METRICS_SLOW_MS          requests taking at least this long are always
+#                            logged (default 1000)
+#   METRICS_TOKEN            when set, /metrics requires "Authorization: Bearer <token>"
+#
+# Totals are per process: with several server workers, each scrape of /metrics
+# sees the worker that answered it, identified by the "worker" label.
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from time import perf_counter
+
+from flask import Response, abort, g, request
+from flask.json.provider import DefaultJSONProvider
+
+from instrumentation import add_serialization_time, serialization_seconds, statement_count, statement_seconds
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# dicts to JSON count as serialization time, like models to dicts
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        started_at = perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            add_serialization_time(perf_counter() - started_at)
+
+
+class _RouteTotals:
+    def __init__(self):
+        self.statuses = {}
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.response_bytes = 0
+
+
+class _Request:
+    def __init__(self):
+        self.started_at = perf_counter()
+        self.sql_statements = statement_count()
+        self.sql_seconds = statement_seconds()
+        self.serialization_seconds = serialization_seconds()
+        self.status = None
+        self.response_bytes = 0
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.sample_rate = 0.01
+        self.slow_seconds = 1.0
+        self.token = None
+        self._routes = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("METRICS_ENABLED", True)
+        self.sample_rate = float(app.config.get("METRICS_LOG_SAMPLE_RATE", 0.01))
+        self.slow_seconds = float(app.config.get("METRICS_SLOW_MS", 1000)) / 1000
+        self.token = app.config.get("METRICS_TOKEN")
+        app.extensions["metrics"] = self
+        if not self.enabled:
+            return
+
+        if type(app.json) is DefaultJSONProvider:
+            # Same output as the provider it replaces (config.py turns compact off)
+            timed = TimedJSONProvider(app)
+            for setting in ("compact", "sort_keys", "ensure_ascii", "mimetype"):
+                setattr(timed, setting, getattr(app.json, setting))
+            app.json = timed
+        # One JSON object per line, whatever the root logger's format is
+        if not logger.handlers:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        # After the last chunk of a streamed response (see streaming.py)
+        app.teardown_request(self._record)
+        app.add_url_rule("/metrics", "metrics", self.view)
+
+    def _start(self):
+        g.metrics = _Request()
+
+    def _finish(self, response):
+        current = g.get("metrics")
+        if current is None:
+            return response
+        current.status = response.status_code
+        if response.content_length is not None:
+            current.response_bytes = response.content_length
+        elif response.is_streamed:
+            response.response = _count_bytes(response.response, current, response.charset)
+        return response
+
+    def _record(self, exc):
+        current = g.pop("metrics", None)
+        if current is None:
+            return
+        seconds = perf_counter() - current.started_at
+        status = current.status if current.status is not None else 500
+        method = request.method
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        sql_statements = statement_count() - current.sql_statements
+        sql_seconds = statement_seconds() - current.sql_seconds
+        serialization = serialization_seconds() - current.serialization_seconds
+
+        with self._lock:
+            totals = self._routes.get((method, route))
+            if totals is None:
+                totals = self._routes[(method, route)] = _RouteTotals()
+            totals.statuses[status] = totals.statuses.get(status, 0) + 1
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    totals.buckets[index] += 1
+                    break
+            totals.count += 1
+            totals.seconds += seconds
+            totals.sql_statements += sql_statements
+            totals.sql_seconds += sql_seconds
+            totals.serialization_seconds += serialization
+            totals.response_bytes += current.response_bytes
+
+        if seconds >= self.slow_seconds or status >= 500 or random.random() < self.sample_rate:
+            logger.info(json.dumps({
+                "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "method": method,
+                "route": route,
+                "path": request.path,
+                "status": status,
+                "duration_ms": round(seconds * 1000, 2),
+                "sql_statements": sql_statements,
+                "sql_ms": round(sql_seconds * 1000, 2),
+                "serialization_ms": round(serialization * 1000, 2),
+                "response_bytes": current.response_bytes,
+            }, separators=(",", ":")))
+
+    # GET /metrics
+    def view(self):
+        if self.token and request.headers.get("Authorization") != f"Bearer {self.token}":
+            abort(401)
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+    # Prometheus text exposition format
+    def render(self):
+        with self._lock:
+            routes = sorted(self._routes.items())
+            snapshot = [(key, totals.statuses.copy(), list(totals.buckets), totals.count, totals.seconds,
+                         totals.sql_statements, totals.sql_seconds, totals.serialization_seconds,
+                         totals.response_bytes) for key, totals in routes]
+        worker = f'worker="{os.getpid()}"'
+        lines = [
+            "# HELP http_requests_total Requests handled, by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route), statuses, *_ in snapshot:
+            for status, count in sorted(statuses.items()):
+                lines.append(f'http_requests_total{{{_labels(method, route)},status="{status}",{worker}}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Wall time from the start of the request to the last byte generated.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), _, buckets, count, seconds, *_ in snapshot:
+            labels = f"{_labels(method, route)},{worker}"
+            cumulative = 0
+            for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {seconds:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {count}")
+
+        counters = [
+            ("http_request_sql_statements_total", "SQL statements run by requests.", 5, "{}"),
+            ("http_request_sql_seconds_total", "Time spent executing SQL statements.", 6, "{:.6f}"),
+            ("http_request_serialization_seconds_total",
+             "Time spent turning models into dicts and dicts into JSON.", 7, "{:.6f}"),
+            ("http_response_bytes_total", "Response body bytes sent.", 8, "{}"),
+        ]
+        for name, description, field, value_format in counters:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            for entry in snapshot:
+                (method, route) = entry[0]
+                lines.append(f"{name}{{{_labels(method, route)},{worker}}} {value_format.format(entry[field])}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(method, route):
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+
+# Pass a streamed body through, counting its size as it's sent
+def _count_bytes(chunks, current, charset):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            current.response_bytes += len(chunk)
+            yield chunk
+    finally:
+        # A client that disconnects early must still end the request context
+        # stream_with_context() holds
+        if hasattr(chunks, "close"):
+            chunks.close()
@@ -0,0 +1,38 @@
+"""add daily sighting count rollup
+
+Revision ID: 2d8c6a4f0b97
+Revises: 7b3d9e1f4a62
+Create Date: 2026-10-17 15:21:07.604139
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d8c6a4f0b97'
+down_revision = '7b3d9e1f4a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sighting_daily_counts',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('species_id', sa.Integer(), nullable=False),
+    sa.Column('cell', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'species_id', 'cell')
+    )
+
+    # Backfill from the existing sightings (geohash cells of 4 characters)
+    op.execute("""
+        INSERT INTO sighting_daily_counts (day, species_id, cell, count)
+        SELECT date(observed_on), coalesce(species_id, 0), coalesce(substr(geohash, 1, 4), ''), count(*)
+        FROM sightings WHERE observed_on IS NOT NULL
+        GROUP BY date(observed_on), coalesce(species_id, 0), coalesce(substr(geohash, 1, 4), '')
+    """)
+
+
+def downgrade():
+    op.drop_table('sighting_daily_counts')
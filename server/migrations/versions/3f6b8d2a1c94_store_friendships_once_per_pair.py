@@ -0,0 +1,55 @@
+"""store friendships once per pair
+
+Revision ID: 3f6b8d2a1c94
+Revises: 9e4a1c7b5d23
+Create Date: 2026-10-17 18:21:40.512903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6b8d2a1c94'
+down_revision = '9e4a1c7b5d23'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Collapse each pair of rows (a, b) and (b, a) into the row with the lower
+    # user id first, and flip one-way rows into that order
+    op.execute("DELETE FROM friendships WHERE user_id = friend_id")
+    op.execute("""
+        DELETE FROM friendships WHERE user_id > friend_id AND EXISTS (
+            SELECT 1 FROM friendships AS reverse
+            WHERE reverse.user_id = friendships.friend_id AND reverse.friend_id = friendships.user_id
+        )
+    """)
+    op.execute("""
+        UPDATE friendships SET user_id = friend_id, friend_id = user_id
+        WHERE user_id > friend_id
+    """)
+    # A user's friends are now on either side of the pair
+    op.execute("""
+        UPDATE users SET friend_count = (
+            SELECT count(*) FROM friendships WHERE friendships.user_id = users.id
+        ) + (
+            SELECT count(*) FROM friendships WHERE friendships.friend_id = users.id
+        )
+    """)
+
+    with op.batch_alter_table('friendships', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_friendships_friend_id'))
+        batch_op.create_index('ix_friendships_friend_id_user_id', ['friend_id', 'user_id'], unique=False)
+        batch_op.create_check_constraint('ck_friendships_ordered_pair', 'user_id < friend_id')
+
+
+def downgrade():
+    with op.batch_alter_table('friendships', schema=None) as batch_op:
+        batch_op.drop_constraint('ck_friendships_ordered_pair', type_='check')
+        batch_op.drop_index('ix_friendships_friend_id_user_id')
+        batch_op.create_index(batch_op.f('ix_friendships_friend_id'), ['friend_id'], unique=False)
+
+    # Back to one row per direction
+    op.execute("INSERT INTO friendships (user_id, friend_id) SELECT friend_id, user_id FROM friendships")
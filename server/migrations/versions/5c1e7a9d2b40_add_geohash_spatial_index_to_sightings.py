@@ -0,0 +1,49 @@
+"""add geohash spatial index to sightings
+
+Revision ID: 5c1e7a9d2b40
+Revises: 087cfb7993ac
+Create Date: 2026-10-17 09:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from geo import encode_geohash
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e7a9d2b40'
+down_revision = '087cfb7993ac'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sightings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geohash', sa.String(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_sightings_geohash'), ['geohash'], unique=False)
+
+    # Backfill geohashes for existing sightings with coordinates
+    sightings = sa.table('sightings',
+        sa.column('id', sa.Integer),
+        sa.column('latitude', sa.Float),
+        sa.column('longitude', sa.Float),
+        sa.column('geohash', sa.String))
+    conn = op.get_bind()
+    rows = conn.execute(
+        sa.select(sightings.c.id, sightings.c.latitude, sightings.c.longitude)
+        .where(sightings.c.latitude.isnot(None), sightings.c.longitude.isnot(None))
+    ).all()
+    if rows:
+        conn.execute(
+            sightings.update()
+            .where(sightings.c.id == sa.bindparam('sighting_id'))
+            .values(geohash=sa.bindparam('new_geohash')),
+            [{'sighting_id': row.id, 'new_geohash': encode_geohash(row.latitude, row.longitude)} for row in rows]
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('sightings', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sightings_geohash'))
+        batch_op.drop_column('geohash')
@@ -0,0 +1,44 @@
+"""add version and updated_at to users and sightings
+
+Revision ID: 6e2a9c4f7d15
+Revises: 3f6b8d2a1c94
+Create Date: 2026-10-17 20:14:52.408117
+
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e2a9c4f7d15'
+down_revision = '3f6b8d2a1c94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('sightings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # Existing rows count as changed now (naive UTC, like the models' default)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for table in ('users', 'sightings'):
+        op.execute(sa.text(f"UPDATE {table} SET updated_at = :now").bindparams(
+            sa.bindparam('now', now, type_=sa.DateTime())))
+
+
+def downgrade():
+    with op.batch_alter_table('sightings', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
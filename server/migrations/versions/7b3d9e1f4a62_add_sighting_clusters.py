@@ -0,0 +1,40 @@
+"""add sighting cluster aggregates
+
+Revision ID: 7b3d9e1f4a62
+Revises: e4b92a7c3d18
+Create Date: 2026-10-17 14:08:31.226804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3d9e1f4a62'
+down_revision = 'e4b92a7c3d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sighting_clusters',
+    sa.Column('precision', sa.Integer(), nullable=False),
+    sa.Column('cell', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('latitude_sum', sa.Float(), nullable=False),
+    sa.Column('longitude_sum', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('precision', 'cell')
+    )
+
+    # Backfill one row per geohash prefix of precisions 1 to 6
+    for precision in range(1, 7):
+        op.execute(f"""
+            INSERT INTO sighting_clusters (precision, cell, count, latitude_sum, longitude_sum)
+            SELECT {precision}, substr(geohash, 1, {precision}), count(*), sum(latitude), sum(longitude)
+            FROM sightings WHERE geohash IS NOT NULL
+            GROUP BY substr(geohash, 1, {precision})
+        """)
+
+
+def downgrade():
+    op.drop_table('sighting_clusters')
@@ -0,0 +1,51 @@
+"""add friend activity feed
+
+Revision ID: 9e4a1c7b5d23
+Revises: 2d8c6a4f0b97
+Create Date: 2026-10-17 16:47:12.318570
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4a1c7b5d23'
+down_revision = '2d8c6a4f0b97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('feed_items',
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('sighting_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], name=op.f('fk_feed_items_author_id_users')),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], name=op.f('fk_feed_items_owner_id_users')),
+    sa.ForeignKeyConstraint(['sighting_id'], ['sightings.id'], name=op.f('fk_feed_items_sighting_id_sightings')),
+    sa.PrimaryKeyConstraint('owner_id', 'sighting_id')
+    )
+    with op.batch_alter_table('feed_items', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_feed_items_sighting_id'), ['sighting_id'], unique=False)
+
+    # Backfill each feed with the latest 50 sightings of every friend with at
+    # most 1000 friends (FeedItem.BACKFILL and FeedItem.FANOUT_LIMIT)
+    op.execute("""
+        INSERT INTO feed_items (owner_id, sighting_id, author_id)
+        SELECT friendships.friend_id, recent.id, recent.user_id
+        FROM friendships
+        JOIN (
+            SELECT id, user_id, row_number() OVER (PARTITION BY user_id ORDER BY id DESC) AS position
+            FROM sightings
+        ) AS recent ON recent.user_id = friendships.user_id
+        JOIN users ON users.id = friendships.user_id
+        WHERE recent.position <= 50 AND users.friend_count <= 1000
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('feed_items', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_feed_items_sighting_id'))
+
+    op.drop_table('feed_items')
@@ -0,0 +1,38 @@
+"""add denormalized counter columns to users
+
+Revision ID: a3f08c6d1e27
+Revises: 5c1e7a9d2b40
+Create Date: 2026-10-17 10:02:18.771954
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f08c6d1e27'
+down_revision = '5c1e7a9d2b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sighting_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('friend_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('last_sighting_at', sa.DateTime(), nullable=True))
+
+    # Backfill from the existing sightings and friendships
+    op.execute("""
+        UPDATE users SET
+            sighting_count = (SELECT count(*) FROM sightings WHERE sightings.user_id = users.id),
+            last_sighting_at = (SELECT max(observed_on) FROM sightings WHERE sightings.user_id = users.id),
+            friend_count = (SELECT count(*) FROM friendships WHERE friendships.user_id = users.id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('last_sighting_at')
+        batch_op.drop_column('friend_count')
+        batch_op.drop_column('sighting_count')
@@ -0,0 +1,51 @@
+"""add secondary indexes and unique friendship pairs
+
+Revision ID: c71d4e2f9a85
+Revises: a3f08c6d1e27
+Create Date: 2026-10-17 10:48:05.126630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71d4e2f9a85'
+down_revision = 'a3f08c6d1e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sightings', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sightings_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_sightings_species_id'), ['species_id'], unique=False)
+        batch_op.create_index('ix_sightings_observed_on_id', ['observed_on', 'id'], unique=False)
+
+    # Drop duplicate friendship rows so the pair can be made unique
+    op.execute("""
+        DELETE FROM friendships WHERE id NOT IN (
+            SELECT min(id) FROM friendships GROUP BY user_id, friend_id
+        )
+    """)
+    # friend_count includes the duplicates that were just removed
+    op.execute("""
+        UPDATE users SET friend_count = (
+            SELECT count(*) FROM friendships WHERE friendships.user_id = users.id
+        )
+    """)
+
+    with op.batch_alter_table('friendships', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_friendships_friend_id'), ['friend_id'], unique=False)
+        batch_op.create_unique_constraint('uq_friendships_user_id_friend_id', ['user_id', 'friend_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('friendships', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_friendships_user_id_friend_id', type_='unique')
+        batch_op.drop_index(batch_op.f('ix_friendships_friend_id'))
+
+    with op.batch_alter_table('sightings', schema=None) as batch_op:
+        batch_op.drop_index('ix_sightings_observed_on_id')
+        batch_op.drop_index(batch_op.f('ix_sightings_species_id'))
+        batch_op.drop_index(batch_op.f('ix_sightings_user_id'))
@@ -0,0 +1,55 @@
+"""add username search index
+
+Revision ID: e4b92a7c3d18
+Revises: c71d4e2f9a85
+Create Date: 2026-10-17 11:35:52.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b92a7c3d18'
+down_revision = 'c71d4e2f9a85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_name', sa.String(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_users_search_name'), ['search_name'], unique=False)
+
+    username_trigrams = op.create_table('username_trigrams',
+    sa.Column('trigram', sa.String(length=3), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_username_trigrams_user_id_users')),
+    sa.PrimaryKeyConstraint('trigram', 'user_id')
+    )
+    with op.batch_alter_table('username_trigrams', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_username_trigrams_user_id'), ['user_id'], unique=False)
+
+    # Backfill the index for existing users (lowercased in Python, like the model events)
+    conn = op.get_bind()
+    users = conn.execute(sa.text("SELECT id, username FROM users")).all()
+    names = [{'user_id': user_id, 'name': (username or "").lower()} for user_id, username in users]
+    if names:
+        conn.execute(sa.text("UPDATE users SET search_name = :name WHERE id = :user_id"), names)
+    rows = [
+        {'trigram': trigram, 'user_id': row['user_id']}
+        for row in names
+        for trigram in {row['name'][i:i + 3] for i in range(len(row['name']) - 2)}
+    ]
+    if rows:
+        op.bulk_insert(username_trigrams, rows)
+
+
+def downgrade():
+    with op.batch_alter_table('username_trigrams', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_username_trigrams_user_id'))
+
+    op.drop_table('username_trigrams')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_search_name'))
+        batch_op.drop_column('search_name')
@@ -1,15 +1,37 @@
-# Using Flask for the web app, SQLAlchemy for the database, and Flask-Bcrypt for password hashing
+# Using Flask for the web app, SQLAlchemy for the database, and bcrypt for password hashing
 # SerializerMixin is used to serialize the data (turned into JSON or dict)
-from sqlalchemy_serializer import SerializerMixin
+# CompiledSerializerMixin keeps its output but precompiles the serialize_rules
+from serializers import CompiledSerializerMixin, get_serializer
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.orm import validates
-# Bcrypt is used to hash the password
-from flask_bcrypt import Bcrypt
-# Config is used to get the database and bcrypt
-from config import db, bcrypt
+from sqlalchemy.orm import Session, validates, joinedload, selectinload, object_session
+from datetime import datetime, timezone
+from sqlalchemy import event, and_, or_, case, func, literal, select, true, tuple_, union_all
+# Config is used to get the database and the password hasher (bcrypt in a process pool)
+from config import db, password_hasher, cache, social_graph
+# Geohash encoding for the spatial index on sightings
+from geo import encode_geohash, bounding_box, covering_ranges, haversine_km
+# Upserts for the aggregate tables kept by model events
+from database import upsert_increments, delete_empty
+# URLs of the resized copies of uploaded images
+from uploads import variant_urls
+
+# Row versions for conditional GETs (see conditional.py): version goes up and
+# updated_at (naive UTC) moves on every UPDATE of the row, ORM or Core, through the
+# columns' onupdate. A user's version covers everything User.to_dict() nests and
+# a sighting's covers the sighting and its species (its user has its own); the
+# events at the end of this file bump them when only the nested rows change
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _version_column():
+    return db.Column(db.Integer, nullable=False, default=1, server_default="1",
+                     onupdate=db.literal_column("version") + 1)
+
+def _updated_at_column():
+    return db.Column(db.DateTime, default=_utcnow, onupdate=_utcnow)
 
 # 4 Main Models: User, Sighting, Species, Friendship
-class User(db.Model, SerializerMixin): 
+class User(db.Model, CompiledSerializerMixin): 
     __tablename__ = "users"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -20,6 +42,18 @@ class User(db.Model, SerializerMixin):
     profile_picture = db.Column(db.String)
     # password_digest = db.Column(db.String, nullable=False)
 
+    # Lowercased username for case-insensitive prefix search (see search.py)
+    search_name = db.Column(db.String, index=True)
+
+    # Denormalized stats for the profile page, maintained by the model events below
+    sighting_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    friend_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_sighting_at = db.Column(db.DateTime)
+
+    # Bumped by any change to the user, their sightings or their friendships
+    version = _version_column()
+    updated_at = _updated_at_column()
+
     # Update serialization rules to prevent circular references
     # and ensures that the password hash is not included in the serialized data
     serialize_rules = (
@@ -28,20 +62,40 @@ class User(db.Model, SerializerMixin):
         "-friend_of.friend",
         "-_password_hash",
         "-friendships.friend",
-        "-friend_of.user"
+        "-friend_of.user",
+        "-search_name",
+        "-version",
+        "-updated_at",
+        "profile_picture_variants"
     )
     
     # One user can have many sightings
     sightings = db.relationship("Sighting", back_populates="user")
-    # User's friendships where they are the user
+    # Each friendship is stored once (see Friendship), so a user's friendships
+    # are split between these two: the ones where they have the lower id...
     friendships = db.relationship("Friendship", 
                                 foreign_keys="Friendship.user_id",
                                 back_populates="user")
-    # User's friendships where they are the friend
+    # ...and the ones where they have the higher id
     friend_of = db.relationship("Friendship",
                               foreign_keys="Friendship.friend_id",
                               back_populates="friend")
 
+    # Eager loads for everything to_dict() serializes, so a list of users costs
+    # a fixed number of queries instead of several per user
+    @classmethod
+    def serialize_options(cls):
+        return (
+            selectinload(cls.sightings).joinedload(Sighting.species),
+            selectinload(cls.friendships),
+            selectinload(cls.friend_of),
+        )
+
+    # Thumbnail/medium/original URLs of the profile picture
+    @property
+    def profile_picture_variants(self):
+        return variant_urls(self.profile_picture)
+
     # Python property to get the password hash
     @property
     def password_hash(self):
@@ -50,17 +104,73 @@ class User(db.Model, SerializerMixin):
     # Python property to set the password hash
     @password_hash.setter
     def password_hash(self, password):
-        self._password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self._password_hash = password_hasher.hash(password)
 
     # Method to authenticate the user
+    # A hash made with an older bcrypt cost is replaced on a successful login;
+    # the caller commits the session
     def authenticate(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        if not password_hasher.verify(password, self.password_hash):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.password_hash = password
+        return True
 
     def __repr__(self):
         return f"<User {self.username}, {self.email}>"
+
+# Trigram index over usernames for substring search (see search.py)
+# One row per distinct 3-character window of the lowercased username
+class UsernameTrigram(db.Model):
+    __tablename__ = "username_trigrams"
+
+    trigram = db.Column(db.String(3), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True, index=True)
+
+    @staticmethod
+    def trigrams(name):
+        name = name.lower()
+        return {name[i:i + 3] for i in range(len(name) - 2)}
+
+@event.listens_for(User, "before_insert")
+@event.listens_for(User, "before_update")
+def update_user_search_name(mapper, connection, user):
+    user.search_name = user.username.lower() if user.username else None
+
+# Rewrite a user's trigram rows when they are created or renamed
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+def update_username_trigrams(mapper, connection, user):
+    if not db.inspect(user).attrs.username.history.has_changes():
+        return
+    reindex_usernames(connection, [(user.id, user.username)])
+
+@event.listens_for(User, "after_delete")
+def delete_username_trigrams(mapper, connection, user):
+    trigrams = UsernameTrigram.__table__
+    connection.execute(trigrams.delete().where(trigrams.c.user_id == user.id))
+
+# Replace the trigram rows of the given (user_id, username) pairs
+def reindex_usernames(connection, users):
+    trigrams = UsernameTrigram.__table__
+    users = list(users)
+    if not users:
+        return
+    connection.execute(trigrams.delete().where(trigrams.c.user_id.in_([user_id for user_id, _ in users])))
+    rows = [
+        {"trigram": trigram, "user_id": user_id}
+        for user_id, username in users if username
+        for trigram in UsernameTrigram.trigrams(username)
+    ]
+    if rows:
+        connection.execute(trigrams.insert(), rows)
     
-class Sighting(db.Model, SerializerMixin):
+class Sighting(db.Model, CompiledSerializerMixin):
     __tablename__ = "sightings"
+    __table_args__ = (
+        # Keyset pagination order (see stable_order)
+        db.Index("ix_sightings_observed_on_id", "observed_on", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     # Place guess is the place the user guessed the species was seen
@@ -71,19 +181,105 @@ class Sighting(db.Model, SerializerMixin):
     # Latitude and longitude are the actual coordinates of the sighting
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
-    species_id = db.Column(db.Integer, db.ForeignKey("species.id"))
+    # Geohash of the coordinates, kept in sync by the model events below (spatial index)
+    geohash = db.Column(db.String, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), index=True)
+    species_id = db.Column(db.Integer, db.ForeignKey("species.id"), index=True)
+
+    # Bumped by any change to the sighting or its species
+    version = _version_column()
+    updated_at = _updated_at_column()
 
     # One sighting belongs to one user and one species
     user = db.relationship("User", back_populates="sightings")
     species = db.relationship("Species", back_populates="sightings")
 
-    serialize_rules = ('-user.sightings', '-species.sightings')
+    serialize_rules = ('-user.sightings', '-species.sightings', '-geohash', '-version', '-updated_at',
+                       'photo_variants')
+
+    # Thumbnail/medium/original URLs of the photo
+    @property
+    def photo_variants(self):
+        return variant_urls(self.photos)
+
+    # SQL filter for sightings that may lie within radius_km of a point
+    # Uses index range scans on the geohash column plus a latitude band; candidates
+    # still need the exact distance_km() check
+    @classmethod
+    def near(cls, lat, lng, radius_km):
+        min_lat, min_lng, max_lat, max_lng = bounding_box(lat, lng, radius_km)
+        ranges = covering_ranges(min_lat, min_lng, max_lat, max_lng)
+        return and_(
+            or_(*[and_(cls.geohash >= low, cls.geohash < high) for low, high in ranges]),
+            cls.latitude.between(min_lat, max_lat)
+        )
+
+    # SQL filter for sightings inside a bounding box (see geo.parse_bbox)
+    @classmethod
+    def within(cls, min_lat, min_lng, max_lat, max_lng):
+        ranges = covering_ranges(min_lat, min_lng, max_lat, max_lng)
+        if max_lng > 180:
+            longitude = or_(cls.longitude >= min_lng, cls.longitude <= max_lng - 360)
+        else:
+            longitude = cls.longitude.between(min_lng, max_lng)
+        return and_(
+            or_(*[and_(cls.geohash >= low, cls.geohash < high) for low, high in ranges]),
+            cls.latitude.between(min_lat, max_lat),
+            longitude
+        )
+
+    # Eager loads for what to_dict() serializes (user with their friendships, as
+    # bare rows, and species); pass the requested fields to skip relationships
+    # that aren't needed
+    @classmethod
+    def serialize_options(cls, fields=None):
+        options = []
+        if not fields or "user" in fields:
+            options += [
+                joinedload(cls.user).selectinload(User.friendships),
+                joinedload(cls.user).selectinload(User.friend_of),
+            ]
+        if not fields or "species" in fields:
+            options.append(joinedload(cls.species))
+        return tuple(options)
+
+    # Stable ordering used for keyset pagination
+    @classmethod
+    def stable_order(cls):
+        return (cls.observed_on.asc().nulls_first(), cls.id.asc())
+
+    # SQL filter for rows that come after (observed_on, id) in stable_order()
+    @classmethod
+    def after(cls, observed_on, id):
+        if observed_on is None:
+            return or_(cls.observed_on.isnot(None), and_(cls.observed_on.is_(None), cls.id > id))
+        # Row-value comparison so the database can seek straight into the
+        # (observed_on, id) index instead of walking it from the start
+        return tuple_(cls.observed_on, cls.id) > tuple_(literal(observed_on, db.DateTime), literal(id))
+
+    # Fields clients may ask for with ?fields=
+    @classmethod
+    def public_fields(cls):
+        return ({attr.key for attr in db.inspect(cls).attrs} - {"geohash", "version", "updated_at"}) | {"photo_variants"}
+
+    # Great-circle distance from this sighting to a point
+    def distance_km(self, lat, lng):
+        return haversine_km(self.latitude, self.longitude, lat, lng)
 
     def __repr__(self):
         return f"<Sighting {self.id} - Location: {self.place_guess}, Timestamp: {self.observed_on}>"
+
+# Keep the geohash column in sync with the coordinates on insert and update
+@event.listens_for(Sighting, "before_insert")
+@event.listens_for(Sighting, "before_update")
+def update_sighting_geohash(mapper, connection, sighting):
+    try:
+        sighting.geohash = encode_geohash(float(sighting.latitude), float(sighting.longitude))
+    except (TypeError, ValueError):
+        # Missing or non-numeric coordinates can't be indexed
+        sighting.geohash = None
     
-class Species(db.Model, SerializerMixin):
+class Species(db.Model, CompiledSerializerMixin):
     __tablename__ = "species"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -94,11 +290,35 @@ class Species(db.Model, SerializerMixin):
     # One species can have many sightings
     sightings = db.relationship("Sighting", back_populates="species")
 
+    # Cache key, timeout (seconds) and fields of the species catalog served by GET /species
+    CATALOG_CACHE_KEY = "species:catalog"
+    CATALOG_CACHE_TIMEOUT = 300
+    catalog_fields = ("id", "name", "type", "scientific_name")
+
     def __repr__(self):
         return f"<Species: {self.name}, Type: {self.type}, Scientific Name: {self.scientific_name}>"
 
-class Friendship(db.Model, SerializerMixin):
+# Drop the cached species catalog whenever a species is added, changed or removed
+# The entry is dropped again after commit, so a request that re-cached the old
+# catalog between the flush and the commit can't keep it alive
+@event.listens_for(Species, "after_insert")
+@event.listens_for(Species, "after_update")
+@event.listens_for(Species, "after_delete")
+def invalidate_species_catalog(mapper, connection, species):
+    cache.delete(Species.CATALOG_CACHE_KEY)
+    session = object_session(species)
+    if session is not None:
+        event.listen(session, "after_commit", lambda session: cache.delete(Species.CATALOG_CACHE_KEY), once=True)
+
+class Friendship(db.Model, CompiledSerializerMixin):
     __tablename__ = "friendships"
+    __table_args__ = (
+        # One row per pair of friends, lower user id first (see pair()); the
+        # unique index serves lookups by user_id and the other one by friend_id
+        db.UniqueConstraint("user_id", "friend_id", name="uq_friendships_user_id_friend_id"),
+        db.Index("ix_friendships_friend_id_user_id", "friend_id", "user_id"),
+        db.CheckConstraint("user_id < friend_id", name="ck_friendships_ordered_pair"),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
@@ -120,5 +340,448 @@ class Friendship(db.Model, SerializerMixin):
         "-friend.friend_of",
     )
     
+    # New friendship between two users, in stored order
+    @classmethod
+    def pair(cls, user_id, other_id):
+        return cls(user_id=min(user_id, other_id), friend_id=max(user_id, other_id))
+
+    # SQL filter for the friendship between two users
+    @classmethod
+    def between(cls, user_id, other_id):
+        return and_(cls.user_id == min(user_id, other_id), cls.friend_id == max(user_id, other_id))
+
+    # Ids of a user's friends (SQL select of an "id" column): one index lookup on
+    # each side of the pair, no OR
+    @staticmethod
+    def friend_ids(user_id):
+        friendships = Friendship.__table__
+        return union_all(
+            select(friendships.c.friend_id.label("id")).where(friendships.c.user_id == user_id),
+            select(friendships.c.user_id.label("id")).where(friendships.c.friend_id == user_id),
+        )
+
+    # Ids of the friends two users have in common (SQL select)
+    @staticmethod
+    def mutual_friend_ids(user_id, other_id):
+        theirs = Friendship.friend_ids(other_id).subquery()
+        return select(theirs.c.id).where(theirs.c.id.in_(Friendship.friend_ids(user_id)))
+
+    # (id, mutual friend count) of the friends of a user's friends who aren't
+    # their friends yet, most mutual friends first (SQL select)
+    @staticmethod
+    def friends_of_friends(user_id):
+        friendships = Friendship.__table__
+        friends = Friendship.friend_ids(user_id).subquery()
+        reached = union_all(
+            select(friendships.c.friend_id.label("id")).join(friends, friendships.c.user_id == friends.c.id),
+            select(friendships.c.user_id.label("id")).join(friends, friendships.c.friend_id == friends.c.id),
+        ).subquery()
+        mutual = func.count().label("mutual_friends")
+        return (select(reached.c.id, mutual)
+                .where(reached.c.id != user_id, reached.c.id.not_in(Friendship.friend_ids(user_id)))
+                .group_by(reached.c.id).order_by(mutual.desc(), reached.c.id))
+
     def __repr__(self):
-        return f"<Friendship {self.id} - User: {self.user.username}, Friend: {self.friend.username}>"   
+        return f"<Friendship {self.id} - User: {self.user.username}, Friend: {self.friend.username}>"
+
+# Per-user counters (sighting_count, friend_count, last_sighting_at)
+# The events below adjust them in the same flush as the change; reconcile.py
+# recomputes them from scratch with refresh_user_counters()
+
+def refresh_user_counters(connection, user_ids=None):
+    users = User.__table__
+    sightings = Sighting.__table__
+    friendships = Friendship.__table__
+    stmt = users.update().values(
+        sighting_count=select(func.count()).select_from(sightings)
+            .where(sightings.c.user_id == users.c.id).scalar_subquery(),
+        last_sighting_at=select(func.max(sightings.c.observed_on))
+            .where(sightings.c.user_id == users.c.id).scalar_subquery(),
+        friend_count=select(func.count()).select_from(friendships)
+            .where(friendships.c.user_id == users.c.id).scalar_subquery()
+            + select(func.count()).select_from(friendships)
+            .where(friendships.c.friend_id == users.c.id).scalar_subquery(),
+    )
+    if user_ids is not None:
+        stmt = stmt.where(users.c.id.in_(list(user_ids)))
+    connection.execute(stmt)
+
+def _count_sighting(connection, user_id, observed_on):
+    users = User.__table__
+    values = {"sighting_count": users.c.sighting_count + 1}
+    if observed_on is not None:
+        values["last_sighting_at"] = case(
+            (or_(users.c.last_sighting_at.is_(None), users.c.last_sighting_at < observed_on),
+             literal(observed_on, db.DateTime)),
+            else_=users.c.last_sighting_at
+        )
+    connection.execute(users.update().where(users.c.id == user_id).values(**values))
+
+def _uncount_sighting(connection, user_id, decrement=1):
+    users = User.__table__
+    sightings = Sighting.__table__
+    connection.execute(users.update().where(users.c.id == user_id).values(
+        sighting_count=users.c.sighting_count - decrement,
+        # The latest sighting may be the one that went away, so look it up again
+        last_sighting_at=select(func.max(sightings.c.observed_on))
+            .where(sightings.c.user_id == user_id).scalar_subquery()
+    ))
+
+@event.listens_for(Sighting, "after_insert")
+def count_new_sighting(mapper, connection, sighting):
+    if sighting.user_id is not None:
+        _count_sighting(connection, sighting.user_id, sighting.observed_on)
+
+@event.listens_for(Sighting, "after_delete")
+def uncount_deleted_sighting(mapper, connection, sighting):
+    if sighting.user_id is not None:
+        _uncount_sighting(connection, sighting.user_id)
+
+@event.listens_for(Sighting, "after_update")
+def recount_updated_sighting(mapper, connection, sighting):
+    state = db.inspect(sighting)
+    moved = state.attrs.user_id.history
+    if moved.has_changes():
+        for old_user_id in moved.deleted:
+            if old_user_id is not None:
+                _uncount_sighting(connection, old_user_id)
+        if sighting.user_id is not None:
+            _count_sighting(connection, sighting.user_id, sighting.observed_on)
+    elif state.attrs.observed_on.history.has_changes() and sighting.user_id is not None:
+        _uncount_sighting(connection, sighting.user_id, decrement=0)
+
+# One friendship row counts for both users
+@event.listens_for(Friendship, "after_insert")
+def count_new_friendship(mapper, connection, friendship):
+    users = User.__table__
+    connection.execute(users.update().where(users.c.id.in_([friendship.user_id, friendship.friend_id]))
+                       .values(friend_count=users.c.friend_count + 1))
+
+@event.listens_for(Friendship, "after_delete")
+def uncount_deleted_friendship(mapper, connection, friendship):
+    users = User.__table__
+    connection.execute(users.update().where(users.c.id.in_([friendship.user_id, friendship.friend_id]))
+                       .values(friend_count=users.c.friend_count - 1))
+
+# The in-memory friend graph (social_graph.py) takes friendship changes once
+# they're committed; a rolled back change never reaches it
+def _queue_social_graph_change(friendship, change):
+    session = object_session(friendship)
+    if session is not None:
+        session.info.setdefault("social_graph_changes", []).append(
+            (change, friendship.user_id, friendship.friend_id))
+
+@event.listens_for(Friendship, "after_insert")
+def add_to_social_graph(mapper, connection, friendship):
+    _queue_social_graph_change(friendship, social_graph.add)
+
+@event.listens_for(Friendship, "after_delete")
+def remove_from_social_graph(mapper, connection, friendship):
+    _queue_social_graph_change(friendship, social_graph.remove)
+
+@event.listens_for(Session, "after_commit")
+def apply_social_graph_changes(session):
+    for change, user_id, friend_id in session.info.pop("social_graph_changes", ()):
+        change(user_id, friend_id)
+
+@event.listens_for(Session, "after_rollback")
+def discard_social_graph_changes(session):
+    session.info.pop("social_graph_changes", None)
+
+# Map clusters: sighting count and coordinate sums (for the centroid) per geohash
+# cell at each precision in PRECISIONS, so GET /sightings/clusters reads a few
+# hundred rows instead of every sighting (see clusters.py). Kept current by the
+# events below; reconcile.py rebuilds it with rebuild_sighting_clusters()
+class SightingCluster(db.Model):
+    __tablename__ = "sighting_clusters"
+
+    # Geohash precisions 1 (~5000km cells) to 6 (~1.2km cells)
+    PRECISIONS = range(1, 7)
+
+    precision = db.Column(db.Integer, primary_key=True)
+    cell = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    latitude_sum = db.Column(db.Float, nullable=False, default=0)
+    longitude_sum = db.Column(db.Float, nullable=False, default=0)
+
+def _coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# Values the given attributes had before the flush that is updating obj
+def _previous_values(obj, keys):
+    state = db.inspect(obj)
+    values = []
+    for key in keys:
+        history = state.attrs[key].history
+        if history.has_changes():
+            values.append(history.deleted[0] if history.deleted else None)
+        else:
+            values.append(getattr(obj, key))
+    return values
+
+# Apply (geohash, latitude, longitude, +1/-1) changes to the cluster table
+def update_sighting_clusters(connection, changes):
+    deltas = {}
+    for geohash, latitude, longitude, sign in changes:
+        latitude, longitude = _coordinate(latitude), _coordinate(longitude)
+        if not geohash or latitude is None or longitude is None:
+            continue
+        for precision in SightingCluster.PRECISIONS:
+            delta = deltas.setdefault((precision, geohash[:precision]), [0, 0.0, 0.0])
+            delta[0] += sign
+            delta[1] += sign * latitude
+            delta[2] += sign * longitude
+    rows = [
+        {"precision": precision, "cell": cell, "count": count, "latitude_sum": lat_sum, "longitude_sum": lng_sum}
+        for (precision, cell), (count, lat_sum, lng_sum) in deltas.items() if count or lat_sum or lng_sum
+    ]
+    table = SightingCluster.__table__
+    upsert_increments(connection, table, rows, ("precision", "cell"), ("count", "latitude_sum", "longitude_sum"))
+    delete_empty(connection, table, [(row["precision"], row["cell"]) for row in rows if row["count"] < 0],
+                 ("precision", "cell"), "count")
+
+def rebuild_sighting_clusters(connection):
+    table = SightingCluster.__table__
+    sightings = Sighting.__table__
+    connection.execute(table.delete())
+    for precision in SightingCluster.PRECISIONS:
+        cell = func.substr(sightings.c.geohash, 1, precision)
+        connection.execute(table.insert().from_select(
+            ["precision", "cell", "count", "latitude_sum", "longitude_sum"],
+            select(literal(precision), cell, func.count(), func.sum(sightings.c.latitude), func.sum(sightings.c.longitude))
+            .where(sightings.c.geohash.isnot(None)).group_by(cell)
+        ))
+
+@event.listens_for(Sighting, "after_insert")
+def cluster_new_sighting(mapper, connection, sighting):
+    update_sighting_clusters(connection, [(sighting.geohash, sighting.latitude, sighting.longitude, 1)])
+
+@event.listens_for(Sighting, "after_delete")
+def uncluster_deleted_sighting(mapper, connection, sighting):
+    update_sighting_clusters(connection, [(sighting.geohash, sighting.latitude, sighting.longitude, -1)])
+
+@event.listens_for(Sighting, "after_update")
+def recluster_updated_sighting(mapper, connection, sighting):
+    old = _previous_values(sighting, ("geohash", "latitude", "longitude"))
+    new = [sighting.geohash, sighting.latitude, sighting.longitude]
+    if old != new:
+        update_sighting_clusters(connection, [(*old, -1), (*new, 1)])
+
+# Daily activity rollup: sightings per (day, species, geohash cell), so
+# GET /sightings/stats can sum a few rows per day instead of rescanning sightings
+# (see stats.py). Sightings without a species or coordinates are counted under
+# species_id 0 / cell ""; sightings without a date aren't counted. Kept current
+# by the events below; reconcile.py rebuilds it with rebuild_sighting_daily_counts()
+class SightingDailyCount(db.Model):
+    __tablename__ = "sighting_daily_counts"
+
+    # Geohash precision of the cells (~39km x 20km)
+    PRECISION = 4
+
+    day = db.Column(db.Date, primary_key=True)
+    species_id = db.Column(db.Integer, primary_key=True)
+    cell = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+# Apply (observed_on, species_id, geohash, +1/-1) changes to the daily rollup
+def update_sighting_daily_counts(connection, changes):
+    deltas = {}
+    for observed_on, species_id, geohash, sign in changes:
+        if observed_on is None:
+            continue
+        key = (observed_on.date(), species_id or 0, (geohash or "")[:SightingDailyCount.PRECISION])
+        deltas[key] = deltas.get(key, 0) + sign
+    rows = [
+        {"day": day, "species_id": species_id, "cell": cell, "count": count}
+        for (day, species_id, cell), count in deltas.items() if count
+    ]
+    table = SightingDailyCount.__table__
+    upsert_increments(connection, table, rows, ("day", "species_id", "cell"), ("count",))
+    delete_empty(connection, table, [(row["day"], row["species_id"], row["cell"]) for row in rows if row["count"] < 0],
+                 ("day", "species_id", "cell"), "count")
+
+def rebuild_sighting_daily_counts(connection):
+    table = SightingDailyCount.__table__
+    sightings = Sighting.__table__
+    day = func.date(sightings.c.observed_on)
+    species_id = func.coalesce(sightings.c.species_id, 0)
+    cell = func.coalesce(func.substr(sightings.c.geohash, 1, SightingDailyCount.PRECISION), "")
+    connection.execute(table.delete())
+    connection.execute(table.insert().from_select(
+        ["day", "species_id", "cell", "count"],
+        select(day, species_id, cell, func.count())
+        .where(sightings.c.observed_on.isnot(None)).group_by(day, species_id, cell)
+    ))
+
+@event.listens_for(Sighting, "after_insert")
+def roll_up_new_sighting(mapper, connection, sighting):
+    update_sighting_daily_counts(connection, [(sighting.observed_on, sighting.species_id, sighting.geohash, 1)])
+
+@event.listens_for(Sighting, "after_delete")
+def roll_up_deleted_sighting(mapper, connection, sighting):
+    update_sighting_daily_counts(connection, [(sighting.observed_on, sighting.species_id, sighting.geohash, -1)])
+
+@event.listens_for(Sighting, "after_update")
+def roll_up_updated_sighting(mapper, connection, sighting):
+    old = _previous_values(sighting, ("observed_on", "species_id", "geohash"))
+    new = [sighting.observed_on, sighting.species_id, sighting.geohash]
+    if old != new:
+        update_sighting_daily_counts(connection, [(*old, -1), (*new, 1)])
+
+# Friend activity feed (GET /feed, see feed.py), materialized on write: a new
+# sighting gets one feed row per friend of its author. Authors with more than
+# FANOUT_LIMIT friends are skipped and their sightings are read from the
+# sightings table when a feed is loaded instead. Each feed also holds the latest
+# BACKFILL sightings of every (fanned-out) friend, copied when the friendship is
+# made. Kept current by the events below; reconcile.py rebuilds it with
+# rebuild_feed_items()
+class FeedItem(db.Model):
+    __tablename__ = "feed_items"
+
+    FANOUT_LIMIT = 1000
+    BACKFILL = 50
+
+    owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    sighting_id = db.Column(db.Integer, db.ForeignKey("sightings.id"), primary_key=True, index=True)
+    author_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+
+# SQL condition: the author's sightings are fanned out to their friends' feeds
+def _fans_out(author_id):
+    users = User.__table__
+    return select(users.c.friend_count).where(users.c.id == author_id).scalar_subquery() <= FeedItem.FANOUT_LIMIT
+
+# Add a new sighting to the feeds of its author's friends
+def fan_out_sighting(connection, sighting_id, author_id):
+    feed = FeedItem.__table__
+    owners = Friendship.friend_ids(author_id).subquery()
+    connection.execute(feed.insert().from_select(
+        ["owner_id", "sighting_id", "author_id"],
+        select(owners.c.id, literal(sighting_id), literal(author_id)).where(_fans_out(author_id))
+    ))
+
+# Copy an author's latest BACKFILL sightings into the feeds of their friends, or
+# only into owner_id's feed, skipping rows that are already there
+def backfill_feed_items(connection, author_id, owner_id=None):
+    feed = FeedItem.__table__
+    sightings = Sighting.__table__
+    recent = (select(sightings.c.id).where(sightings.c.user_id == author_id)
+              .order_by(sightings.c.id.desc()).limit(FeedItem.BACKFILL).subquery())
+    if owner_id is None:
+        owners = Friendship.friend_ids(author_id).subquery()
+        owner = owners.c.id
+        rows = select(owner, recent.c.id, literal(author_id)).select_from(owners.join(recent, true()))
+    else:
+        owner = literal(owner_id)
+        rows = select(owner, recent.c.id, literal(author_id)).select_from(recent)
+    existing = select(feed.c.sighting_id).where(feed.c.owner_id == owner, feed.c.sighting_id == recent.c.id)
+    connection.execute(feed.insert().from_select(
+        ["owner_id", "sighting_id", "author_id"],
+        rows.where(_fans_out(author_id), ~existing.exists())
+    ))
+
+# Every friend's latest BACKFILL sightings, as backfill_feed_items() would copy
+# them, in one statement
+def rebuild_feed_items(connection):
+    feed = FeedItem.__table__
+    users = User.__table__
+    sightings = Sighting.__table__
+    friendships = Friendship.__table__
+    connection.execute(feed.delete())
+    recent = (
+        select(sightings.c.id, sightings.c.user_id, func.row_number().over(
+            partition_by=sightings.c.user_id, order_by=sightings.c.id.desc()).label("rank"))
+        .join(users, users.c.id == sightings.c.user_id)
+        .where(users.c.friend_count <= FeedItem.FANOUT_LIMIT)
+        .subquery()
+    )
+    # Both directions of each friendship: (owner of the feed, author)
+    edges = union_all(
+        select(friendships.c.user_id.label("owner_id"), friendships.c.friend_id.label("author_id")),
+        select(friendships.c.friend_id, friendships.c.user_id),
+    ).subquery()
+    connection.execute(feed.insert().from_select(
+        ["owner_id", "sighting_id", "author_id"],
+        select(edges.c.owner_id, recent.c.id, recent.c.user_id)
+        .join(recent, recent.c.user_id == edges.c.author_id)
+        .where(recent.c.rank <= FeedItem.BACKFILL)
+    ))
+
+@event.listens_for(Sighting, "after_insert")
+def fan_out_new_sighting(mapper, connection, sighting):
+    if sighting.user_id is not None:
+        fan_out_sighting(connection, sighting.id, sighting.user_id)
+
+# Before the delete, so the feed rows never point at a missing sighting
+@event.listens_for(Sighting, "before_delete")
+def remove_deleted_sighting_from_feeds(mapper, connection, sighting):
+    feed = FeedItem.__table__
+    connection.execute(feed.delete().where(feed.c.sighting_id == sighting.id))
+
+@event.listens_for(Sighting, "after_update")
+def refeed_reassigned_sighting(mapper, connection, sighting):
+    if not db.inspect(sighting).attrs.user_id.history.has_changes():
+        return
+    remove_deleted_sighting_from_feeds(mapper, connection, sighting)
+    if sighting.user_id is not None:
+        fan_out_sighting(connection, sighting.id, sighting.user_id)
+
+# New friends' recent sightings show up in each other's feeds right away
+@event.listens_for(Friendship, "after_insert")
+def backfill_new_friend(mapper, connection, friendship):
+    backfill_feed_items(connection, friendship.friend_id, owner_id=friendship.user_id)
+    backfill_feed_items(connection, friendship.user_id, owner_id=friendship.friend_id)
+
+@event.listens_for(Friendship, "after_delete")
+def drop_former_friend(mapper, connection, friendship):
+    feed = FeedItem.__table__
+    pair = (friendship.user_id, friendship.friend_id)
+    connection.execute(feed.delete().where(or_(
+        and_(feed.c.owner_id == pair[0], feed.c.author_id == pair[1]),
+        and_(feed.c.owner_id == pair[1], feed.c.author_id == pair[0]),
+    )))
+    # Dropping back to FANOUT_LIMIT friends turns fan-out on again; their feeds
+    # have missed the sightings posted meanwhile
+    users = User.__table__
+    dropped = connection.execute(select(users.c.id).where(
+        users.c.id.in_(pair), users.c.friend_count == FeedItem.FANOUT_LIMIT)).scalars().all()
+    for user_id in dropped:
+        backfill_feed_items(connection, user_id)
+
+# Bring derived data up to date after sightings were inserted with Core statements
+# (bulk import), which bypass the mapper events above; rows are the inserted values
+def sightings_inserted(connection, rows):
+    refresh_user_counters(connection, {row["user_id"] for row in rows if row.get("user_id") is not None})
+    update_sighting_clusters(connection, [(row["geohash"], row["latitude"], row["longitude"], 1) for row in rows])
+    update_sighting_daily_counts(connection, [(row["observed_on"], row["species_id"], row["geohash"], 1) for row in rows])
+    for user_id in {row["user_id"] for row in rows if row.get("user_id") is not None}:
+        backfill_feed_items(connection, user_id)
+
+# Row versions (see _version_column): a user's profile nests their sightings, and
+# sightings and profiles nest the sighting's species. Friendships need no events:
+# adding or removing one updates both users' friend_count, which bumps them
+@event.listens_for(Sighting, "after_update")
+def touch_sighting_owner(mapper, connection, sighting):
+    session = object_session(sighting)
+    if sighting.user_id is None or (session is not None and not session.is_modified(sighting)):
+        return
+    users = User.__table__
+    connection.execute(users.update().where(users.c.id == sighting.user_id)
+                       .values(version=users.c.version + 1))
+
+@event.listens_for(Species, "after_update")
+@event.listens_for(Species, "after_delete")
+def touch_species_sightings(mapper, connection, species):
+    users = User.__table__
+    sightings = Sighting.__table__
+    owners = select(sightings.c.user_id).where(sightings.c.species_id == species.id)
+    connection.execute(users.update().where(users.c.id.in_(owners)).values(version=users.c.version + 1))
+    connection.execute(sightings.update().where(sightings.c.species_id == species.id)
+                       .values(version=sightings.c.version + 1))
+
+# Compile the default serializers once at import instead of on the first request
+for model in (User, Sighting, Species, Friendship):
+    get_serializer(model)
+
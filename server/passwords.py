@@ -0,0 +1,106 @@
+# Password hashing service
+# bcrypt is deliberately slow, so hashing runs in a small process pool instead of
+# on the request thread: a burst of logins can only use PASSWORD_HASH_WORKERS cores
+# and at most PASSWORD_HASH_MAX_PENDING hashes wait in line, the rest get a 503.
+#
+# Config:
+#   BCRYPT_LOG_ROUNDS          bcrypt cost for new hashes (default 12); hashes made
+#                              with another cost are upgraded on the next login
+#   PASSWORD_HASH_WORKERS      pool size; 0 hashes inline (default: CPU count)
+#   PASSWORD_HASH_MAX_PENDING  hashes allowed to queue for the pool (default 4x workers)
+#   PASSWORD_HASH_TIMEOUT      seconds to wait for a hash (default 10), then a 503
+
+import hmac
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+from werkzeug.exceptions import ServiceUnavailable
+
+
+def _to_bytes(value):
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+
+# These run in the pool's worker processes
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds, prefix=b"2b")).decode("utf-8")
+
+
+def _check(password, hashed):
+    return hmac.compare_digest(bcrypt.hashpw(password, hashed), hashed)
+
+
+# Cost factor stored in a bcrypt hash ("$2b$12$..." -> 12)
+def hash_cost(hashed):
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = os.cpu_count() or 1
+        self.max_pending = 4 * self.workers
+        self.timeout = 10
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = int(app.config.get("BCRYPT_LOG_ROUNDS", 12))
+        self.workers = int(app.config.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+        self.max_pending = int(app.config.get("PASSWORD_HASH_MAX_PENDING", 4 * max(self.workers, 1)))
+        self.timeout = float(app.config.get("PASSWORD_HASH_TIMEOUT", 10))
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        app.extensions["password_hasher"] = self
+
+    # Hash a new password with the configured cost
+    def hash(self, password):
+        return self._run(_hash, _to_bytes(password), self.rounds)
+
+    # Check a password against a stored hash
+    def verify(self, password, hashed):
+        return self._run(_check, _to_bytes(password), _to_bytes(hashed))
+
+    # True when a stored hash was made with a different cost than the configured one
+    def needs_rehash(self, hashed):
+        return hash_cost(hashed) != self.rounds
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise ServiceUnavailable("Too many logins in progress, please try again")
+        try:
+            future = self._executor().submit(fn, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                # Drop it if it hasn't started; a running hash can't be interrupted
+                future.cancel()
+                raise ServiceUnavailable("Password check timed out, please try again")
+        finally:
+            self._slots.release()
+
+    # The pool is created lazily, and again in each forked server worker, since a
+    # pool can't be shared across a fork
+    def _executor(self):
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._lock:
+                if self._pool is None or self._pool_pid != pid:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pool_pid = pid
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=True)
+        self._pool = None
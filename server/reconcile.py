@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+# Rebuild denormalized data (counters, indexes kept by model events) from the
+# source tables, e.g. after bulk edits that bypassed the ORM
+# Usage: python reconcile.py [task ...]   (runs every task when none are given)
+
+# Standard library imports
+import sys
+
+# Local imports
+from app import app
+from config import cache
+from models import db, Species, refresh_user_counters, rebuild_sighting_clusters, rebuild_sighting_daily_counts, rebuild_feed_items
+from search import rebuild_username_index
+
+TASKS = {
+    "counters": ("per-user sighting/friend counters", refresh_user_counters),
+    "search": ("username search index", rebuild_username_index),
+    "clusters": ("map cluster aggregates", rebuild_sighting_clusters),
+    "rollups": ("daily sighting counts", rebuild_sighting_daily_counts),
+    "feed": ("friend activity feeds", rebuild_feed_items),
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(TASKS)
+    unknown = [name for name in names if name not in TASKS]
+    if unknown:
+        sys.exit(f"Unknown task(s): {', '.join(unknown)}. Available: {', '.join(TASKS)}")
+
+    with app.app_context():
+        for name in names:
+            description, task = TASKS[name]
+            print(f"Reconciling {description}...")
+            with db.engine.begin() as connection:
+                task(connection)
+        # The edits may have touched species too; rebuild the catalog on next use
+        cache.delete(Species.CATALOG_CACHE_KEY)
+        print("Reconcile complete!")
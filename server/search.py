@@ -0,0 +1,78 @@
+# Username search for the friend typeahead
+# Results are ranked exact match, then prefix matches, then substring matches,
+# and never exceed MAX_RESULTS rows:
+# - prefix matches are an index range scan on users.search_name
+# - substring matches (terms of 3+ characters) come from the username_trigrams
+#   table: users having every trigram of the term, checked against the name
+
+from sqlalchemy import bindparam, func, select
+
+from models import db, User, UsernameTrigram, reindex_usernames
+
+DEFAULT_RESULTS = 10
+MAX_RESULTS = 25
+
+
+def search_users(term, exclude_user_id=None, limit=DEFAULT_RESULTS):
+    term = term.strip().lower()
+    limit = max(1, min(limit, MAX_RESULTS))
+    if not term:
+        return []
+
+    users = User.__table__
+    columns = (users.c.id, users.c.username, users.c.profile_picture, users.c.search_name)
+
+    def visible(query):
+        return query if exclude_user_id is None else query.where(users.c.id != exclude_user_id)
+
+    # Prefix matches straight from the search_name index; "\uffff" sorts after any
+    # character that can follow the prefix
+    prefix = db.session.execute(visible(
+        select(*columns)
+        .where(users.c.search_name >= term, users.c.search_name < term + "\uffff")
+        .order_by(users.c.search_name)
+        .limit(limit)
+    )).all()
+    results = sorted(prefix, key=lambda row: (row.search_name != term, len(row.search_name), row.search_name))
+
+    term_trigrams = UsernameTrigram.trigrams(term)
+    if len(results) < limit and term_trigrams:
+        trigrams = UsernameTrigram.__table__
+        # Users containing every trigram of the term; a few extra candidates make up
+        # for names that have the trigrams but not the whole term
+        candidates = (
+            select(trigrams.c.user_id)
+            .where(trigrams.c.trigram.in_(term_trigrams))
+            .group_by(trigrams.c.user_id)
+            .having(func.count() == len(term_trigrams))
+            .limit(limit * 4)
+            .scalar_subquery()
+        )
+        seen = {row.id for row in results}
+        substring = [
+            row for row in db.session.execute(visible(select(*columns).where(users.c.id.in_(candidates)))).all()
+            if row.id not in seen and term in row.search_name
+        ]
+        # Earlier and shorter matches first
+        substring.sort(key=lambda row: (row.search_name.index(term), len(row.search_name), row.search_name))
+        results += substring[:limit - len(results)]
+
+    return [
+        {"id": row.id, "username": row.username, "profile_picture": row.profile_picture}
+        for row in results
+    ]
+
+
+# Rebuild search_name and the trigram table for every user (used by reconcile.py)
+# Lowercasing happens in Python so it matches the model events for non-ASCII names
+def rebuild_username_index(connection, batch_size=5000):
+    users = User.__table__
+    connection.execute(UsernameTrigram.__table__.delete())
+    rows = connection.execute(select(users.c.id, users.c.username).order_by(users.c.id)).all()
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        connection.execute(
+            users.update().where(users.c.id == bindparam("user_id")).values(search_name=bindparam("name")),
+            [{"user_id": user_id, "name": username.lower() if username else None} for user_id, username in batch]
+        )
+        reindex_usernames(connection, batch)
@@ -1,231 +1,459 @@
 #!/usr/bin/env python3
 
+# Seed the database (every table is cleared first)
+#
+#   python seed.py
+#       the demo users, species, sightings and friendships
+#
+#   python seed.py --users 100000 --sightings 10000000 [--friends 20] [--species 40]
+#                  [--seed 0] [--hash-rounds 4] [--batch-size 50000]
+#       synthetic data at scale, for staging and benchmarks: Faker users with
+#       --friends friends on average, following a power law (most users have a
+#       few, a few have thousands), and summer-night sightings clustered around
+#       real towns, most of them near each user's home town and most from the
+#       most active users. The same --seed gives the same data. Every synthetic
+#       user's password is "password", hashed once with bcrypt cost --hash-rounds
+#       (logins upgrade it to BCRYPT_LOG_ROUNDS). Rows go in as bulk INSERTs of
+#       --batch-size rows, one transaction per batch, with the secondary indexes
+#       dropped until the end; the derived tables are then rebuilt with the
+#       reconcile tasks (see reconcile.py).
+#   --hash-rounds also applies to the demo users.
+
 # Standard library imports
-from random import randint, choice as rc
-from datetime import datetime
+import argparse
+import time
+from contextlib import contextmanager
+from random import Random, randint, choice as rc
+from datetime import datetime, timedelta
+from itertools import accumulate
+from math import gcd
 
 # Remote library imports
 from faker import Faker
 
 # Local imports
 from app import app
+import passwords
+from config import password_hasher, cache
+from database import insert_missing
+from geo import encode_geohash
 from models import db, User, Sighting, Species, Friendship
+from reconcile import TASKS
 
-if __name__ == '__main__':
+PASSWORD = "password"
+BATCH_SIZE = 50_000
+
+# Friend counts follow P(k) ~ k ** -DEGREE_EXPONENT; sightings per user too
+DEGREE_EXPONENT = 2.5
+# Sightings are this many degrees (one standard deviation) from their town
+TOWN_SPREAD = 0.08
+# Share of a user's sightings near their home town; the rest are trips
+HOME_SHARE = 0.8
+# Sightings fall on summer nights of these years, peaking at the start of July
+FIRST_YEAR = 2019
+YEARS = 5
+GENERA = ["Photinus", "Photuris", "Pyractomena", "Ellychnia", "Lucidota", "Phausis", "Micronaspis"]
+
+
+# Delete every row, derived tables included, children first
+def clear_tables():
+    with db.engine.begin() as connection:
+        for table in reversed(db.metadata.sorted_tables):
+            connection.execute(table.delete())
+    # Core deletes skip the model events that drop the cached species catalog
+    cache.delete(Species.CATALOG_CACHE_KEY)
+
+
+# Prints "label: done / total (percent), rate/s" at most every few seconds
+class Progress:
+    def __init__(self, label, total, report=print, every=2.0):
+        self.label = label
+        self.total = total
+        self.report = report
+        self.every = every
+        self.done = 0
+        self.started_at = self.reported_at = time.perf_counter()
+
+    def add(self, count):
+        self.done += count
+        now = time.perf_counter()
+        if now - self.reported_at >= self.every or self.done >= self.total:
+            self.reported_at = now
+            rate = self.done / max(now - self.started_at, 1e-9)
+            percent = 100 * self.done / self.total if self.total else 100
+            self.report(f"  {self.label}: {self.done:,} / {self.total:,} ({percent:.0f}%), {rate:,.0f}/s")
+
+
+# Draws ids 1..n, a few of them very often and most rarely: rank r (from 0) comes
+# up with probability ~ (r + 1) ** -(1 / (exponent - 1)), which gives a power law
+# with the exponent in how often each id is drawn. Ranks are spread over the ids
+# (by multiplying with a number coprime to n), so popular users aren't all low ids.
+class PowerLaw:
+    def __init__(self, n, rng, exponent=DEGREE_EXPONENT):
+        self.n = n
+        self.rng = rng
+        self.power = 1 - 1 / (exponent - 1)
+        self.top = (n + 1) ** self.power - 1
+        step = 2654435761 % n or 1
+        while gcd(step, n) != 1:
+            step += 1
+        self.step = step
+
+    def draw(self):
+        # Inverse of the continuous distribution's CDF over [1, n + 1)
+        rank = int((self.top * self.rng.random() + 1) ** (1 / self.power)) - 1
+        return min(rank, self.n - 1) * self.step % self.n + 1
+
+
+@contextmanager
+def indexes_dropped(tables):
+    indexes = [index for table in tables for index in table.indexes]
+    with db.engine.begin() as connection:
+        for index in indexes:
+            index.drop(connection)
+    try:
+        yield
+    finally:
+        with db.engine.begin() as connection:
+            for index in indexes:
+                index.create(connection)
+
+
+# Insert rows from a generator in batches, a transaction each
+def insert_batches(table, rows, batch_size, progress):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            with db.engine.begin() as connection:
+                connection.execute(table.insert(), batch)
+            progress.add(len(batch))
+            batch = []
+    if batch:
+        with db.engine.begin() as connection:
+            connection.execute(table.insert(), batch)
+        progress.add(len(batch))
+
+
+def seed_synthetic(users, sightings, friends=20, species=40, seed=0, hash_rounds=4,
+                   batch_size=BATCH_SIZE, report=print):
+    rng = Random(seed)
     fake = Faker()
-    with app.app_context():
-        print("Starting seed...")
-        
-        # Clear existing data
-        print("Clearing existing data...")
-        Sighting.query.delete()
-        Species.query.delete()
-        User.query.delete()
-        Friendship.query.delete()
-        db.session.commit()
-        print("Existing data cleared.")
-        
-        # Seed code goes here!
-        print("Adding new data...")
+    fake.seed_instance(seed)
+    popularity = PowerLaw(users, rng)
+    # Hashed here at the fixture cost; the app's hasher keeps BCRYPT_LOG_ROUNDS
+    password_hash = passwords._hash(PASSWORD.encode(), hash_rounds)
 
-        # Create users with password hashing
-        user1 = User(username="John Doe")
-        user1.password_hash = "password123"  # This will trigger the hashing
-        user1.profile_picture = "/static/uploads/john.jpg"
+    report("Clearing existing data...")
+    clear_tables()
+    started_at = time.perf_counter()
 
-        user2 = User(username="Jane Smith")
-        user2.password_hash = "password456"  # This will trigger the hashing
-        user2.profile_picture = "/static/uploads/jane.png"
+    # The id after the last "_" keeps usernames unique
+    names = [fake.user_name() for _ in range(min(users, 5000))]
+    user_rows = ({"id": i, "username": username, "search_name": username.lower(), "_password_hash": password_hash}
+                 for i, username in ((i, f"{names[i % len(names)]}_{i}") for i in range(1, users + 1)))
 
-        user3 = User(username="Thisbe")
-        user3.password_hash = "thisbe"  # This will trigger the hashing
-        user3.profile_picture = "/static/uploads/thisbe.png"
+    species_rows = []
+    for i in range(1, species + 1):
+        epithet = fake.unique.last_name().lower()
+        species_rows.append({"id": i, "name": f"{epithet.title()} Firefly", "type": "Insect",
+                             "scientific_name": f"{rng.choice(GENERA)} {epithet}"})
+    # A few common species, many rare ones
+    species_weights = list(accumulate(1 / i for i in range(1, species + 1)))
 
-        user4 = User(username="InsectHunter2000")
-        user4.password_hash = "password789"
-    
+    towns = [fake.local_latlng(country_code="US") for _ in range(max(1, min(users, 500)))]
+    town_weights = list(accumulate(1 / i for i in range(1, len(towns) + 1)))
+    descriptions = [fake.sentence(nb_words=8) for _ in range(1000)]
+
+    def sighting_rows():
+        for _ in range(sightings):
+            user_id = popularity.draw()
+            if rng.random() < HOME_SHARE:
+                town = towns[user_id % len(towns)]
+            else:
+                town = rng.choices(towns, cum_weights=town_weights)[0]
+            latitude = max(-90.0, min(90.0, rng.gauss(float(town[0]), TOWN_SPREAD)))
+            longitude = max(-180.0, min(180.0, rng.gauss(float(town[1]), TOWN_SPREAD)))
+            yield {
+                "user_id": user_id,
+                "species_id": rng.choices(range(1, species + 1), cum_weights=species_weights)[0],
+                "place_guess": town[2],
+                "observed_on": datetime(FIRST_YEAR + rng.randrange(YEARS), 7, 1, 20)
+                + timedelta(days=int(rng.gauss(0, 20)), minutes=rng.randrange(240)),
+                "description": rng.choice(descriptions) if rng.random() < 0.3 else None,
+                "latitude": latitude,
+                "longitude": longitude,
+                "geohash": encode_geohash(latitude, longitude),
+            }
+
+    tables = [User.__table__, Sighting.__table__, Friendship.__table__]
+    with indexes_dropped(tables):
+        insert_batches(User.__table__, user_rows, batch_size, Progress("users", users, report))
+        with db.engine.begin() as connection:
+            connection.execute(Species.__table__.insert(), species_rows)
+        cache.delete(Species.CATALOG_CACHE_KEY)
+
+        # Both ends of each friendship drawn by popularity; pairs drawn twice are
+        # skipped by the unique (user_id, friend_id) constraint
+        wanted = min(users * friends // 2, users * (users - 1) // 2)
+        progress = Progress("friendships", wanted, report)
+        while progress.done < wanted:
+            pairs = set()
+            while len(pairs) < min(batch_size, wanted - progress.done):
+                a, b = popularity.draw(), popularity.draw()
+                if a != b:
+                    pairs.add((min(a, b), max(a, b)))
+            with db.engine.begin() as connection:
+                inserted = insert_missing(connection, Friendship.__table__,
+                                          [{"user_id": a, "friend_id": b} for a, b in pairs])
+            if not inserted:
+                break
+            progress.add(inserted)
+
+        insert_batches(Sighting.__table__, sighting_rows(), batch_size,
+                       Progress("sightings", sightings, report))
+        report("Rebuilding indexes...")
+
+    for description, task in TASKS.values():
+        report(f"Rebuilding {description}...")
+        with db.engine.begin() as connection:
+            task(connection)
+    # Bring a SQLite database file back from the write-ahead log the load grew
+    if db.engine.dialect.name == "sqlite":
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    report(f"Seeded {users:,} users, {progress.done:,} friendships, {sightings:,} sightings "
+           f"in {time.perf_counter() - started_at:.0f}s")
+    return {"users": users, "friendships": progress.done, "sightings": sightings, "species": species}
+
+
+def seed_demo():
+    # Seed code goes here!
+    print("Adding new data...")
+
+    # Create users with password hashing
+    user1 = User(username="John Doe")
+    user1.password_hash = "password123"  # This will trigger the hashing
+    user1.profile_picture = "/static/uploads/john.jpg"
+
+    user2 = User(username="Jane Smith")
+    user2.password_hash = "password456"  # This will trigger the hashing
+    user2.profile_picture = "/static/uploads/jane.png"
+
+    user3 = User(username="Thisbe")
+    user3.password_hash = "thisbe"  # This will trigger the hashing
+    user3.profile_picture = "/static/uploads/thisbe.png"
+
+    user4 = User(username="InsectHunter2000")
+    user4.password_hash = "password789"
 
-        db.session.add(user1)
-        db.session.add(user2)
-        db.session.add(user3)
-        db.session.add(user4)
-        db.session.commit()
+
+    db.session.add(user1)
+    db.session.add(user2)
+    db.session.add(user3)
+    db.session.add(user4)
+    db.session.commit()
+    
+    # Add bioluminescent species
+    species_list = [
+        # Fireflies (Lampyridae)
+        Species(name="Common Eastern Firefly", type="Insect", scientific_name="Photinus pyralis"),
+        Species(name="Pennsylvania Firefly", type="Insect", scientific_name="Photuris pensylvanica"),
+        Species(name="Blue Ghost Firefly", type="Insect", scientific_name="Phausis reticulata"),
+        Species(name="Synchronous Firefly", type="Insect", scientific_name="Photinus carolinus"),
+        Species(name="Winter Firefly", type="Insect", scientific_name="Ellychnia corrusca"),
+        Species(name="Florida Intertidal Firefly", type="Insect", scientific_name="Micronaspis floridana"),
         
-        # Add bioluminescent species
-        species_list = [
-            # Fireflies (Lampyridae)
-            Species(name="Common Eastern Firefly", type="Insect", scientific_name="Photinus pyralis"),
-            Species(name="Pennsylvania Firefly", type="Insect", scientific_name="Photuris pensylvanica"),
-            Species(name="Blue Ghost Firefly", type="Insect", scientific_name="Phausis reticulata"),
-            Species(name="Synchronous Firefly", type="Insect", scientific_name="Photinus carolinus"),
-            Species(name="Winter Firefly", type="Insect", scientific_name="Ellychnia corrusca"),
-            Species(name="Florida Intertidal Firefly", type="Insect", scientific_name="Micronaspis floridana"),
-            
-            # Limiting it to fireflies for now
-            # # Glowworms
-            # Species(name="European Glowworm", type="Insect", scientific_name="Lampyris noctiluca"),
-            # Species(name="New Zealand Glowworm", type="Insect", scientific_name="Arachnocampa luminosa"),
-            
-            # # Other Bioluminescent Insects
-            # Species(name="Railroad Worm", type="Insect", scientific_name="Phrixothrix hirtus"),
-            # Species(name="Click Beetle", type="Insect", scientific_name="Pyrophorus noctilucus"),
-            
-            # # Marine Bioluminescent Species
-            # Species(name="Dinoflagellate", type="Microorganism", scientific_name="Noctiluca scintillans"),
-            # Species(name="Bioluminescent Jellyfish", type="Marine", scientific_name="Aequorea victoria"),
-            # Species(name="Bioluminescent Squid", type="Marine", scientific_name="Watasenia scintillans"),
-            
-            # # Fungi
-            # Species(name="Ghost Fungus", type="Fungus", scientific_name="Omphalotus nidiformis"),
-            # Species(name="Jack-O'-Lantern Mushroom", type="Fungus", scientific_name="Omphalotus olearius"),
-            
-            # # Other Terrestrial Bioluminescent Species
-            # Species(name="Bioluminescent Millipede", type="Arthropod", scientific_name="Motyxia sequoiae"),
-            # Species(name="Bioluminescent Earthworm", type="Annelid", scientific_name="Diplocardia longa")
-        ]
-
-        for species in species_list:
-            db.session.add(species)
-        db.session.commit()
+        # Limiting it to fireflies for now
+        # # Glowworms
+        # Species(name="European Glowworm", type="Insect", scientific_name="Lampyris noctiluca"),
+        # Species(name="New Zealand Glowworm", type="Insect", scientific_name="Arachnocampa luminosa"),
         
-        # Add firefly sightings with coordinates
-        firefly = Species.query.filter_by(scientific_name="Photinus pyralis").first()
+        # # Other Bioluminescent Insects
+        # Species(name="Railroad Worm", type="Insect", scientific_name="Phrixothrix hirtus"),
+        # Species(name="Click Beetle", type="Insect", scientific_name="Pyrophorus noctilucus"),
         
-        sighting1 = Sighting(
-            place_guess="Central Park, New York", 
-            observed_on=datetime.strptime("2023-06-15 20:30", "%Y-%m-%d %H:%M"), 
-            description="Large group of fireflies near the pond", 
-            photos="/static/uploads/firefly.jpeg", 
-            latitude=40.7829,
-            longitude=-73.9654,
-            user_id=user1.id, 
-            species_id=firefly.id
-        )
+        # # Marine Bioluminescent Species
+        # Species(name="Dinoflagellate", type="Microorganism", scientific_name="Noctiluca scintillans"),
+        # Species(name="Bioluminescent Jellyfish", type="Marine", scientific_name="Aequorea victoria"),
+        # Species(name="Bioluminescent Squid", type="Marine", scientific_name="Watasenia scintillans"),
         
-        sighting2 = Sighting(
-            place_guess="Prospect Park, Brooklyn", 
-            observed_on=datetime.strptime("2023-06-16 21:00", "%Y-%m-%d %H:%M"), 
-            description="Fireflies in the meadow", 
-            photos="/static/uploads/firefly2.jpeg", 
-            latitude=40.6602,
-            longitude=-73.9690,
-            user_id=user2.id, 
-            species_id=firefly.id
-        )
+        # # Fungi
+        # Species(name="Ghost Fungus", type="Fungus", scientific_name="Omphalotus nidiformis"),
+        # Species(name="Jack-O'-Lantern Mushroom", type="Fungus", scientific_name="Omphalotus olearius"),
+        
+        # # Other Terrestrial Bioluminescent Species
+        # Species(name="Bioluminescent Millipede", type="Arthropod", scientific_name="Motyxia sequoiae"),
+        # Species(name="Bioluminescent Earthworm", type="Annelid", scientific_name="Diplocardia longa")
+    ]
+
+    for species in species_list:
+        db.session.add(species)
+    db.session.commit()
+    
+    # Add firefly sightings with coordinates
+    firefly = Species.query.filter_by(scientific_name="Photinus pyralis").first()
+    
+    sighting1 = Sighting(
+        place_guess="Central Park, New York", 
+        observed_on=datetime.strptime("2023-06-15 20:30", "%Y-%m-%d %H:%M"), 
+        description="Large group of fireflies near the pond", 
+        photos="/static/uploads/firefly.jpeg", 
+        latitude=40.7829,
+        longitude=-73.9654,
+        user_id=user1.id, 
+        species_id=firefly.id
+    )
+    
+    sighting2 = Sighting(
+        place_guess="Prospect Park, Brooklyn", 
+        observed_on=datetime.strptime("2023-06-16 21:00", "%Y-%m-%d %H:%M"), 
+        description="Fireflies in the meadow", 
+        photos="/static/uploads/firefly2.jpeg", 
+        latitude=40.6602,
+        longitude=-73.9690,
+        user_id=user2.id, 
+        species_id=firefly.id
+    )
+
+    db.session.add(sighting1)
+    db.session.add(sighting2)
+
+    # Tampa/Clearwater area firefly sightings
+    sighting3 = Sighting(
+        place_guess="Lettuce Lake Park, Tampa", 
+        observed_on=datetime.strptime("2023-06-20 20:45", "%Y-%m-%d %H:%M"), 
+        description="Fireflies along the boardwalk near the Hillsborough River", 
+        photos="/static/uploads/firefly3.jpg", 
+        latitude=28.0806,
+        longitude=-82.3654,
+        user_id=user1.id, 
+        species_id=firefly.id
+    )
+    
+    sighting4 = Sighting(
+        place_guess="Philippe Park, Safety Harbor", 
+        observed_on=datetime.strptime("2023-06-21 21:15", "%Y-%m-%d %H:%M"), 
+        description="Fireflies in the oak hammock near the water", 
+        photos="/static/uploads/firefly4.jpeg", 
+        latitude=28.0008,
+        longitude=-82.6965,
+        user_id=user2.id, 
+        species_id=firefly.id
+    )
+    
+    sighting5 = Sighting(
+        place_guess="Moccasin Lake Nature Park, Clearwater", 
+        observed_on=datetime.strptime("2023-06-22 20:30", "%Y-%m-%d %H:%M"), 
+        description="Fireflies near the lake at dusk", 
+        photos="/static/uploads/firefly5.png", 
+        latitude=27.9914,
+        longitude=-82.7689,
+        user_id=user1.id, 
+        species_id=firefly.id
+    )
+
+    db.session.add(sighting3)
+    db.session.add(sighting4)
+    db.session.add(sighting5)
+    db.session.commit()
+
+    # Create friendships between users (one row each, see Friendship.pair)
+    friendship1 = Friendship.pair(user1.id, user2.id)
+    friendship2 = Friendship.pair(user1.id, user3.id)
 
-        db.session.add(sighting1)
-        db.session.add(sighting2)
-
-        # Tampa/Clearwater area firefly sightings
-        sighting3 = Sighting(
-            place_guess="Lettuce Lake Park, Tampa", 
-            observed_on=datetime.strptime("2023-06-20 20:45", "%Y-%m-%d %H:%M"), 
-            description="Fireflies along the boardwalk near the Hillsborough River", 
-            photos="/static/uploads/firefly3.jpg", 
-            latitude=28.0806,
-            longitude=-82.3654,
-            user_id=user1.id, 
+    db.session.add(friendship1)
+    db.session.add(friendship2)
+    db.session.commit()
+    
+    # Add sightings for thisbe
+    thisbe_sightings = [
+        Sighting(
+            place_guess="Lettuce Lake Park, Tampa",
+            observed_on=datetime.strptime("2023-06-15 20:30", "%Y-%m-%d %H:%M"),
+            description="Saw several fireflies near the boardwalk",
+            photos="/static/uploads/firefly.jpeg",
+            latitude=28.0797,
+            longitude=-82.3697,
+            user_id=user3.id,
             species_id=firefly.id
-        )
-        
-        sighting4 = Sighting(
-            place_guess="Philippe Park, Safety Harbor", 
-            observed_on=datetime.strptime("2023-06-21 21:15", "%Y-%m-%d %H:%M"), 
-            description="Fireflies in the oak hammock near the water", 
-            photos="/static/uploads/firefly4.jpeg", 
-            latitude=28.0008,
-            longitude=-82.6965,
-            user_id=user2.id, 
+        ),
+        Sighting(
+            place_guess="Hillsborough River State Park",
+            observed_on=datetime.strptime("2023-06-16 21:00", "%Y-%m-%d %H:%M"),
+            description="Large group of fireflies near the river",
+            photos="/static/uploads/firefly2.jpeg",
+            latitude=28.1489,
+            longitude=-82.2314,
+            user_id=user3.id,
             species_id=firefly.id
-        )
-        
-        sighting5 = Sighting(
-            place_guess="Moccasin Lake Nature Park, Clearwater", 
-            observed_on=datetime.strptime("2023-06-22 20:30", "%Y-%m-%d %H:%M"), 
-            description="Fireflies near the lake at dusk", 
-            photos="/static/uploads/firefly5.png", 
-            latitude=27.9914,
-            longitude=-82.7689,
-            user_id=user1.id, 
+        ),
+        Sighting(
+            place_guess="Al Lopez Park, Tampa",
+            observed_on=datetime.strptime("2023-06-17 20:45", "%Y-%m-%d %H:%M"),
+            description="Fireflies in the wooded area",
+            photos="/static/uploads/firefly3.jpg",
+            latitude=27.9789,
+            longitude=-82.4897,
+            user_id=user3.id,
+            species_id=firefly.id
+        ),
+        Sighting(
+            place_guess="Upper Tampa Bay Park",
+            observed_on=datetime.strptime("2023-06-18 21:15", "%Y-%m-%d %H:%M"),
+            description="Fireflies along the trail",
+            photos="/static/uploads/firefly4.jpeg",
+            latitude=28.0897,
+            longitude=-82.5897,
+            user_id=user3.id,
+            species_id=firefly.id
+        ),
+        Sighting(
+            place_guess="Eureka Springs Park, Tampa",
+            observed_on=datetime.strptime("2023-06-19 20:30", "%Y-%m-%d %H:%M"),
+            description="Fireflies in the garden area",
+            photos="https://example.com/firefly5.jpg",
+            latitude=27.9789,
+            longitude=-82.3897,
+            user_id=user3.id,
             species_id=firefly.id
         )
+    ]
 
-        db.session.add(sighting3)
-        db.session.add(sighting4)
-        db.session.add(sighting5)
-        db.session.commit()
+    for sighting in thisbe_sightings:
+        db.session.add(sighting)
+    db.session.commit()
+    
+    print("Database seeded successfully!")
 
-        # Create bidirectional friendship between users
-        friendship1 = Friendship(user_id=user1.id, friend_id=user2.id)
-        friendship2 = Friendship(user_id=user2.id, friend_id=user1.id)
 
-        friendship3 = Friendship(user_id=user1.id, friend_id=user3.id)
-        friendship4 = Friendship(user_id=user3.id, friend_id=user1.id)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Clear the database and seed it with demo or synthetic data")
+    parser.add_argument("--users", type=int, help="synthetic users (seeds synthetic data)")
+    parser.add_argument("--sightings", type=int, help="synthetic sightings (seeds synthetic data)")
+    parser.add_argument("--friends", type=int, default=20, help="average friends per synthetic user")
+    parser.add_argument("--species", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0, help="random seed; the same seed gives the same data")
+    parser.add_argument("--hash-rounds", type=int, help="bcrypt cost for seeded passwords (synthetic default 4)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
 
-        db.session.add(friendship1)
-        db.session.add(friendship2)
-        db.session.add(friendship3)
-        db.session.add(friendship4)
-        db.session.commit()
-        
-        # Add sightings for thisbe
-        thisbe_sightings = [
-            Sighting(
-                place_guess="Lettuce Lake Park, Tampa",
-                observed_on=datetime.strptime("2023-06-15 20:30", "%Y-%m-%d %H:%M"),
-                description="Saw several fireflies near the boardwalk",
-                photos="/static/uploads/firefly.jpeg",
-                latitude=28.0797,
-                longitude=-82.3697,
-                user_id=user3.id,
-                species_id=firefly.id
-            ),
-            Sighting(
-                place_guess="Hillsborough River State Park",
-                observed_on=datetime.strptime("2023-06-16 21:00", "%Y-%m-%d %H:%M"),
-                description="Large group of fireflies near the river",
-                photos="/static/uploads/firefly2.jpeg",
-                latitude=28.1489,
-                longitude=-82.2314,
-                user_id=user3.id,
-                species_id=firefly.id
-            ),
-            Sighting(
-                place_guess="Al Lopez Park, Tampa",
-                observed_on=datetime.strptime("2023-06-17 20:45", "%Y-%m-%d %H:%M"),
-                description="Fireflies in the wooded area",
-                photos="/static/uploads/firefly3.jpg",
-                latitude=27.9789,
-                longitude=-82.4897,
-                user_id=user3.id,
-                species_id=firefly.id
-            ),
-            Sighting(
-                place_guess="Upper Tampa Bay Park",
-                observed_on=datetime.strptime("2023-06-18 21:15", "%Y-%m-%d %H:%M"),
-                description="Fireflies along the trail",
-                photos="/static/uploads/firefly4.jpeg",
-                latitude=28.0897,
-                longitude=-82.5897,
-                user_id=user3.id,
-                species_id=firefly.id
-            ),
-            Sighting(
-                place_guess="Eureka Springs Park, Tampa",
-                observed_on=datetime.strptime("2023-06-19 20:30", "%Y-%m-%d %H:%M"),
-                description="Fireflies in the garden area",
-                photos="https://example.com/firefly5.jpg",
-                latitude=27.9789,
-                longitude=-82.3897,
-                user_id=user3.id,
-                species_id=firefly.id
+    with app.app_context():
+        print("Starting seed...")
+        if args.users or args.sightings:
+            seed_synthetic(
+                users=args.users or max(1, (args.sightings or 0) // 10),
+                sightings=args.sightings or 0,
+                friends=args.friends,
+                species=args.species,
+                seed=args.seed,
+                hash_rounds=args.hash_rounds or 4,
+                batch_size=args.batch_size,
             )
-        ]
-
-        for sighting in thisbe_sightings:
-            db.session.add(sighting)
-        db.session.commit()
-        
-        print("Database seeded successfully!")
-
-
+        else:
+            if args.hash_rounds:
+                password_hasher.rounds = args.hash_rounds
+            print("Clearing existing data...")
+            clear_tables()
+            print("Existing data cleared.")
+            seed_demo()
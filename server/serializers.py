@@ -0,0 +1,138 @@
+# Precompiled serializers for the models
+# sqlalchemy_serializer re-parses serialize_rules and walks every attribute of every
+# row on each to_dict() call. The rules only depend on the model classes, so we
+# resolve them once per (model, only, rules) and generate a flat function that
+# builds the same dict with plain attribute reads.
+
+import copy
+from datetime import datetime, date, time
+from time import perf_counter
+
+from sqlalchemy import inspect as sql_inspect
+from sqlalchemy.orm import ColumnProperty, RelationshipProperty
+from sqlalchemy_serializer import SerializerMixin
+from sqlalchemy_serializer.lib.schema import Schema
+from sqlalchemy_serializer.serializer import Serializer
+
+from instrumentation import add_serialization_time
+
+# Guard against serialize_rules that would recurse forever (to_dict() would hit
+# RecursionError on those too)
+MAX_DEPTH = 8
+
+_compiled = {}
+
+
+class CompiledSerializerMixin(SerializerMixin):
+    # Same signature and output as SerializerMixin.to_dict(); only calls that change
+    # the output formats fall back to the generic serializer. The time taken (lazy
+    # loads included) counts towards the request's serialization time
+    def to_dict(self, only=(), rules=(), **kwargs):
+        started_at = perf_counter()
+        if kwargs:
+            result = super().to_dict(only=only, rules=rules, **kwargs)
+        else:
+            result = get_serializer(type(self), only, rules)(self)
+        add_serialization_time(perf_counter() - started_at)
+        return result
+
+
+# Compiled serializer for a model, built on first use and cached
+def get_serializer(model, only=(), rules=()):
+    key = (model, tuple(only), tuple(rules))
+    serializer = _compiled.get(key)
+    if serializer is None:
+        serializer = _compiled[key] = compile_serializer(model, only, rules)
+    return serializer
+
+
+# Build the serializer function for a model
+def compile_serializer(model, only=(), rules=()):
+    # Resolve the rules with the same Schema that to_dict() uses, so the
+    # included keys are exactly the ones sqlalchemy_serializer would emit
+    schema = Schema()
+    schema.update(only=only, extend=rules)
+    namespace = {}
+    name = _compile_model(model, model, schema, namespace, depth=0)
+    return namespace[name]
+
+
+# Nested models are formatted with the root model's date formats, as in to_dict()
+def _compile_model(root, model, schema, namespace, depth):
+    if depth > MAX_DEPTH:
+        raise ValueError(f"serialize_rules of {model.__name__} nest deeper than {MAX_DEPTH} levels")
+
+    schema.update(only=model.serialize_only, extend=model.serialize_rules)
+    mapper = sql_inspect(model)
+
+    keys = schema.keys
+    if schema.is_greedy:
+        keys.update(attr.key for attr in mapper.attrs)
+    # Columns in mapper order first, then relationships, then anything else
+    attr_order = {attr.key: i for i, attr in enumerate(mapper.attrs)}
+    keys = sorted((k for k in keys if schema.is_included(k)), key=lambda k: (attr_order.get(k, len(attr_order)), k))
+
+    name = f"_serialize_{model.__name__.lower()}_{len(namespace)}"
+    namespace[name] = None  # Reserve the name before compiling nested models
+    fields = []
+    for key in keys:
+        attr = mapper.attrs.get(key)
+        if isinstance(attr, ColumnProperty):
+            fields.append(f"{key!r}: {name}_value(obj.{key})")
+        elif isinstance(attr, RelationshipProperty) and issubclass(attr.mapper.class_, SerializerMixin):
+            nested = _compile_model(root, attr.mapper.class_, schema.fork(key), namespace, depth + 1)
+            if attr.uselist:
+                fields.append(f"{key!r}: [{nested}(item) for item in obj.{key}]")
+            else:
+                fields.append(f"{key!r}: _nested({nested}, obj.{key})")
+        else:
+            # Properties and anything else: hand the value to the generic serializer
+            fallback = f"_fallback_{len(namespace)}"
+            namespace[fallback] = _generic(root, schema.fork(key))
+            fields.append(f"{key!r}: {fallback}(getattr(obj, {key!r}))")
+
+    source = f"def {name}(obj):\n    return {{{', '.join(fields)}}}\n"
+    namespace[f"{name}_value"] = _convert(root)
+    namespace["_nested"] = _nested
+    exec(source, namespace)
+    return name
+
+
+def _nested(serialize, value):
+    return None if value is None else serialize(value)
+
+
+# Column value converter matching sqlalchemy_serializer's default formats
+def _convert(model):
+    datetime_format = model.datetime_format
+    date_format = model.date_format
+    time_format = model.time_format
+
+    def value(v):
+        if v is None or isinstance(v, (int, str, float, bool)):
+            return v
+        if isinstance(v, datetime):
+            return v.strftime(datetime_format)
+        if isinstance(v, date):
+            return v.strftime(date_format)
+        if isinstance(v, time):
+            return v.strftime(time_format)
+        return Serializer(
+            date_format=date_format, datetime_format=datetime_format, time_format=time_format,
+            decimal_format=model.decimal_format, tzinfo=None, serialize_types=model.serialize_types
+        )(v)
+    return value
+
+
+def _generic(model, schema):
+    tree = schema._tree
+
+    def serialize(value):
+        serializer = Serializer(
+            date_format=model.date_format, datetime_format=model.datetime_format,
+            time_format=model.time_format, decimal_format=model.decimal_format,
+            tzinfo=None, serialize_types=model.serialize_types
+        )
+        serializer.schema = Schema(tree=copy.deepcopy(tree))
+        return serializer(value)
+    return serialize
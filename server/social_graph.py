@@ -0,0 +1,236 @@
+# In-memory friend graph for mutual friends and friend suggestions
+# Each worker holds every user's friend ids as a sorted array of 32-bit ints
+# (8 bytes per friendship plus ~150 per user: 23MB for a million friendships
+# between 100k users, see benchmarks/social_graph.py), loaded from the friendships
+# table in a background thread the first time it's needed. Model events apply
+# this worker's friendship changes once they're committed; changes made by other
+# workers show up when the graph is reloaded, every SOCIAL_GRAPH_MAX_AGE seconds.
+# Callers get None while the graph isn't loaded and should query the database.
+#
+# Config:
+#   SOCIAL_GRAPH_MAX_EDGES  friendships held in memory at most (default 5,000,000,
+#                           40MB plus the per-user overhead); above that the graph
+#                           is dropped and the database is queried instead
+#   SOCIAL_GRAPH_MAX_AGE    seconds before the graph is reloaded (default 300);
+#                           0 keeps the first load for good
+
+import heapq
+import logging
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from sqlalchemy import column, func, select, table
+
+logger = logging.getLogger(__name__)
+
+# Friends of friends counted per suggestion request at most, so a user with
+# thousands of well-connected friends can't make a request walk the whole graph
+MAX_SCANNED = 200_000
+
+# Seconds before a failed load is retried
+RETRY_AFTER = 60
+
+_friendships = table("friendships", column("user_id"), column("friend_id"))
+_EMPTY = array("i")
+
+
+class SocialGraph:
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self.max_edges = 5_000_000
+        self.max_age = 300
+        self._adjacency = None
+        self._edges = 0
+        self._next_load = 0
+        self._loading = False
+        # Changes committed while a load is running, replayed onto its result
+        self._pending = None
+        self._lock = threading.RLock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.max_edges = int(app.config.get("SOCIAL_GRAPH_MAX_EDGES", 5_000_000))
+        self.max_age = int(app.config.get("SOCIAL_GRAPH_MAX_AGE", 300))
+        app.extensions["social_graph"] = self
+
+    # Load the graph from the database now, replacing the current one
+    def load(self, connection=None):
+        with self._lock:
+            self._pending = []
+        try:
+            adjacency, edges = self._read(connection) if connection is not None else self._read_from_engine()
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._adjacency, self._edges = adjacency, edges
+            self._next_load = time.monotonic() + self.max_age if self.max_age else float("inf")
+            for change in pending:
+                change()
+            if self._adjacency is not None and self._edges > self.max_edges:
+                self._drop()
+
+    def _read_from_engine(self):
+        with self.app.app_context():
+            with self.db.engine.connect() as connection:
+                return self._read(connection)
+
+    # Rows come in (user_id, friend_id) order, so both ends of every friendship
+    # are appended in ascending order and the arrays need no sorting
+    def _read(self, connection):
+        edges = connection.execute(select(func.count()).select_from(_friendships)).scalar()
+        if edges > self.max_edges:
+            logger.warning("Friend graph not loaded: %d friendships > SOCIAL_GRAPH_MAX_EDGES (%d)",
+                           edges, self.max_edges)
+            return None, edges
+        adjacency = {}
+        rows = connection.execution_options(yield_per=10_000).execute(
+            select(_friendships.c.user_id, _friendships.c.friend_id)
+            .order_by(_friendships.c.user_id, _friendships.c.friend_id))
+        edges = 0
+        for user_id, friend_id in rows:
+            if user_id is None or friend_id is None:
+                continue
+            _friends(adjacency, user_id).append(friend_id)
+            _friends(adjacency, friend_id).append(user_id)
+            edges += 1
+        return adjacency, edges
+
+    # Start a background load if there's no graph yet or it's too old
+    def _refresh(self):
+        with self._lock:
+            if self._loading or time.monotonic() < self._next_load or self.app is None:
+                return
+            self._loading = True
+        threading.Thread(target=self._load_in_background, name="social-graph", daemon=True).start()
+
+    def _load_in_background(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Could not load the friend graph")
+            with self._lock:
+                self._next_load = time.monotonic() + RETRY_AFTER
+        finally:
+            with self._lock:
+                self._loading = False
+
+    # Start loading in the background now rather than on the first request, e.g.
+    # in each new server worker
+    def warm(self):
+        self._refresh()
+
+    # The adjacency dict, or None (and a load is started) when it isn't available
+    def _graph(self):
+        self._refresh()
+        return self._adjacency
+
+    def _drop(self):
+        logger.warning("Friend graph dropped: %d friendships > SOCIAL_GRAPH_MAX_EDGES (%d)",
+                       self._edges, self.max_edges)
+        self._adjacency = None
+
+    # Record a committed friendship (called by the Friendship model events)
+    def add(self, user_id, friend_id):
+        self._apply(self._add, user_id, friend_id)
+
+    def remove(self, user_id, friend_id):
+        self._apply(self._remove, user_id, friend_id)
+
+    def _apply(self, change, user_id, friend_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(lambda: change(user_id, friend_id))
+            if self._adjacency is not None:
+                change(user_id, friend_id)
+
+    def _add(self, user_id, friend_id):
+        if self._adjacency is None:
+            return
+        if _insert(_friends(self._adjacency, user_id), friend_id):
+            _insert(_friends(self._adjacency, friend_id), user_id)
+            self._edges += 1
+            if self._edges > self.max_edges:
+                self._drop()
+
+    def _remove(self, user_id, friend_id):
+        if self._adjacency is None:
+            return
+        if _delete(self._adjacency.get(user_id, _EMPTY), friend_id):
+            _delete(self._adjacency.get(friend_id, _EMPTY), user_id)
+            self._edges -= 1
+
+    # Sorted ids of the friends two users have in common, or None
+    def mutual_friends(self, user_id, other_id):
+        with self._lock:
+            adjacency = self._graph()
+            if adjacency is None:
+                return None
+            mine, theirs = adjacency.get(user_id, _EMPTY), adjacency.get(other_id, _EMPTY)
+            if len(mine) > len(theirs):
+                mine, theirs = theirs, mine
+            return sorted(set(mine).intersection(theirs))
+
+    # (id, mutual friend count) of up to limit friends of the user's friends who
+    # aren't their friends yet, most mutual friends first, or None
+    def friends_of_friends(self, user_id, limit):
+        with self._lock:
+            adjacency = self._graph()
+            if adjacency is None:
+                return None
+            friends = adjacency.get(user_id, _EMPTY)
+            counts = Counter()
+            scanned = 0
+            for friend_id in friends:
+                theirs = adjacency.get(friend_id, _EMPTY)
+                counts.update(theirs)
+                scanned += len(theirs)
+                if scanned >= MAX_SCANNED:
+                    break
+            counts.pop(user_id, None)
+            for friend_id in friends:
+                counts.pop(friend_id, None)
+        return heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1], item[0]))
+
+    # Size of the loaded graph, for logging and the benchmark
+    def stats(self):
+        with self._lock:
+            adjacency = self._adjacency
+            if adjacency is None:
+                return {"loaded": False, "users": 0, "edges": self._edges, "bytes": 0}
+            size = sys.getsizeof(adjacency) + sum(sys.getsizeof(friends) for friends in adjacency.values())
+            return {"loaded": True, "users": len(adjacency), "edges": self._edges, "bytes": size}
+
+
+def _friends(adjacency, user_id):
+    friends = adjacency.get(user_id)
+    if friends is None:
+        friends = adjacency[user_id] = array("i")
+    return friends
+
+
+# Insert into / delete from a sorted array; False when nothing changed
+def _insert(friends, friend_id):
+    index = bisect_left(friends, friend_id)
+    if index < len(friends) and friends[index] == friend_id:
+        return False
+    friends.insert(index, friend_id)
+    return True
+
+
+def _delete(friends, friend_id):
+    index = bisect_left(friends, friend_id)
+    if index == len(friends) or friends[index] != friend_id:
+        return False
+    del friends[index]
+    return True
@@ -0,0 +1,81 @@
+# Sighting activity over time for GET /sightings/stats
+# Counts come from the daily rollup (sighting_daily_counts, see models.py), so a
+# dashboard refresh sums a few rows per day instead of rescanning sightings. A
+# bbox needs exact coordinates, so those queries GROUP BY over the matching
+# sightings instead (found with the geohash index).
+
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import Date, cast, func, select
+
+from config import db
+from models import Sighting, SightingDailyCount
+
+INTERVALS = ("day", "week", "month")
+DIMENSIONS = ("species", "cell")
+
+
+# First day of the week (Monday) or month containing day, per dialect
+def _bucket(day, interval, dialect):
+    if interval == "day":
+        return day
+    if dialect == "sqlite":
+        return func.date(day, "weekday 0", "-6 days") if interval == "week" else func.date(day, "start of month")
+    if dialect == "postgresql":
+        return cast(func.date_trunc(interval, day), Date)
+    raise ValueError(f"{interval} stats aren't supported on {dialect}")
+
+
+# Sighting counts per interval (and per species and/or cell when listed in by)
+# start and end are inclusive dates, cell a geohash prefix of up to
+# SightingDailyCount.PRECISION characters, bbox (min_lat, min_lng, max_lat, max_lng)
+def activity_stats(interval="day", by=(), species_id=None, start=None, end=None, cell=None, bbox=None):
+    dialect = db.session.get_bind().dialect.name
+    filters = []
+    if bbox is None:
+        source = "rollup"
+        table = SightingDailyCount
+        day, species, cells, count = table.day, table.species_id, table.cell, func.sum(table.count)
+        if start is not None:
+            filters.append(table.day >= start)
+        if end is not None:
+            filters.append(table.day <= end)
+    else:
+        source = "sightings"
+        day = func.date(Sighting.observed_on)
+        species = Sighting.species_id
+        cells = func.substr(Sighting.geohash, 1, SightingDailyCount.PRECISION)
+        count = func.count()
+        filters += [Sighting.within(*bbox), Sighting.observed_on.isnot(None)]
+        if start is not None:
+            filters.append(Sighting.observed_on >= datetime.combine(start, time.min))
+        if end is not None:
+            filters.append(Sighting.observed_on < datetime.combine(end + timedelta(days=1), time.min))
+    if species_id is not None:
+        filters.append(species == species_id)
+    if cell:
+        column = SightingDailyCount.cell if bbox is None else Sighting.geohash
+        filters += [column >= cell, column < cell + "~"]
+
+    period = _bucket(day, interval, dialect).label("period")
+    dimensions = []
+    if "species" in by:
+        dimensions.append(species.label("species_id"))
+    if "cell" in by:
+        dimensions.append(cells.label("cell"))
+    query = (
+        select(period, *dimensions, count.label("count"))
+        .where(*filters)
+        .group_by(period, *dimensions)
+        .order_by(period, *dimensions)
+    )
+
+    buckets = []
+    for row in db.session.execute(query):
+        bucket = {"period": str(row.period)[:10], "count": int(row.count)}
+        if "species" in by:
+            bucket["species_id"] = row.species_id or None
+        if "cell" in by:
+            bucket["cell"] = row.cell or None
+        buckets.append(bucket)
+    return {"interval": interval, "source": source, "buckets": buckets}
@@ -0,0 +1,53 @@
+# Helpers for streaming large JSON responses instead of building them in memory
+
+from flask import Response, current_app, g, stream_with_context
+
+# Rows fetched from the database per round trip while streaming
+STREAM_BATCH_SIZE = 500
+
+
+# Yield a JSON array piece by piece, serializing one item at a time
+def iter_json_array(items, serialize):
+    dumps = current_app.json.dumps
+    yield "["
+    count = 0
+    for item in items:
+        if count:
+            yield ","
+        yield dumps(serialize(item))
+        count += 1
+    # Lets the query budget check account for one round of loads per batch
+    g.stream_batches = -(-count // STREAM_BATCH_SIZE)
+    yield "]"
+
+
+# Join small pieces of output into chunks of about chunk_size characters, so a
+# stream of short rows isn't sent as thousands of tiny writes
+def iter_chunks(pieces, chunk_size=64 * 1024):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+# Build a streamed response; the generator keeps the request context (and
+# database session) alive until the last row is sent
+def stream_response(pieces, mimetype, status=200, headers=None):
+    return Response(
+        stream_with_context(iter_chunks(pieces)),
+        status=status,
+        headers=headers,
+        mimetype=mimetype
+    )
+
+
+# Build a streamed JSON array response
+def stream_json_array(items, serialize, status=200, headers=None):
+    return stream_response(iter_json_array(items, serialize), "application/json", status, headers)
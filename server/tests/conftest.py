@@ -0,0 +1,68 @@
+# Test fixtures: one app from create_app() with a scratch SQLite database seeded
+# by seed.py's seed_synthetic, shared by the whole session. Under TESTING the
+# endpoints' query budgets are enforced (see instrumentation.py), so a request
+# that goes over its budget fails the test that made it.
+#
+#   cd server && python -m pytest -q
+
+import os
+import tempfile
+
+import pytest
+
+_scratch = tempfile.mkdtemp()
+# app.py builds its module-level app when imported, so keep that one off the
+# development database and the password pool too
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_scratch, "import.db")
+os.environ["PASSWORD_HASH_WORKERS"] = "0"
+
+from sqlalchemy import select  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, User, Sighting, Friendship  # noqa: E402
+from seed import seed_synthetic, PASSWORD  # noqa: E402
+
+USERS = 60
+SIGHTINGS = 600
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(_scratch, "test.db"),
+        "UPLOAD_FOLDER": os.path.join(_scratch, "uploads"),
+        "UPLOAD_VARIANT_WORKERS": 0,
+        # Above seed_synthetic's hash_rounds, so logins upgrade the seeded hashes
+        "BCRYPT_LOG_ROUNDS": 5,
+        "PASSWORD_HASH_WORKERS": 0,
+        "METRICS_LOG_SAMPLE_RATE": 0,
+    })
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(USERS, SIGHTINGS, friends=6, species=8, seed=1, hash_rounds=4, report=lambda line: None)
+    return app
+
+
+# Ids to request: the user with the most friends, one of their friends, a user
+# they're not friends with and one of their sightings
+@pytest.fixture(scope="session")
+def ids(app):
+    with app.app_context():
+        user_id, username = db.session.execute(
+            select(User.id, User.username).order_by(User.friend_count.desc(), User.id).limit(1)).one()
+        friend_ids = set(db.session.execute(Friendship.friend_ids(user_id)).scalars())
+        stranger_id = next(i for i in range(1, USERS + 1) if i != user_id and i not in friend_ids)
+        sighting_id = db.session.execute(select(Sighting.id).order_by(Sighting.id).limit(1)).scalar_one()
+        return {"user": user_id, "username": username, "friend": min(friend_ids),
+                "stranger": stranger_id, "sighting": sighting_id}
+
+
+# A test client (used outside any app context, so every request gets its own g
+# and statement count) logged in as ids["user"]
+@pytest.fixture
+def client(app, ids):
+    client = app.test_client()
+    response = client.post("/login", json={"username": ids["username"], "password": PASSWORD})
+    assert response.status_code == 200
+    return client
@@ -0,0 +1,61 @@
+# POST /sightings/bulk: rows are imported from a streamed body, and a body over
+# BULK_IMPORT_MAX_BYTES gets a 413 even when it's chunked (no Content-Length)
+
+import io
+import json
+
+from sqlalchemy import func, select
+
+from models import db, Sighting, Species
+
+
+def ndjson(app, count):
+    with app.app_context():
+        scientific_name = db.session.execute(select(Species.scientific_name).limit(1)).scalar_one()
+    rows = ({"observed_on": "2024-07-01T21:00:00", "latitude": 40.0, "longitude": -100.0,
+             "scientific_name": scientific_name, "description": f"bulk {i}"} for i in range(count))
+    return "".join(json.dumps(row) + "\n" for row in rows).encode()
+
+
+def bulk_count(app):
+    with app.app_context():
+        return db.session.execute(select(func.count()).where(Sighting.description.like("bulk %"))).scalar()
+
+
+def post_chunked(client, data):
+    return client.post("/sightings/bulk", input_stream=io.BytesIO(data), content_type="application/x-ndjson",
+                       headers={"Transfer-Encoding": "chunked"},
+                       environ_overrides={"wsgi.input_terminated": True})
+
+
+def test_bulk_import_chunked(app, client):
+    before = bulk_count(app)
+    response = post_chunked(client, ndjson(app, 20))
+    assert response.status_code == 201
+    assert response.get_json() == {"inserted": 20, "error_count": 0, "errors": []}
+    assert bulk_count(app) == before + 20
+
+
+def test_bulk_import_skips_rows_with_non_text_values(app, client):
+    good, bad = ndjson(app, 2).decode().splitlines()
+    rows = [good]
+    for key, value in (("description", {"a": 1}), ("place_guess", [1, 2]), ("photos", 3)):
+        row = json.loads(bad)
+        row[key] = value
+        rows.append(json.dumps(row))
+    before = bulk_count(app)
+    response = client.post("/sightings/bulk", data="\n".join(rows) + "\n", content_type="application/x-ndjson")
+    assert response.status_code == 201
+    assert response.get_json() == {"inserted": 1, "error_count": 3, "errors": [
+        {"line": 2, "error": "description must be a string"},
+        {"line": 3, "error": "place_guess must be a string"},
+        {"line": 4, "error": "photos must be a string"},
+    ]}
+    assert bulk_count(app) == before + 1
+
+
+def test_bulk_import_over_limit(app, client, monkeypatch):
+    data = ndjson(app, 20)
+    monkeypatch.setitem(app.config, "BULK_IMPORT_MAX_BYTES", len(data) - 1)
+    assert client.post("/sightings/bulk", data=data, content_type="application/x-ndjson").status_code == 413
+    assert post_chunked(client, data).status_code == 413
@@ -0,0 +1,25 @@
+# GET /species: served from the cache with a strong ETag, entries stored as bytes
+# with the catalog's timeout
+
+from config import cache
+from models import Species
+
+
+def test_species_catalog_cached(app, client, monkeypatch):
+    timeouts = []
+    set_entry = cache.set
+    monkeypatch.setattr(cache, "set", lambda key, value, timeout=None: (timeouts.append(timeout),
+                                                                        set_entry(key, value, timeout)))
+    cache.delete(Species.CATALOG_CACHE_KEY)
+
+    response = client.get("/species")
+    assert response.status_code == 200
+    assert timeouts == [Species.CATALOG_CACHE_TIMEOUT]
+    entry = cache.get(Species.CATALOG_CACHE_KEY)
+    assert isinstance(entry, bytes)
+    assert entry == response.headers["ETag"].strip('"').encode() + b" " + response.get_data()
+
+    cached = client.get("/species")
+    assert cached.get_data() == response.get_data()
+    assert timeouts == [Species.CATALOG_CACHE_TIMEOUT]
+    assert client.get("/species", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
@@ -0,0 +1,29 @@
+# SQLite pragmas are applied per app: one app's settings never reach the
+# connections of another app's engine
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+
+import database
+
+
+def make_app(path, pragmas):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}", SQLITE_PRAGMAS=pragmas)
+    return app
+
+
+def test_pragmas_per_app(tmp_path):
+    db = SQLAlchemy()
+    wal = make_app(tmp_path / "wal.db", {"journal_mode": "WAL", "busy_timeout": 5000})
+    delete = make_app(tmp_path / "delete.db", {"journal_mode": "DELETE", "busy_timeout": 1})
+    for app in (wal, delete):
+        db.init_app(app)
+        database.init_app(app, db)
+
+    for app, expected in ((wal, ("wal", 5000)), (delete, ("delete", 1))):
+        with app.app_context():
+            assert (db.session.execute(text("PRAGMA journal_mode")).scalar(),
+                    db.session.execute(text("PRAGMA busy_timeout")).scalar()) == expected
+            db.session.close()
@@ -0,0 +1,47 @@
+# POST /login: a busy or stalled password pool answers 503, not 500
+
+from concurrent.futures import Future
+
+from config import password_hasher
+from models import db, User
+from passwords import hash_cost
+from seed import PASSWORD
+
+
+class _StalledPool:
+    def submit(self, fn, *args):
+        return Future()
+
+
+def test_login(app, ids):
+    response = app.test_client().post("/login", json={"username": ids["username"], "password": PASSWORD})
+    assert response.status_code == 200
+    assert response.get_json()["id"] == ids["user"]
+
+
+# Seeding hashes the fixture password at its own cost without changing the app's
+def test_login_upgrades_seeded_hash(app, ids):
+    assert password_hasher.rounds == app.config["BCRYPT_LOG_ROUNDS"]
+    app.test_client().post("/login", json={"username": ids["username"], "password": PASSWORD})
+    with app.app_context():
+        assert hash_cost(db.session.get(User, ids["user"])._password_hash) == app.config["BCRYPT_LOG_ROUNDS"]
+
+
+def test_login_wrong_password(app, ids):
+    response = app.test_client().post("/login", json={"username": ids["username"], "password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_login_hash_timeout(app, ids, monkeypatch):
+    monkeypatch.setattr(password_hasher, "workers", 1)
+    monkeypatch.setattr(password_hasher, "timeout", 0.01)
+    monkeypatch.setattr(password_hasher, "_executor", lambda: _StalledPool())
+    response = app.test_client().post("/login", json={"username": ids["username"], "password": PASSWORD})
+    assert response.status_code == 503
+
+
+def test_login_pool_full(app, ids, monkeypatch):
+    monkeypatch.setattr(password_hasher, "workers", 1)
+    monkeypatch.setattr(password_hasher._slots, "acquire", lambda blocking=True: False)
+    response = app.test_client().post("/login", json={"username": ids["username"], "password": PASSWORD})
+    assert response.status_code == 503
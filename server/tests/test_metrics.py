@@ -0,0 +1,16 @@
+# Request metrics time JSON serialization without changing the JSON itself
+
+from metrics import TimedJSONProvider
+
+
+def test_timed_json_keeps_format(app):
+    assert isinstance(app.json, TimedJSONProvider)
+    with app.app_context():
+        assert app.json.response({"a": 1, "b": 2}).get_data(as_text=True) == '{\n  "a": 1,\n  "b": 2\n}\n'
+
+
+def test_metrics(client):
+    client.get("/species")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'route="/species"' in response.get_data(as_text=True)
@@ -0,0 +1,63 @@
+# Every endpoint with a query budget (see instrumentation.py), requested as a
+# logged-in user; with TESTING set a request over its budget raises
+# QueryBudgetExceeded, so these fail as soon as an endpoint's statement count
+# starts to grow with the rows it returns.
+
+import pytest
+
+from app import SightingsCount
+from instrumentation import QueryBudgetExceeded, query_budget
+
+
+def budgeted_paths(ids):
+    return [
+        "/check_session",
+        "/sightings",
+        "/sightings?limit=50",
+        "/sightings?limit=50&after_id={sighting}",
+        "/sightings?lat=40&lng=-100&radius=2000",
+        "/sightings?lat=40&lng=-100&radius=2000&limit=20",
+        "/sightings?fields=id,latitude,longitude",
+        "/sightings/export",
+        "/sightings/export?format=csv",
+        "/sightings/export?format=geojson&user_id={user}",
+        "/sightings/clusters?zoom=3",
+        "/sightings/clusters?zoom=8&bbox=-125,25,-65,50",
+        "/sightings/stats",
+        "/sightings/stats?interval=month&by=species,cell",
+        "/sightings/count",
+        "/sightings/count/{sighting}",
+        "/sightings/{sighting}",
+        "/friend-search?username=a",
+        "/friends",
+        "/friends/mutual/{friend}",
+        "/friends/mutual/{stranger}",
+        "/friends/suggestions",
+        "/feed",
+        "/feed?limit=5",
+        "/species",
+        "/profile/{user}",
+        "/profile/{stranger}",
+    ]
+
+
+def test_budgeted_endpoints(client, ids):
+    for path in budgeted_paths(ids):
+        response = client.get(path.format(**ids))
+        assert response.status_code == 200, path
+        # Streamed bodies run their queries as they're read
+        response.get_data()
+        response.close()
+
+
+def test_conditional_get_within_budget(client, ids):
+    for path in ("/check_session", f"/sightings/{ids['sighting']}", f"/profile/{ids['user']}", "/friends"):
+        etag = client.get(path).headers["ETag"]
+        assert client.get(path, headers={"If-None-Match": etag}).status_code == 304, path
+
+
+def test_over_budget_fails(client, monkeypatch):
+    # GET /sightings/count reads one column of the user row; allow it none
+    monkeypatch.setattr(SightingsCount, "get", query_budget(0)(SightingsCount.get.__wrapped__))
+    with pytest.raises(QueryBudgetExceeded, match=r"GET /sightings/count ran 1 SQL statements \(budget 0\)"):
+        client.get("/sightings/count")
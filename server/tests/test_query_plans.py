@@ -0,0 +1,96 @@
+# The queries behind each endpoint are served by an index
+# Runs the same ORM queries the endpoints use (eager loads included), captures
+# every SQL statement they emit and checks its EXPLAIN QUERY PLAN for full table
+# scans and sorts on the large tables. SQLite only.
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from models import db, User, Sighting, Friendship, refresh_user_counters
+from search import search_users
+from export import export_query
+
+# Tables that grow with usage; a scan on one of these is a problem
+LARGE_TABLES = ("sightings", "friendships", "users")
+
+
+# (label, function running the query for a user and a friend of theirs, what the
+# plan may do besides index searches: "scan" when reading the whole table is
+# expected, "sort" when sorting the few rows an index search found is fine)
+QUERY_SHAPES = [
+    ("GET /sightings", lambda user_id, friend_id: Sighting.query.options(*Sighting.serialize_options())
+        .order_by(*Sighting.stable_order()).limit(1000).all(), "scan"),
+    ("GET /sightings?limit&after_id", lambda user_id, friend_id: Sighting.query.options(*Sighting.serialize_options())
+        .filter(Sighting.after(datetime(2023, 6, 1), 10)).order_by(*Sighting.stable_order()).limit(50).all(), None),
+    ("GET /sightings?lat&lng&radius", lambda user_id, friend_id: Sighting.query.options(*Sighting.serialize_options())
+        .filter(Sighting.near(28.0, -82.4, 10)).order_by(*Sighting.stable_order()).all(), "sort"),
+    ("GET /sightings/<id>", lambda user_id, friend_id: db.session.get(Sighting, 1,
+                                                                      options=Sighting.serialize_options()), None),
+    ("GET /profile/<id>", lambda user_id, friend_id: db.session.get(User, user_id,
+                                                                    options=User.serialize_options()), None),
+    ("POST /login", lambda user_id, friend_id: User.query.filter_by(username="someone").first(), None),
+    ("GET /sightings/count", lambda user_id, friend_id: db.session.query(User.sighting_count)
+        .filter(User.id == user_id).scalar(), None),
+    ("GET /friends", lambda user_id, friend_id: User.query.options(*User.serialize_options())
+        .filter(User.id.in_(Friendship.friend_ids(user_id))).all(), None),
+    ("POST /add-friend, DELETE /friends/<id>", lambda user_id, friend_id: Friendship.query.filter(
+        Friendship.between(user_id, friend_id)).all(), None),
+    ("mutual friends", lambda user_id, friend_id: db.session.execute(
+        Friendship.mutual_friend_ids(user_id, friend_id)).all(), None),
+    ("friends of friends", lambda user_id, friend_id: db.session.execute(
+        Friendship.friends_of_friends(user_id)).all(), "sort"),
+    ("GET /sightings/export?user_id", lambda user_id, friend_id: db.session.execute(
+        export_query(user_id=user_id)).all(), None),
+    ("GET /friend-search", lambda user_id, friend_id: search_users("firefly", exclude_user_id=user_id), "sort"),
+    ("sighting/friendship counter events", lambda user_id, friend_id: refresh_user_counters(
+        db.session.connection(), [user_id]), None),
+]
+
+
+# Problems in a query plan: scans of large tables (even in index order) and
+# temporary sort trees, unless the shape allows them
+def plan_problems(plan, allowed):
+    problems = []
+    for detail in plan:
+        words = detail.split()
+        if words[:1] == ["SCAN"] and words[1] in LARGE_TABLES and allowed != "scan":
+            problems.append(detail)
+        if "TEMP B-TREE" in detail and allowed != "sort":
+            problems.append(detail)
+    return problems
+
+
+# (statement, plan details) for each statement run inside the block
+@pytest.fixture
+def captured_plans(app):
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != "sqlite":
+            pytest.skip(f"query plans are only checked on SQLite (database is {engine.dialect.name})")
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                plan = cursor.connection.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+                captured.append((statement, [row[-1] for row in plan]))
+
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            yield captured
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+            # Nothing the queries changed (counter refreshes) is kept
+            db.session.rollback()
+
+
+@pytest.mark.parametrize("label, run, allowed", QUERY_SHAPES, ids=[shape[0] for shape in QUERY_SHAPES])
+def test_query_uses_index(captured_plans, ids, label, run, allowed):
+    run(ids["user"], ids["friend"])
+    assert captured_plans, f"{label} ran no statements"
+    for statement, plan in captured_plans:
+        assert not plan_problems(plan, allowed), f"{' '.join(statement.split())}\n" + "\n".join(plan)
+        if allowed != "scan":
+            assert any(detail.startswith("SEARCH") for detail in plan), \
+                f"no index search in {' '.join(statement.split())}\n" + "\n".join(plan)
@@ -0,0 +1,17 @@
+# Sightings serialize their user's friendships as bare rows, which is all
+# Sighting.serialize_options() loads
+
+from sqlalchemy import inspect
+
+from models import db, Sighting
+
+
+def test_sighting_user_friendships(app, client, ids):
+    sighting = client.get(f"/sightings/{ids['sighting']}").get_json()
+    for friendship in sighting["user"]["friendships"] + sighting["user"]["friend_of"]:
+        assert set(friendship) == {"id", "user_id", "friend_id"}
+
+    with app.app_context():
+        sighting = db.session.get(Sighting, ids["sighting"], options=Sighting.serialize_options())
+        for friendship in sighting.user.friendships:
+            assert "friend" in inspect(friendship).unloaded
@@ -0,0 +1,48 @@
+# POST /uploads: stored files are readable by a front proxy, and a body over
+# MAX_CONTENT_LENGTH gets a 413 even when it's chunked (no Content-Length)
+
+import io
+import os
+import stat
+
+from PIL import Image
+
+from config import uploads
+from uploads import FILE_MODE, UPLOAD_URL_PREFIX, VARIANTS, variant_name
+
+
+def png(size=(300, 200), noise=False):
+    image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3)) if noise else Image.new("RGB", size)
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+# A body sent with Transfer-Encoding: chunked, as the WSGI server hands it on
+def post_chunked(client, data):
+    return client.post("/uploads", input_stream=io.BytesIO(data), content_type="image/png",
+                       headers={"Transfer-Encoding": "chunked"},
+                       environ_overrides={"wsgi.input_terminated": True})
+
+
+def test_upload_file_modes(client):
+    response = client.post("/uploads", data=png(), content_type="image/png")
+    assert response.status_code == 201
+    filename = response.get_json()["url"][len(UPLOAD_URL_PREFIX):]
+    for name in [filename] + [variant_name(filename, variant) for variant in VARIANTS]:
+        assert stat.S_IMODE(os.stat(os.path.join(uploads.folder, name)).st_mode) == FILE_MODE, name
+
+
+def test_chunked_upload_within_limit(client):
+    response = post_chunked(client, png())
+    assert response.status_code == 201
+
+
+def test_chunked_upload_over_limit(client, monkeypatch):
+    data = png(noise=True)
+    monkeypatch.setattr(uploads, "max_bytes", len(data) - 1)
+    before = set(os.listdir(uploads.folder))
+    response = post_chunked(client, data)
+    assert response.status_code == 413
+    # The partial file is removed
+    assert set(os.listdir(uploads.folder)) == before
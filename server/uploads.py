@@ -0,0 +1,264 @@
+# Image uploads (profile pictures and sighting photos)
+# Uploads are copied to disk in chunks, so a large photo never sits in memory,
+# written to a temp file in the upload folder and renamed into place once
+# complete. Smaller variants for list and map views are generated afterwards in
+# a background thread pool; until a variant exists its URL serves the original.
+#
+# Config:
+#   UPLOAD_FOLDER            where uploads are stored (default static/uploads)
+#   MAX_CONTENT_LENGTH       largest request body accepted, larger ones get a 413;
+#                            also the largest image save() copies, since a chunked
+#                            body has no Content-Length to check up front
+#   UPLOAD_VARIANT_WORKERS   threads generating variants; 0 generates them inline
+#                            (default 2). Variants need Pillow; without it every
+#                            variant URL serves the original image
+#   UPLOAD_SENDFILE          unset: files are sent by the Python worker
+#                            "x-sendfile": X-Sendfile header for Apache/lighttpd
+#                            "x-accel-redirect": X-Accel-Redirect header for nginx,
+#                            pointing at UPLOAD_ACCEL_PREFIX (default /protected-uploads/),
+#                            an internal location aliased to the upload folder
+#
+# Stored files are named after a hash of their content, so a URL always refers
+# to the same bytes and browsers may cache it for good.
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Response, send_from_directory
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge
+from werkzeug.utils import safe_join
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_URL_PREFIX = "/static/uploads/"
+CHUNK_SIZE = 64 * 1024
+
+# mkstemp creates files only their owner can read; stored files get the mode a
+# plain open() would give them, so a front proxy sending them (UPLOAD_SENDFILE)
+# can read them too. The umask can only be read by setting it, so once, at import
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o644 & ~_UMASK
+
+# Variant name -> longest side in pixels
+VARIANTS = {"thumb": 128, "medium": 640}
+
+# Content-addressed names ("<hash>.jpg", "<hash>.thumb.jpg") never change content
+IMMUTABLE_NAME = re.compile(r"^[0-9a-f]{32}(\.(thumb|medium))?\.(png|jpg|gif)$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Accepted image types, recognised by their first bytes rather than the
+# client-supplied filename or content type
+SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+
+class UploadError(ValueError):
+    pass
+
+
+def sniff_extension(head):
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+# "abc.jpg" -> "abc.thumb.jpg"
+def variant_name(filename, variant):
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}.{variant}{extension}"
+
+
+# "abc.thumb.jpg" -> "abc.jpg"; None when the name isn't a variant
+def original_name(filename):
+    stem, extension = os.path.splitext(filename)
+    stem, dot, variant = stem.rpartition(".")
+    return f"{stem}{extension}" if dot and variant in VARIANTS else None
+
+
+# URLs of every variant of an uploaded image, keyed by variant name
+# Images stored elsewhere (e.g. a pasted photo URL) have no variants, so every
+# key points at the image itself
+def variant_urls(url):
+    if not url:
+        return None
+    urls = {"original": url}
+    for variant in VARIANTS:
+        urls[variant] = variant_name(url, variant) if url.startswith(UPLOAD_URL_PREFIX) else url
+    return urls
+
+
+class Uploads:
+    def __init__(self, app=None):
+        self.folder = None
+        self.max_bytes = None
+        self.workers = 2
+        self.sendfile = None
+        self.accel_prefix = "/protected-uploads/"
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = app.config.setdefault(
+            "UPLOAD_FOLDER", os.path.join(app.root_path, "static", "uploads"))
+        self.max_bytes = app.config.get("MAX_CONTENT_LENGTH")
+        self.workers = int(app.config.get("UPLOAD_VARIANT_WORKERS", 2))
+        self.sendfile = app.config.get("UPLOAD_SENDFILE") or None
+        self.accel_prefix = app.config.get("UPLOAD_ACCEL_PREFIX", "/protected-uploads/")
+        if self.sendfile not in (None, "x-sendfile", "x-accel-redirect"):
+            raise ValueError(f"Unknown UPLOAD_SENDFILE mode {self.sendfile!r}")
+        if self.sendfile == "x-sendfile":
+            app.config["USE_X_SENDFILE"] = True
+        os.makedirs(self.folder, exist_ok=True)
+        app.extensions["uploads"] = self
+
+    # Store an uploaded image from a file-like object and return its URL
+    # Raises UploadError when the data isn't a supported image, and
+    # RequestEntityTooLarge (413) once more than MAX_CONTENT_LENGTH bytes are read
+    def save(self, stream):
+        digest = hashlib.sha256()
+        size = 0
+
+        def read():
+            nonlocal size
+            chunk = stream.read(CHUNK_SIZE)
+            size += len(chunk)
+            if self.max_bytes is not None and size > self.max_bytes:
+                raise RequestEntityTooLarge()
+            return chunk
+
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                head = read()
+                extension = sniff_extension(head)
+                if extension is None:
+                    raise UploadError("Only PNG, JPEG and GIF images can be uploaded")
+                for chunk in iter(read, b""):
+                    out.write(head)
+                    digest.update(head)
+                    head = chunk
+                out.write(head)
+                digest.update(head)
+            filename = digest.hexdigest()[:32] + extension
+            path = os.path.join(self.folder, filename)
+            # The same image uploaded twice is stored (and resized) once
+            if os.path.exists(path):
+                os.remove(temp_path)
+                return UPLOAD_URL_PREFIX + filename
+            os.chmod(temp_path, FILE_MODE)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self._submit(self.make_variants, filename)
+        return UPLOAD_URL_PREFIX + filename
+
+    # Response for GET /static/uploads/<filename>
+    # Content-addressed files are cached for a year; older uploads (named after the
+    # user) can be replaced, so they are revalidated with their ETag on each use.
+    # Conditional requests get a 304 and Range requests a 206, from send_file or
+    # from the proxy in sendfile mode
+    def send(self, filename):
+        if self._exists(filename):
+            return self._send(filename, immutable=bool(IMMUTABLE_NAME.match(filename)))
+        # Variants are written in the background; serve the original until then,
+        # without letting it be cached under the variant's URL
+        original = original_name(filename)
+        if original is None or not self._exists(original):
+            raise NotFound()
+        return self._send(original, immutable=False)
+
+    def _exists(self, filename):
+        path = safe_join(self.folder, filename)
+        return path is not None and os.path.isfile(path)
+
+    def _send(self, filename, immutable):
+        max_age = IMMUTABLE_MAX_AGE if immutable else 0
+        if self.sendfile == "x-accel-redirect":
+            response = Response()
+            response.headers["X-Accel-Redirect"] = self.accel_prefix + filename
+            # nginx sets the content type from the file's extension
+            del response.headers["Content-Type"]
+            response.cache_control.max_age = max_age
+        else:
+            # The hash in an immutable name is a ready-made strong ETag
+            etag = os.path.splitext(filename)[0] if immutable else True
+            response = send_from_directory(self.folder, filename, etag=etag, max_age=max_age)
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+    # Write the resized variants of an uploaded image (skipped without Pillow,
+    # which is imported here so that worker startup doesn't pay for it)
+    def make_variants(self, filename):
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            return
+        path = os.path.join(self.folder, filename)
+        try:
+            with Image.open(path) as original:
+                image_format = original.format
+                image = ImageOps.exif_transpose(original)
+                if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                for variant, size in VARIANTS.items():
+                    resized = image.copy()
+                    resized.thumbnail((size, size))
+                    self._write_image(resized, image_format, variant_name(filename, variant))
+        except Exception:
+            logger.exception("Could not generate variants for %s", filename)
+
+    def _write_image(self, image, image_format, filename):
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                options = {"quality": 85, "optimize": True} if image_format == "JPEG" else {}
+                image.save(out, format=image_format, **options)
+            os.chmod(temp_path, FILE_MODE)
+            os.replace(temp_path, os.path.join(self.folder, filename))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _submit(self, fn, *args):
+        if self.workers <= 0:
+            fn(*args)
+        else:
+            self._executor().submit(fn, *args)
+
+    # Created lazily, and again in each forked server worker
+    def _executor(self):
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._lock:
+                if self._pool is None or self._pool_pid != pid:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="uploads")
+                    self._pool_pid = pid
+        return self._pool
+
+    # Wait for queued variants to be written
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=True)
+        self._pool = None
@@ -0,0 +1,5 @@
+# WSGI entry point for production servers, e.g.
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# (python app.py runs the development server instead)
+
+from app import app  # noqa: F401